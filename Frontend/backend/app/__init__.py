@@ -41,4 +41,11 @@ def create_app(config_name=None):
         """Health check endpoint"""
         return {'status': 'ok'}
     
+    @app.route('/health/imagery')
+    def imagery_health():
+        """Connection pool, timeout, circuit breaker and deduplication metrics of imagery fetches"""
+        from .services.http_client import imagery_client
+        from .services.geospatial import imagery_flights
+        return {**imagery_client.metrics(), 'single_flight': imagery_flights.metrics()}
+    
     return app
\ No newline at end of file
@@ -1,15 +1,44 @@
 """
 Analysis API endpoints
 """
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, send_file, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
+import io
+import asyncio
 from datetime import datetime
 from ..database import db
 from ..models.analysis import Analysis, AnalysisImage
 from ..models.analysis_settings import AnalysisSettings
-from ..utils.validators import require_json, validate_analysis_input, validate_coordinates
+from ..utils.validators import require_json, validate_analysis_input, validate_coordinates, parse_bool, parse_bbox
+from ..services.rendering import get_rendered_image, LAYERS, RENDER_DEFAULT_SIZE, RENDER_MAX_SIZE
+from ..services.image_processing import load_image_details, load_image_index
+from ..services.detections import FEATURE_TYPES
+from ..services.spatial_index import select_detections, filter_features
+from ..services.vector_tiles import get_tile, MAX_TILE_ZOOM
+from ..services.simplification import zoom_tolerance
+from ..services.topojson import encode_topology, TOPOJSON_QUANTIZATION
+from ..services.object_detection import iter_geojson_features, stream_geojson, stream_ndjson
+from ..services.georeference import resolve_georeference
+from ..services.timeseries import (
+    get_timeseries, update_image_stats, rebuild_analysis_stats, unaggregated_analyses, PERIODS
+)
+from ..services.registration import get_registration, get_aligned_image, ALIGNED_DEFAULT_SIZE, ALIGNED_MAX_SIZE
+from ..services.proximity import (
+    find_nearby, grid_cell, index_analyses, NEARBY_MAX_RADIUS_KM, DUPLICATE_SITE_RADIUS_KM
+)
 from . import analysis_bp
+
+# Output formats of the GeoJSON endpoint
+GEOJSON_FORMATS = ('geojson', 'ndjson', 'topojson')
+# Largest number of decimal places accepted by the precision parameter
+MAX_COORDINATE_PRECISION = 10
+# Object class of each feature type accepted by the types filter
+FEATURE_KEYS = {feature_type: key for key, feature_type in FEATURE_TYPES.items()}
+# Default and largest number of analyses returned by the nearby endpoint
+NEARBY_DEFAULT_LIMIT = 100
+NEARBY_MAX_LIMIT = 1000
+
 @analysis_bp.route('', methods=['POST'])
 @jwt_required()
 @require_json
@@ -17,6 +46,9 @@ def create_analysis():
     """
     Create a new analysis
     
+    A site within DUPLICATE_SITE_RADIUS_KM of one of the user's analyses is
+    refused with 409 and the existing analyses, unless allow_duplicate is true.
+    
     Returns:
         JSON: Created analysis data
     """
@@ -30,6 +62,24 @@ def create_analysis():
     if not is_valid:
         return jsonify({'error': error_message}), 400
     
+    latitude, longitude = float(data['latitude']), float(data['longitude'])
+    if data.get('allow_duplicate') is not True:
+        try:
+            if index_analyses(db.session):
+                db.session.commit()
+            duplicates = find_nearby(db.session, latitude, longitude, DUPLICATE_SITE_RADIUS_KM, user_id=user_id)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Failed to check for duplicate sites: {str(e)}'}), 500
+        if duplicates:
+            return jsonify({
+                'error': 'An analysis of this site already exists',
+                'duplicates': [
+                    {**analysis.to_dict(include_images=False), 'distance_km': distance}
+                    for analysis, distance in duplicates
+                ]
+            }), 409
+    
     # Create analysis object
     analysis = Analysis(
         user_id=user_id,
@@ -37,6 +87,7 @@ def create_analysis():
         latitude=data['latitude'],
         longitude=data['longitude'],
     )
+    analysis.geo_cell = grid_cell(latitude, longitude)
     
     try:
         # Save the analysis to get its ID
@@ -127,6 +178,59 @@ def get_analyses():
         'per_page': per_page
     }), 200
 
+@analysis_bp.route('/nearby', methods=['GET'])
+@jwt_required()
+def get_nearby_analyses():
+    """
+    Get the analyses within a distance of a location, nearest first
+    
+    Sites are looked up through the proximity grid index, so the cost
+    depends on the analyses near the location rather than on all of them.
+    Query parameters: lat, lon, radius_km (up to NEARBY_MAX_RADIUS_KM) and limit.
+    
+    Returns:
+        JSON: Nearby analyses with their distance in kilometres
+    """
+    identity = get_jwt_identity()
+    user_id = identity.get('id')
+    is_admin = identity.get('is_admin', False)
+    
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    if latitude is None or longitude is None or not validate_coordinates(latitude, longitude):
+        return jsonify({'error': 'lat and lon must be valid coordinates'}), 400
+    
+    radius_km = request.args.get('radius_km', 10.0, type=float)
+    if radius_km is None or not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+        return jsonify({'error': f'radius_km must be between 0 and {NEARBY_MAX_RADIUS_KM:g}'}), 400
+    
+    limit = request.args.get('limit', NEARBY_DEFAULT_LIMIT, type=int)
+    if limit is None or not 0 < limit <= NEARBY_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {NEARBY_MAX_LIMIT}'}), 400
+    
+    try:
+        # Analyses created before the grid existed are indexed on first use
+        if index_analyses(db.session):
+            db.session.commit()
+        nearby = find_nearby(
+            db.session, latitude, longitude, radius_km,
+            user_id=None if is_admin else user_id,
+            limit=limit
+        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to find nearby analyses: {str(e)}'}), 500
+    
+    return jsonify({
+        'latitude': latitude,
+        'longitude': longitude,
+        'radius_km': radius_km,
+        'analyses': [
+            {**analysis.to_dict(include_images=False), 'distance_km': distance}
+            for analysis, distance in nearby
+        ]
+    }), 200
+
 @analysis_bp.route('/<int:analysis_id>', methods=['GET'])
 @jwt_required()
 def get_analysis(analysis_id):
@@ -287,18 +391,339 @@ def get_analysis_image(analysis_id, image_id):
     
     return jsonify({'image': image.to_dict()}), 200
 
+@analysis_bp.route('/timeseries', methods=['GET'])
+@analysis_bp.route('/<int:analysis_id>/timeseries', methods=['GET'])
+@jwt_required()
+def get_analysis_timeseries(analysis_id=None):
+    """
+    Get detection counts over time for one or more analyses
+    
+    Points are read from per-period aggregates maintained as images complete,
+    so the cost does not depend on how many images an analysis has.
+    Query parameters: ids (comma-separated analysis IDs, added to the one in
+    the path), period (day, week or month), start and end (YYYY-MM-DD).
+    
+    Args:
+        analysis_id (int): Analysis ID
+        
+    Returns:
+        JSON: Time series per analysis
+    """
+    identity = get_jwt_identity()
+    user_id = identity.get('id')
+    is_admin = identity.get('is_admin', False)
+    
+    try:
+        analysis_ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids must be comma-separated integers'}), 400
+    if analysis_id is not None:
+        analysis_ids.insert(0, analysis_id)
+    analysis_ids = list(dict.fromkeys(analysis_ids))
+    if not analysis_ids:
+        return jsonify({'error': 'No analysis IDs given'}), 400
+    
+    period = request.args.get('period', 'day')
+    if period not in PERIODS:
+        return jsonify({'error': f'period must be one of {", ".join(PERIODS)}'}), 400
+    
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    analyses = Analysis.query.filter(Analysis.id.in_(analysis_ids)).all()
+    if len(analyses) != len(analysis_ids):
+        return jsonify({'error': 'Analysis not found'}), 404
+    
+    # Check permission (user's own analyses or admin)
+    if not is_admin and any(analysis.user_id != user_id for analysis in analyses):
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    try:
+        # Analyses whose images completed before the aggregates existed get
+        # them built on first request
+        missing = unaggregated_analyses(db.session, analysis_ids)
+        if missing:
+            for key in missing:
+                rebuild_analysis_stats(db.session, key)
+            db.session.commit()
+        series = get_timeseries(db.session, analysis_ids, period, start, end)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to get time series: {str(e)}'}), 500
+    
+    return jsonify({
+        'period': period,
+        'series': [{'analysis_id': key, 'points': series[key]} for key in analysis_ids]
+    }), 200
+
+@analysis_bp.route('/<int:analysis_id>/images/<int:image_id>/render', methods=['GET'])
+@jwt_required()
+def render_analysis_image(analysis_id, image_id):
+    """
+    Render the detection results of an image as an annotated JPEG
+    
+    The image is drawn on first request and served from the render cache
+    afterwards. Query parameters: size (largest edge in pixels) and the
+    show_runways, show_aircraft, show_houses, show_roads and
+    show_water_bodies layer toggles.
+    
+    Args:
+        analysis_id (int): Analysis ID
+        image_id (int): Image ID
+        
+    Returns:
+        File: Annotated JPEG image
+    """
+    identity = get_jwt_identity()
+    user_id = identity.get('id')
+    is_admin = identity.get('is_admin', False)
+    
+    analysis = Analysis.query.get(analysis_id)
+    if not analysis:
+        return jsonify({'error': 'Analysis not found'}), 404
+    
+    # Check permission (user's own analysis or admin)
+    if analysis.user_id != user_id and not is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    image = AnalysisImage.query.filter_by(id=image_id, analysis_id=analysis_id).first()
+    if not image:
+        return jsonify({'error': 'Image not found for this analysis'}), 404
+    
+    details = load_image_details(image)
+    if details is None or not image.image_path or not os.path.exists(image.image_path):
+        return jsonify({'error': 'Image has not been processed yet'}), 400
+    
+    size = request.args.get('size', RENDER_DEFAULT_SIZE, type=int)
+    if size < 1 or size > RENDER_MAX_SIZE:
+        return jsonify({'error': f'size must be between 1 and {RENDER_MAX_SIZE}'}), 400
+    
+    layers = {name: parse_bool(request.args.get(name), True) for name in LAYERS}
+    
+    try:
+        data = asyncio.run(get_rendered_image(image.image_path, details, size, layers))
+    except Exception as e:
+        return jsonify({'error': f'Failed to render image: {str(e)}'}), 500
+    
+    if data is None:
+        return jsonify({'error': 'Failed to render image'}), 500
+    
+    return send_file(io.BytesIO(data), mimetype='image/jpeg')
+
+def _load_image_pair(analysis_id, before_id, after_id):
+    """
+    Look up two images of an analysis for an aligned comparison
+    
+    Args:
+        analysis_id (int): Analysis ID
+        before_id (int): ID of the reference image
+        after_id (int): ID of the image aligned onto it
+        
+    Returns:
+        tuple: (before image, after image, None) or (None, None, error response)
+    """
+    identity = get_jwt_identity()
+    user_id = identity.get('id')
+    is_admin = identity.get('is_admin', False)
+    
+    analysis = Analysis.query.get(analysis_id)
+    if not analysis:
+        return None, None, (jsonify({'error': 'Analysis not found'}), 404)
+    
+    # Check permission (user's own analysis or admin)
+    if analysis.user_id != user_id and not is_admin:
+        return None, None, (jsonify({'error': 'Permission denied'}), 403)
+    
+    before = AnalysisImage.query.filter_by(id=before_id, analysis_id=analysis_id).first()
+    after = AnalysisImage.query.filter_by(id=after_id, analysis_id=analysis_id).first()
+    if not before or not after:
+        return None, None, (jsonify({'error': 'Image not found for this analysis'}), 404)
+    
+    for image in (before, after):
+        if not image.image_path or not os.path.exists(image.image_path):
+            return None, None, (jsonify({'error': 'Image file not found'}), 404)
+    
+    return before, after, None
+
+@analysis_bp.route('/<int:analysis_id>/compare/<int:before_id>/<int:after_id>', methods=['GET'])
+@jwt_required()
+def get_image_registration(analysis_id, before_id, after_id):
+    """
+    Get the transform aligning one image of an analysis onto another
+    
+    The registration is estimated once per image pair and cached.
+    
+    Args:
+        analysis_id (int): Analysis ID
+        before_id (int): ID of the reference image
+        after_id (int): ID of the image aligned onto it
+        
+    Returns:
+        JSON: Homography from after to before pixels, its score and method
+    """
+    before, after, error = _load_image_pair(analysis_id, before_id, after_id)
+    if error:
+        return error
+    
+    try:
+        registration = get_registration(before.image_path, after.image_path, pair=(before.id, after.id))
+    except Exception as e:
+        return jsonify({'error': f'Failed to register images: {str(e)}'}), 500
+    
+    if registration is None:
+        return jsonify({'error': 'Failed to read images'}), 500
+    
+    return jsonify({
+        'before_image_id': before.id,
+        'after_image_id': after.id,
+        'registration': registration.to_dict()
+    }), 200
+
+@analysis_bp.route('/<int:analysis_id>/compare/<int:before_id>/<int:after_id>/<side>.jpg', methods=['GET'])
+@jwt_required()
+def get_aligned_analysis_image(analysis_id, before_id, after_id, side):
+    """
+    Get one side of an image pair aligned for side-by-side comparison
+    
+    Both images are resampled onto the before image's grid, so the two
+    JPEGs have the same size and matching pixels show the same ground.
+    Query parameter: size (largest edge in pixels).
+    
+    Args:
+        analysis_id (int): Analysis ID
+        before_id (int): ID of the reference image
+        after_id (int): ID of the image aligned onto it
+        side (str): "before" or "after"
+        
+    Returns:
+        File: JPEG image
+    """
+    if side not in ('before', 'after'):
+        return jsonify({'error': 'side must be before or after'}), 400
+    
+    size = request.args.get('size', ALIGNED_DEFAULT_SIZE, type=int)
+    if size < 1 or size > ALIGNED_MAX_SIZE:
+        return jsonify({'error': f'size must be between 1 and {ALIGNED_MAX_SIZE}'}), 400
+    
+    before, after, error = _load_image_pair(analysis_id, before_id, after_id)
+    if error:
+        return error
+    
+    try:
+        data = get_aligned_image(before.image_path, after.image_path, side, size, pair=(before.id, after.id))
+    except Exception as e:
+        return jsonify({'error': f'Failed to align images: {str(e)}'}), 500
+    
+    if data is None:
+        return jsonify({'error': 'Failed to align images'}), 500
+    
+    return send_file(io.BytesIO(data), mimetype='image/jpeg')
+
+@analysis_bp.route('/<int:analysis_id>/tiles/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+@jwt_required()
+def get_analysis_tile(analysis_id, z, x, y):
+    """
+    Get the detected features of an analysis as a Mapbox Vector Tile
+    
+    Features of the latest processed image are clipped to the XYZ tile and
+    encoded in one layer per feature type. Tiles are cached on disk until
+    the image is re-processed.
+    
+    Args:
+        analysis_id (int): Analysis ID
+        z (int): Zoom level
+        x (int): Tile column
+        y (int): Tile row
+        
+    Returns:
+        Binary: Vector tile
+    """
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': 'Tile coordinates out of range'}), 400
+    
+    identity = get_jwt_identity()
+    user_id = identity.get('id')
+    is_admin = identity.get('is_admin', False)
+    
+    analysis = Analysis.query.get(analysis_id)
+    if not analysis:
+        return jsonify({'error': 'Analysis not found'}), 404
+    
+    # Check permission (user's own analysis or admin)
+    if analysis.user_id != user_id and not is_admin:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    image = AnalysisImage.query.filter(
+        AnalysisImage.analysis_id == analysis_id,
+        AnalysisImage.details_path.isnot(None)
+    ).order_by(AnalysisImage.image_date.desc()).first()
+    details = load_image_details(image) if image else None
+    if details is None:
+        return jsonify({'error': 'Analysis has no processed images'}), 404
+    
+    georef = resolve_georeference(image.image_path, analysis.latitude, analysis.longitude)
+    if georef is None:
+        return jsonify({'error': 'Image is not georeferenced'}), 400
+    
+    try:
+        data = get_tile(image.details_path, details, load_image_index(image, details), georef, z, x, y)
+    except Exception as e:
+        return jsonify({'error': f'Failed to encode tile: {str(e)}'}), 500
+    
+    return Response(data, mimetype='application/vnd.mapbox-vector-tile')
+
 @analysis_bp.route('/<int:analysis_id>/geojson', methods=['GET'])
 @jwt_required()
 def get_analysis_geojson(analysis_id):
     """
     Get GeoJSON data for a specific analysis
     
+    Query parameters: stream=true sends the FeatureCollection as a chunked
+    response, written feature by feature; format=ndjson streams one Feature
+    per line instead. Features of processed images can be filtered with
+    bbox=min_lon,min_lat,max_lon,max_lat (pixel coordinates for images
+    without georeferencing), types=runway,house,... and min_confidence.
+    
+    Outlines are simplified for a map zoom level with zoom=, or with an
+    explicit tolerance= in image pixels; precision= sets the decimal places
+    of coordinates. format=topojson returns a quantized TopoJSON topology
+    with quantization= grid cells per axis.
+    
     Args:
         analysis_id (int): Analysis ID
         
     Returns:
         JSON: GeoJSON data
     """
+    output_format = request.args.get('format', 'geojson')
+    if output_format not in GEOJSON_FORMATS:
+        return jsonify({'error': f'format must be one of: {", ".join(GEOJSON_FORMATS)}'}), 400
+    stream = output_format == 'ndjson' or parse_bool(request.args.get('stream'), False)
+    
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        min_confidence = float(request.args['min_confidence']) if 'min_confidence' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
+    
+    zoom = request.args.get('zoom', type=float)
+    tolerance = request.args.get('tolerance', type=float)
+    precision = request.args.get('precision', type=int)
+    quantization = request.args.get('quantization', TOPOJSON_QUANTIZATION, type=int)
+    if precision is not None and not 0 <= precision <= MAX_COORDINATE_PRECISION:
+        return jsonify({'error': f'precision must be between 0 and {MAX_COORDINATE_PRECISION}'}), 400
+    if quantization < 2:
+        return jsonify({'error': 'quantization must be at least 2'}), 400
+    
+    keys = None
+    if request.args.get('types'):
+        keys = [FEATURE_KEYS.get(name.strip()) for name in request.args['types'].split(',')]
+        if None in keys:
+            return jsonify({'error': f'types must be a subset of: {", ".join(FEATURE_TYPES.values())}'}), 400
+    
     identity = get_jwt_identity()
     user_id = identity.get('id')
     is_admin = identity.get('is_admin', False)
@@ -314,6 +739,28 @@ def get_analysis_geojson(analysis_id):
     # Get the latest image for this analysis
     image = AnalysisImage.query.filter_by(analysis_id=analysis_id).order_by(AnalysisImage.image_date.desc()).first()
     
+    # Processed images keep their detections in pixel coordinates; the GeoJSON
+    # is built from them on request
+    details = load_image_details(image) if image else None
+    filtered = bbox is not None or keys is not None or min_confidence is not None
+    if details is not None:
+        try:
+            georef = resolve_georeference(image.image_path, analysis.latitude, analysis.longitude)
+            if filtered:
+                details = select_detections(
+                    details,
+                    load_image_index(image, details) if bbox is not None else None,
+                    bbox=georef.pixel_bbox(bbox) if bbox is not None and georef is not None else bbox,
+                    keys=keys,
+                    min_confidence=min_confidence
+                )
+            if tolerance is None and zoom is not None and georef is not None:
+                tolerance = zoom_tolerance(zoom, float(analysis.latitude), georef.pixel_size_m)
+            features = iter_geojson_features(details, georef, tolerance=tolerance, precision=precision)
+            return geojson_response(features, output_format, stream, quantization)
+        except Exception as e:
+            return jsonify({'error': f'Failed to build GeoJSON: {str(e)}'}), 500
+    
     if not image or not image.geojson_data:
         # Return demo GeoJSON if real data isn't available
         longitude = float(analysis.longitude)
@@ -491,11 +938,39 @@ def get_analysis_geojson(analysis_id):
                 geojson_data=demo_geojson
             )
             db.session.add(new_image)
+            update_image_stats(db.session, new_image)
             db.session.commit()
         
-        return jsonify(demo_geojson), 200
+        features = demo_geojson["features"]
+    else:
+        features = image.geojson_data.get("features", [])
     
-    return jsonify(image.geojson_data), 200
+    # Images without a detections sidecar only have their stored GeoJSON,
+    # already in longitude/latitude
+    if filtered:
+        features = filter_features(features, bbox=bbox, keys=keys, min_confidence=min_confidence)
+    return geojson_response(features, output_format, stream, quantization)
+
+def geojson_response(features, output_format, stream, quantization=TOPOJSON_QUANTIZATION):
+    """
+    Build the response of the GeoJSON endpoint
+    
+    Args:
+        features: Iterable of GeoJSON features
+        output_format: 'geojson', 'ndjson' or 'topojson'
+        stream: Whether to send a chunked response
+        quantization: Grid cells per axis of a TopoJSON topology
+        
+    Returns:
+        Response: FeatureCollection, newline-delimited features or Topology
+    """
+    if output_format == 'topojson':
+        return jsonify(encode_topology(features, quantization)), 200
+    if output_format == 'ndjson':
+        return Response(stream_ndjson(features), mimetype='application/x-ndjson')
+    if stream:
+        return Response(stream_geojson(features), mimetype='application/geo+json')
+    return jsonify({'type': 'FeatureCollection', 'features': list(features)}), 200
 
 @analysis_bp.route('/<int:analysis_id>/images', methods=['POST'])
 @jwt_required()
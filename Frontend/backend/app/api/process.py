@@ -7,12 +7,14 @@ import os
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from ..database import db
-from ..models.analysis import Analysis
+from ..models.analysis import Analysis, AnalysisImage
 from ..models.analysis_settings import AnalysisSettings
 from ..utils.validators import validate_coordinates
-from ..services.image_processing import process_image, queue_image_processing
+from ..services.image_processing import process_image, queue_image_processing, load_image_details
 from ..services.object_detection import detect_objects
 from ..services.geospatial import fetch_satellite_image
+from ..services.georeference import resolve_georeference
+from ..services.change_detection import compare_images
 from . import process_bp
 
 def allowed_file(filename):
@@ -235,11 +237,50 @@ def process_temporal():
     if analysis.user_id != user_id and not identity.get('is_admin', False):
         return jsonify({'error': 'Permission denied'}), 403
     
-    # This feature would require more complex implementation
-    # For now, return a placeholder
+    try:
+        start = datetime.fromisoformat(start_date)
+        end = datetime.fromisoformat(end_date)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Dates must be in ISO 8601 format'}), 400
+    
+    # Compare the earliest and the latest processed image in the period
+    images = AnalysisImage.query.filter(
+        AnalysisImage.analysis_id == analysis_id,
+        AnalysisImage.status == 'completed',
+        AnalysisImage.details_path.isnot(None),
+        AnalysisImage.image_date >= start,
+        AnalysisImage.image_date <= end
+    ).order_by(AnalysisImage.image_date.asc()).all()
+    if len(images) < 2:
+        return jsonify({'error': 'At least two processed images are needed in the period'}), 400
+    before_image, after_image = images[0], images[-1]
+    
+    before_details = load_image_details(before_image)
+    after_details = load_image_details(after_image)
+    if before_details is None or after_details is None:
+        return jsonify({'error': 'Image has not been processed yet'}), 400
+    
+    try:
+        georef = resolve_georeference(before_image.image_path, analysis.latitude, analysis.longitude)
+        comparison = compare_images(
+            before_image.image_path,
+            after_image.image_path,
+            before_details,
+            after_details,
+            georef,
+            pair=(before_image.id, after_image.id)
+        )
+    except Exception as e:
+        return jsonify({'error': f'Failed to compare images: {str(e)}'}), 500
+    
+    if comparison is None:
+        return jsonify({'error': 'Image files not found'}), 404
+    
     return jsonify({
-        'message': 'Temporal analysis is not implemented yet',
         'analysis_id': analysis_id,
         'start_date': start_date,
-        'end_date': end_date
-    }), 501
\ No newline at end of file
+        'end_date': end_date,
+        'before_image_id': before_image.id,
+        'after_image_id': after_image.id,
+        **comparison
+    }), 200
\ No newline at end of file
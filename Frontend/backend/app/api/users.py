@@ -1,11 +1,15 @@
 """
 User management API endpoints
 """
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..database import db
 from ..models.user import User
 from ..models.analysis_settings import AnalysisSettings
+from ..models.analysis import Analysis
+from ..services.image_processing import needs_redetection, queue_image_redetection
+from ..services.object_detection import get_detection_flags, get_detector_backends
+from ..services.detector_registry import validate_backends, available_detectors
 from ..utils.validators import require_json, validate_email
 from . import users_bp
 
@@ -150,7 +154,7 @@ def get_user_settings(user_id):
         user_id (int): User ID
         
     Returns:
-        JSON: User settings
+        JSON: User settings, and the detector backends registered per object class
     """
     # Check if current user is admin or requesting their own info
     identity = get_jwt_identity()
@@ -161,7 +165,7 @@ def get_user_settings(user_id):
     if not settings:
         return jsonify({'error': 'Settings not found'}), 404
     
-    return jsonify({'settings': settings.to_dict()}), 200
+    return jsonify({'settings': settings.to_dict(), 'available_detectors': available_detectors()}), 200
 
 @users_bp.route('/<int:user_id>/settings', methods=['PUT'])
 @jwt_required()
@@ -205,13 +209,34 @@ def update_user_settings(user_id):
     if 'detect_water_bodies' in data:
         settings.detect_water_bodies = data['detect_water_bodies']
     
+    if 'detector_backends' in data:
+        error = validate_backends(data['detector_backends'])
+        if error:
+            db.session.rollback()
+            return jsonify({'error': error}), 400
+        settings.detector_backends = data['detector_backends']
+    
     try:
         db.session.commit()
-        return jsonify({
-            'message': 'Settings updated successfully',
-            'settings': settings.to_dict()
-        }), 200
     
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': f'Failed to update settings: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Failed to update settings: {str(e)}'}), 500
+    
+    # Bring the latest processed image of each analysis up to date; only the
+    # newly enabled or outdated detectors run for each of them
+    flags = get_detection_flags(settings)
+    backends = get_detector_backends(settings)
+    stale_image_ids = []
+    for analysis in Analysis.query.filter_by(user_id=user_id).all():
+        image = analysis.get_latest_image()
+        if image and image.status == 'completed' and image.image_path and needs_redetection(image, flags, backends):
+            stale_image_ids.append(image.id)
+    
+    queue_image_redetection(current_app._get_current_object(), stale_image_ids, flags, backends)
+    
+    return jsonify({
+        'message': 'Settings updated successfully',
+        'settings': settings.to_dict(),
+        'images_queued_for_redetection': len(stale_image_ids)
+    }), 200
\ No newline at end of file
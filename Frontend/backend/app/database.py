@@ -2,6 +2,7 @@
 Database connection and utilities
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 
 # Initialize SQLAlchemy instance - THIS SHOULD BE THE ONLY INSTANCE IN THE APP
 db = SQLAlchemy()
@@ -16,8 +17,10 @@ def init_db(app):
     from app.models.analysis_settings import AnalysisSettings
     from app.models.analysis import Analysis
     
-    # Create all tables
+    # Create all tables, then add columns models gained since their table was created
     db.create_all()
+    for name in add_missing_columns(db.engine, db.metadata):
+        print(f"Added column {name}")
     
     # Create a default admin user if none exists
     admin = User.query.filter_by(username='admin').first()
@@ -43,4 +46,40 @@ def init_db(app):
             print(f"Error creating admin user: {str(e)}")
             db.session.rollback()
     
-    print("Database initialized successfully!")
\ No newline at end of file
+    print("Database initialized successfully!")
+
+def add_missing_columns(engine, metadata):
+    """
+    Add the columns of existing tables that their models gained later
+    
+    create_all() only creates missing tables, so a column added to a model
+    would be missing from a deployed database. Each one is added with ALTER
+    TABLE, along with the indexes on it. Added columns must be nullable, as
+    rows already in the table get NULL.
+    
+    Args:
+        engine: SQLAlchemy engine of the database
+        metadata: MetaData holding the model tables
+        
+    Returns:
+        list: "table.column" names of the added columns
+    """
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    added = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            new_columns = [column for column in table.columns if column.name not in existing]
+            for column in new_columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"
+                ))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                if any(column in new_columns for column in index.columns):
+                    index.create(connection)
+    return added
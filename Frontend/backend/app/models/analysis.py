@@ -14,12 +14,16 @@ class Analysis(db.Model):
     name = db.Column(db.String(100), nullable=False)
     latitude = db.Column(db.Numeric(10, 8), nullable=False)
     longitude = db.Column(db.Numeric(11, 8), nullable=False)
+    # Cell of the proximity grid containing the site (see services.proximity),
+    # so nearby sites are found with index range scans
+    geo_cell = db.Column(db.BigInteger, index=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     user = db.relationship('User', back_populates='analyses')
     images = db.relationship('AnalysisImage', back_populates='analysis', cascade='all, delete-orphan')
+    stats = db.relationship('AnalysisStats', back_populates='analysis', cascade='all, delete-orphan')
     
     def __init__(self, user_id, name, latitude, longitude):
         self.user_id = user_id
@@ -27,18 +31,20 @@ class Analysis(db.Model):
         self.latitude = latitude
         self.longitude = longitude
     
-    def to_dict(self):
-        """Convert analysis object to dictionary"""
-        return {
+    def to_dict(self, include_images=True):
+        """Convert analysis object to dictionary, optionally without its images"""
+        data = {
             'id': self.id,
             'user_id': self.user_id,
             'name': self.name,
             'latitude': float(self.latitude),
             'longitude': float(self.longitude),
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'images': [image.to_dict() for image in self.images]
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_images:
+            data['images'] = [image.to_dict() for image in self.images]
+        return data
     
     def get_latest_image(self):
         """Get the most recent image for this analysis"""
@@ -68,6 +74,12 @@ class AnalysisImage(db.Model):
     # GeoJSON for visualization
     geojson_data = db.Column(JSONB)
     
+    # Binary sidecar with the per-class detection details, and the detector
+    # versions that produced them, so a re-run only executes newly enabled or
+    # outdated detectors
+    details_path = db.Column(db.String(255))
+    detector_versions = db.Column(JSONB)
+    
     # Processing status and metadata
     status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
     source_type = db.Column(db.String(20))  # 'upload', 'api', 'historical'
@@ -99,7 +111,69 @@ class AnalysisImage(db.Model):
             'house_count': self.house_count,
             'road_count': self.road_count,
             'water_body_count': self.water_body_count,
+            'detector_versions': self.detector_versions,
             'status': self.status,
             'source_type': self.source_type,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class AnalysisStats(db.Model):
+    """
+    Detection counts of an analysis's completed images, aggregated per period
+    
+    Rows are refreshed whenever an image in their period completes, so time
+    series are read from here instead of from every image row.
+    """
+    __tablename__ = 'analysis_stats'
+    __table_args__ = (
+        db.UniqueConstraint('analysis_id', 'period', 'period_start', name='uq_analysis_stats_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=False, index=True)
+    period = db.Column(db.String(10), nullable=False)  # day, week, month
+    period_start = db.Column(db.Date, nullable=False)
+    
+    image_count = db.Column(db.Integer, default=0)
+    runway_images = db.Column(db.Integer, default=0)  # images with a runway detected
+    runway_length_max = db.Column(db.Float, nullable=True)  # in meters
+    aircraft_sum = db.Column(db.Integer, default=0)
+    aircraft_max = db.Column(db.Integer, default=0)
+    house_sum = db.Column(db.Integer, default=0)
+    house_max = db.Column(db.Integer, default=0)
+    road_sum = db.Column(db.Integer, default=0)
+    road_max = db.Column(db.Integer, default=0)
+    water_body_sum = db.Column(db.Integer, default=0)
+    water_body_max = db.Column(db.Integer, default=0)
+    
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Relationships
+    analysis = db.relationship('Analysis', back_populates='stats')
+    
+    def __init__(self, analysis_id, period, period_start):
+        self.analysis_id = analysis_id
+        self.period = period
+        self.period_start = period_start
+    
+    def to_dict(self):
+        """Convert a stats row to a time series point"""
+        count = self.image_count or 0
+        
+        def mean(total):
+            return round(total / count, 3) if count else None
+        
+        return {
+            'period_start': self.period_start.isoformat(),
+            'image_count': count,
+            'runway_detected_ratio': mean(self.runway_images or 0),
+            'runway_length_max': self.runway_length_max,
+            'aircraft_mean': mean(self.aircraft_sum or 0),
+            'aircraft_max': self.aircraft_max,
+            'house_mean': mean(self.house_sum or 0),
+            'house_max': self.house_max,
+            'road_mean': mean(self.road_sum or 0),
+            'road_max': self.road_max,
+            'water_body_mean': mean(self.water_body_sum or 0),
+            'water_body_max': self.water_body_max
+        }
@@ -2,6 +2,7 @@
 Analysis Settings model definition
 """
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB
 from ..database import db
 
 class AnalysisSettings(db.Model):
@@ -15,6 +16,9 @@ class AnalysisSettings(db.Model):
     detect_houses = db.Column(db.Boolean, default=True)
     detect_roads = db.Column(db.Boolean, default=True)
     detect_water_bodies = db.Column(db.Boolean, default=True)
+    # Registered detector per object class, e.g. {"aircraft": "standin-onnx"};
+    # classes not listed use the default heuristics
+    detector_backends = db.Column(JSONB, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -39,5 +43,6 @@ class AnalysisSettings(db.Model):
             'detect_aircraft': self.detect_aircraft,
             'detect_houses': self.detect_houses,
             'detect_roads': self.detect_roads,
-            'detect_water_bodies': self.detect_water_bodies
+            'detect_water_bodies': self.detect_water_bodies,
+            'detector_backends': self.detector_backends or {}
         }
\ No newline at end of file
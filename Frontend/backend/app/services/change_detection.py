@@ -0,0 +1,246 @@
+"""
+Change detection between two images of the same site
+Compares co-registered rasters pixel by pixel and matches the detections of both dates
+"""
+import os
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+import cv2
+
+from app.services.detections import Detections, DETAIL_KEYS
+from app.services.georeference import GeoReference, georeference_paths
+from app.services.image_context import ImageContext
+from app.services.object_detection import iter_geojson_features
+from app.services.registration import Registration, get_registration, load_image, work_level
+from app.services.simplification import ragged_arange
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Longest edge of the pyramid level the pixel comparison runs on
+CHANGE_WORK_DIMENSION = int(os.getenv('CHANGE_WORK_DIMENSION', 2048))
+# Difference, in standard deviations of the normalized images, that counts as change
+CHANGE_SIGMA = float(os.getenv('CHANGE_SIGMA', 1.5))
+# Smallest change region reported, in pixels of the work level
+CHANGE_MIN_AREA = 64
+# Distance within which detections of both dates are taken to be the same object
+CHANGE_MATCH_RADIUS_M = float(os.getenv('CHANGE_MATCH_RADIUS_M', 15.0))
+
+def change_mask(
+    before: ImageContext,
+    after: ImageContext,
+    registration: Registration
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Per-pixel change between two co-registered images
+
+    The after image is warped onto the before image at a reduced pyramid
+    level. Both are normalized to zero mean and unit variance over their
+    overlap, so global brightness differences between dates cancel out, and
+    pixels whose smoothed difference exceeds CHANGE_SIGMA are marked.
+
+    Args:
+        before: Reference image
+        after: Later image
+        registration: Transform from after to before pixels
+
+    Returns:
+        Tuple of (change mask, overlap mask, pyramid level) at the work level
+    """
+    level = work_level(before.shape, CHANGE_WORK_DIMENSION)
+    reference = before.level(level).gray
+    moving = after.level(level).gray
+    height, width = reference.shape[:2]
+
+    scale = 2 ** level
+    to_level = np.diag([1.0 / scale, 1.0 / scale, 1.0])
+    matrix = to_level @ registration.matrix @ np.linalg.inv(to_level)
+    warped = cv2.warpPerspective(moving, matrix, (width, height), flags=cv2.INTER_LINEAR)
+    overlap = cv2.warpPerspective(
+        np.full(moving.shape[:2], 255, dtype=np.uint8), matrix, (width, height), flags=cv2.INTER_NEAREST
+    ) > 0
+    if not overlap.any():
+        return np.zeros((height, width), dtype=np.uint8), overlap, level
+
+    def normalize(plane: np.ndarray) -> np.ndarray:
+        plane = plane.astype(np.float32)
+        values = plane[overlap]
+        return (plane - values.mean()) / (values.std() + 1e-6)
+
+    difference = cv2.GaussianBlur(np.abs(normalize(reference) - normalize(warped)), (5, 5), 0)
+    mask = ((difference > CHANGE_SIGMA) & overlap).astype(np.uint8) * 255
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), dtype=np.uint8))
+    return mask, overlap, level
+
+def change_regions(mask: np.ndarray, level: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Outlines of the connected change regions
+
+    Args:
+        mask: Change mask at a pyramid level
+        level: Pyramid level of the mask
+
+    Returns:
+        Tuple of (points, offsets, areas) with ragged outlines and areas in
+        full-resolution pixels
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    scale = 2 ** level
+    outlines, areas = [], []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area < CHANGE_MIN_AREA:
+            continue
+        outlines.append(contour.reshape(-1, 2).astype(np.float64) * scale)
+        areas.append(area * scale * scale)
+
+    offsets = np.zeros(len(outlines) + 1, dtype=np.int64)
+    if not outlines:
+        return np.empty((0, 2)), offsets, np.empty(0)
+    offsets[1:] = np.cumsum([len(outline) for outline in outlines])
+    points = np.concatenate(outlines)
+    return points, offsets, np.array(areas)
+
+def match_points(before: np.ndarray, after: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pair points of two sets that are each other's nearest neighbour within a radius
+
+    Candidate pairs come from a uniform grid with cells of the radius, so
+    only points in neighbouring cells are compared.
+
+    Args:
+        before: Array of shape (N, 2)
+        after: Array of shape (M, 2)
+        radius: Largest distance between paired points
+
+    Returns:
+        Tuple of (before indices, after indices) of the pairs
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(before) or not len(after) or radius <= 0:
+        return empty, empty
+
+    cells_before = np.floor(before / radius).astype(np.int64)
+    cells_after = np.floor(after / radius).astype(np.int64)
+    origin = np.minimum(cells_before.min(axis=0), cells_after.min(axis=0)) - 1
+    cells_before -= origin
+    cells_after -= origin
+    rows = int(max(cells_before[:, 1].max(), cells_after[:, 1].max())) + 2
+
+    keys = cells_before[:, 0] * rows + cells_before[:, 1]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    candidates_after, candidates_before = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            targets = (cells_after[:, 0] + dx) * rows + cells_after[:, 1] + dy
+            low = np.searchsorted(sorted_keys, targets, side="left")
+            counts = np.searchsorted(sorted_keys, targets, side="right") - low
+            candidates_after.append(np.repeat(np.arange(len(after)), counts))
+            candidates_before.append(order[np.repeat(low, counts) + ragged_arange(counts)])
+    pairs_after = np.concatenate(candidates_after)
+    pairs_before = np.concatenate(candidates_before)
+
+    distances = np.linalg.norm(before[pairs_before] - after[pairs_after], axis=1)
+    close = distances <= radius
+    pairs_after, pairs_before, distances = pairs_after[close], pairs_before[close], distances[close]
+    if not len(distances):
+        return empty, empty
+
+    def nearest(groups: np.ndarray) -> np.ndarray:
+        # Pair positions that are the closest pair of their group
+        order = np.lexsort((distances, groups))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = groups[order][1:] != groups[order][:-1]
+        best = np.zeros(len(order), dtype=bool)
+        best[order[first]] = True
+        return best
+
+    mutual = nearest(pairs_after) & nearest(pairs_before)
+    return pairs_before[mutual], pairs_after[mutual]
+
+def detection_centers(detections) -> np.ndarray:
+    """Center of the bounding box of every detection"""
+    boxes = detections.bboxes()
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+def compare_images(
+    before_path: str,
+    after_path: str,
+    before_details: Detections,
+    after_details: Detections,
+    georef: Optional[GeoReference] = None,
+    pair: Optional[Tuple[int, int]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Compare two images of a site and their detections
+
+    Decoded images and registrations are cached, so repeating a comparison
+    of the same pair only redoes the pixel difference.
+
+    Args:
+        before_path: Path to the earlier image
+        after_path: Path to the later image
+        before_details: Detections of the earlier image
+        after_details: Detections of the later image
+        georef: Georeferencing of the earlier image, used for the output
+        pair: Ids of the (before, after) AnalysisImage rows, keying the
+            persisted registration
+
+    Returns:
+        Dictionary with the registration, changed fraction, per-class deltas
+        and a change GeoJSON, or None if an image could not be read
+    """
+    before = load_image(before_path)
+    after = load_image(after_path)
+    if before is None or after is None:
+        return None
+    registration = get_registration(before_path, after_path, before, after, pair)
+
+    mask, overlap, level = change_mask(before, after, registration)
+    points, offsets, areas = change_regions(mask, level)
+    changed_fraction = float(np.count_nonzero(mask)) / max(int(np.count_nonzero(overlap)), 1)
+
+    # Later detections in the earlier image's pixel grid
+    aligned = Detections((key, detections.warp(registration.matrix)) for key, detections in after_details.items())
+    radius = CHANGE_MATCH_RADIUS_M / (georef.pixel_size_m if georef is not None else 1.0)
+
+    deltas: Dict[str, Dict[str, int]] = {}
+    appeared, disappeared = Detections.empty(), Detections.empty()
+    for key in DETAIL_KEYS:
+        earlier, later = before_details[key], aligned[key]
+        matched_before, matched_after = match_points(detection_centers(earlier), detection_centers(later), radius)
+        appeared[key] = later.take(np.setdiff1d(np.arange(len(later)), matched_after))
+        disappeared[key] = earlier.take(np.setdiff1d(np.arange(len(earlier)), matched_before))
+        deltas[key] = {
+            "before": len(earlier),
+            "after": len(later),
+            "persisted": len(matched_before),
+            "appeared": len(appeared[key]),
+            "disappeared": len(disappeared[key])
+        }
+
+    features: List[Dict[str, Any]] = []
+    outlines = georeference_paths(georef, points, offsets)
+    for index, (outline, area) in enumerate(zip(outlines, areas.tolist())):
+        properties = {"id": index + 1, "type": "change", "area": round(area, 1)}
+        if georef is not None:
+            properties["area_m2"] = round(area * georef.pixel_size_m ** 2, 1)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [outline + outline[:1]]},
+            "properties": properties
+        })
+    for change, details in (("appeared", appeared), ("disappeared", disappeared)):
+        for feature in iter_geojson_features(details, georef):
+            feature["properties"]["change"] = change
+            features.append(feature)
+
+    return {
+        "registration": registration.to_dict(),
+        "changed_fraction": round(changed_fraction, 4),
+        "deltas": deltas,
+        "geojson": {"type": "FeatureCollection", "features": features}
+    }
@@ -0,0 +1,123 @@
+"""
+Content-addressed cache for object detection results
+Keeps recent results in an in-process LRU and all results in a size-bounded on-disk store
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from app.services.disk_cache import DiskCache
+from app.services.detections import pack_results, unpack_results
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Cache settings
+CACHE_DIR = Path(os.getenv('DETECTION_CACHE_DIR', './cache/detections'))
+CACHE_MAX_BYTES = int(os.getenv('DETECTION_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+CACHE_MEMORY_ENTRIES = int(os.getenv('DETECTION_CACHE_MEMORY_ENTRIES', 128))
+
+def make_cache_key(
+    content_digest: str,
+    flags: Dict[str, bool],
+    detector_versions: Dict[str, str],
+    tiled: bool
+) -> str:
+    """
+    Build the cache key of one detection run
+
+    Args:
+        content_digest: Hash of the image pixels
+        flags: detect_* flags of the run
+        detector_versions: Version of each detector, keyed by detail key
+        tiled: Whether the scene was processed tile by tile
+
+    Returns:
+        Hex digest identifying the run
+    """
+    payload = json.dumps({
+        "content": content_digest,
+        "flags": {name: bool(value) for name, value in sorted(flags.items())},
+        "versions": dict(sorted(detector_versions.items())),
+        "tiled": bool(tiled)
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class DetectionCache(DiskCache):
+    """
+    Two-tier cache of detection results keyed by make_cache_key
+
+    The memory tier holds the serialized results of the most recently used
+    entries. The disk tier stores each entry as <key>.npz in the detections
+    sidecar format and evicts the least recently used entries once it grows
+    past max_bytes.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, memory_entries: int):
+        super().__init__(directory, max_bytes, ".npz")
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result
+
+        Args:
+            key: Cache key
+
+        Returns:
+            A fresh copy of the cached results dictionary, or None on a miss
+        """
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+
+        if payload is None:
+            payload = self.read(key)
+            if payload is None:
+                return None
+            self._remember(key, payload)
+        else:
+            self.touch(key)
+
+        return unpack_results(payload)
+
+    def put(self, key: str, results: Dict[str, Any]) -> None:
+        """
+        Store a result in both tiers
+
+        Args:
+            key: Cache key
+            results: Results dictionary with Detections details and
+                JSON-serializable other values
+        """
+        payload = pack_results(results)
+        self._remember(key, payload)
+        self.write(key, payload)
+
+    def _remember(self, key: str, payload: bytes) -> None:
+        with self._lock:
+            self._memory[key] = payload
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        super().clear()
+
+# Cache shared by detect_objects
+detection_cache = DetectionCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MEMORY_ENTRIES)
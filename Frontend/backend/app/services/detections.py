@@ -0,0 +1,589 @@
+"""
+Columnar containers for detection results
+Stores the detections of each object class as a NumPy structured array plus
+ragged point arrays for polylines and polygons, with a binary sidecar format
+"""
+import io
+import os
+import json
+import tempfile
+import hashlib
+import logging
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+import numpy as np
+
+from app.services.simplification import douglas_peucker_weights, simplify_mask
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Object classes and the keys they are stored under in results["details"]
+DETAIL_KEYS = ("runways", "aircraft", "houses", "roads", "water_bodies")
+
+# Feature type reported in GeoJSON properties for each object class
+FEATURE_TYPES = {
+    "runways": "runway",
+    "aircraft": "aircraft",
+    "houses": "house",
+    "roads": "road",
+    "water_bodies": "water_body"
+}
+
+# Fields shared by every class
+COMMON_FIELDS = [("id", "<i4"), ("confidence", "<f4")]
+BBOX_FIELD = ("bbox", "<f4", (4,))
+CENTER_FIELD = ("center", "<f4", (2,))
+
+# Per-class record fields and the name of the class's point path, if any
+SCHEMAS: Dict[str, Tuple[List[tuple], Optional[str]]] = {
+    "runways": (
+        [BBOX_FIELD, CENTER_FIELD, ("width", "<f4"), ("height", "<f4"),
+         ("length", "<f4"), ("runway_width", "<f4"), ("heading", "<f4")],
+        "polygon"
+    ),
+    "aircraft": ([BBOX_FIELD, CENTER_FIELD, ("width", "<f4"), ("height", "<f4"), ("area", "<f4")], None),
+    "houses": ([BBOX_FIELD, CENTER_FIELD, ("width", "<f4"), ("height", "<f4"), ("area", "<f4")], None),
+    "roads": ([("width", "<f4")], "polyline"),
+    "water_bodies": ([CENTER_FIELD, ("area", "<f4")], "polygon")
+}
+
+# Scalar fields that are lengths in pixels, and areas in square pixels
+LENGTH_FIELDS = ("width", "height", "length", "runway_width")
+AREA_FIELDS = ("area",)
+
+def record_dtype(key: str) -> np.dtype:
+    """Structured dtype of one detection of an object class"""
+    return np.dtype(COMMON_FIELDS + SCHEMAS[key][0])
+
+class DetectionSet:
+    """
+    Detections of one object class in pixel coordinates
+
+    records holds one row per detection. For classes with a path (road
+    polylines, runway and water body polygons) the points of all detections
+    are concatenated in points, and detection i owns
+    points[offsets[i]:offsets[i + 1]]. Float fields a detector does not
+    report are NaN. weights, when computed, holds the Douglas-Peucker rank
+    of every point for level-of-detail simplification.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        records: np.ndarray,
+        offsets: Optional[np.ndarray] = None,
+        points: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None
+    ):
+        self.key = key
+        self.records = records
+        self.path_key = SCHEMAS[key][1]
+        if self.path_key is not None:
+            self.offsets = offsets if offsets is not None else np.zeros(len(records) + 1, dtype=np.int64)
+            self.points = points if points is not None else np.empty((0, 2), dtype=np.float32)
+            self.weights = weights
+        else:
+            self.offsets = None
+            self.points = None
+            self.weights = None
+
+    @classmethod
+    def empty(cls, key: str) -> "DetectionSet":
+        """Set without detections"""
+        return cls(key, np.zeros(0, dtype=record_dtype(key)))
+
+    @classmethod
+    def from_columns(cls, key: str, paths: Optional[List[np.ndarray]] = None, **columns) -> "DetectionSet":
+        """
+        Build a set from whole columns, e.g. the outputs of a vectorized detector
+
+        Args:
+            key: Object class
+            paths: Point array of each detection, for classes with a path
+            columns: Field name -> array with one entry per detection; ids
+                default to 1..N and missing float fields to NaN
+
+        Returns:
+            New DetectionSet
+        """
+        dtype = record_dtype(key)
+        count = len(next(iter(columns.values()))) if columns else len(paths or [])
+        records = np.zeros(count, dtype=dtype)
+        for name in dtype.names:
+            if name in columns:
+                records[name] = columns[name]
+            elif name == "id":
+                records["id"] = np.arange(1, count + 1)
+            else:
+                records[name] = np.nan
+
+        offsets = points = None
+        if SCHEMAS[key][1] is not None:
+            paths = [np.asarray(path, dtype=np.float32).reshape(-1, 2) for path in (paths or [])]
+            offsets = np.zeros(count + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(path) for path in paths]) if paths else 0
+            points = np.concatenate(paths) if paths else np.empty((0, 2), dtype=np.float32)
+        return cls(key, records, offsets, points)
+
+    @classmethod
+    def from_dicts(cls, key: str, locations: Iterable[Dict[str, Any]]) -> "DetectionSet":
+        """
+        Build a set from the dictionaries a simple detector returns
+
+        Args:
+            key: Object class
+            locations: Detection dictionaries; unknown keys are dropped
+
+        Returns:
+            New DetectionSet
+        """
+        locations = list(locations)
+        if not locations:
+            return cls.empty(key)
+        dtype = record_dtype(key)
+        records = np.zeros(len(locations), dtype=dtype)
+        for name in dtype.names:
+            if name == "id":
+                records["id"] = [d.get("id", i + 1) for i, d in enumerate(locations)]
+                continue
+            shape = dtype[name].shape
+            missing = np.full(shape, np.nan) if shape else np.nan
+            records[name] = [d[name] if name in d else missing for d in locations]
+
+        path_key = SCHEMAS[key][1]
+        paths = [d.get(path_key, []) for d in locations] if path_key else None
+        return cls.from_columns(key, paths=paths, **{name: records[name] for name in dtype.names})
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, DetectionSet) or other.key != self.key:
+            return NotImplemented
+        same_records = all(
+            np.array_equal(self.records[name], other.records[name], equal_nan=True)
+            for name in self.records.dtype.names
+        ) and len(self) == len(other)
+        if self.path_key is None:
+            return same_records
+        return (
+            same_records
+            and np.array_equal(self.offsets, other.offsets)
+            and np.array_equal(self.points, other.points)
+        )
+
+    def __repr__(self) -> str:
+        return f"DetectionSet({self.key!r}, {len(self)} detections)"
+
+    def has(self, name: str) -> bool:
+        """Whether the class has the field name"""
+        return name in self.records.dtype.names
+
+    def paths(self) -> List[np.ndarray]:
+        """Point array of each detection, as views into points"""
+        if self.path_key is None:
+            return []
+        return np.split(self.points, self.offsets[1:-1])
+
+    def bboxes(self) -> np.ndarray:
+        """
+        Axis-aligned bounding boxes of all detections
+
+        Returns:
+            Array of shape (N, 4) with [x1, y1, x2, y2] rows
+        """
+        if not len(self):
+            return np.zeros((0, 4), dtype=np.float64)
+        if self.has("bbox"):
+            return self.records["bbox"].astype(np.float64)
+        if self.path_key is not None and len(self.points) and np.all(np.diff(self.offsets) > 0):
+            starts = self.offsets[:-1]
+            boxes = np.empty((len(self), 4), dtype=np.float64)
+            boxes[:, :2] = np.minimum.reduceat(self.points, starts, axis=0)
+            boxes[:, 2:] = np.maximum.reduceat(self.points, starts, axis=0)
+            return boxes
+        centers = self.records["center"].astype(np.float64)
+        return np.hstack([centers, centers])
+
+    def _with(
+        self,
+        records: np.ndarray,
+        points: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None
+    ) -> "DetectionSet":
+        return DetectionSet(
+            self.key,
+            records,
+            None if self.offsets is None else self.offsets.copy(),
+            points if points is not None else (None if self.points is None else self.points.copy()),
+            weights if weights is not None else (None if self.weights is None else self.weights.copy())
+        )
+
+    def translate(self, dx: float, dy: float) -> "DetectionSet":
+        """
+        Shift every coordinate, e.g. from tile to scene pixels
+
+        Args:
+            dx: Column offset
+            dy: Row offset
+
+        Returns:
+            New DetectionSet
+        """
+        records = self.records.copy()
+        if self.has("bbox"):
+            records["bbox"] += np.array([dx, dy, dx, dy], dtype=np.float32)
+        if self.has("center"):
+            records["center"] += np.array([dx, dy], dtype=np.float32)
+        points = None if self.points is None else self.points + np.array([dx, dy], dtype=np.float32)
+        return self._with(records, points)
+
+    def scale(self, factor: float, measurements: bool = False) -> "DetectionSet":
+        """
+        Scale every coordinate
+
+        Args:
+            factor: Multiplicative scale factor
+            measurements: Also scale lengths and areas, as when mapping a
+                pyramid level back to full resolution rather than drawing on
+                an overview
+
+        Returns:
+            New DetectionSet
+        """
+        records = self.records.copy()
+        for name in ("bbox", "center"):
+            if self.has(name):
+                records[name] *= factor
+        if measurements:
+            for name in LENGTH_FIELDS:
+                if self.has(name):
+                    records[name] *= factor
+            for name in AREA_FIELDS:
+                if self.has(name):
+                    records[name] *= factor * factor
+        points = None if self.points is None else self.points * np.float32(factor)
+        # Weights are distances, so they scale with the coordinates
+        weights = None if self.weights is None else self.weights * np.float32(factor)
+        return self._with(records, points, weights)
+
+    def warp(self, matrix: np.ndarray) -> "DetectionSet":
+        """
+        Map every coordinate through a homography, e.g. into a co-registered image
+
+        Boxes become the bounds of their warped corners; lengths and areas are
+        kept, which assumes the transform is close to rigid.
+
+        Args:
+            matrix: 3x3 homography in pixel coordinates
+
+        Returns:
+            New DetectionSet
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+
+        def project(points: np.ndarray) -> np.ndarray:
+            points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            projected = np.hstack((points, np.ones((len(points), 1)))) @ matrix.T
+            return (projected[:, :2] / projected[:, 2:3]).astype(np.float32)
+
+        records = self.records.copy()
+        if self.has("center"):
+            records["center"] = project(records["center"])
+        if self.has("bbox"):
+            x1, y1, x2, y2 = records["bbox"].T
+            corners = project(np.stack([x1, y1, x2, y1, x2, y2, x1, y2], axis=1)).reshape(-1, 4, 2)
+            records["bbox"] = np.concatenate((corners.min(axis=1), corners.max(axis=1)), axis=1)
+        points = None if self.points is None else project(self.points)
+        return self._with(records, points)
+
+    def take(self, indices: np.ndarray) -> "DetectionSet":
+        """
+        Select detections by index
+
+        Args:
+            indices: Indices of the detections to keep, in output order
+
+        Returns:
+            New DetectionSet
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        records = self.records[indices]
+        if self.path_key is None:
+            return DetectionSet(self.key, records)
+
+        starts, ends = self.offsets[indices], self.offsets[indices + 1]
+        lengths = ends - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Gather the points of every kept path in one fancy-indexing step
+        point_index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        weights = None if self.weights is None else self.weights[point_index]
+        return DetectionSet(self.key, records, offsets, self.points[point_index], weights)
+
+    def renumber(self) -> "DetectionSet":
+        """Copy with ids 1..N in the current order"""
+        records = self.records.copy()
+        records["id"] = np.arange(1, len(records) + 1)
+        return self._with(records)
+
+    @classmethod
+    def concatenate(cls, key: str, sets: List["DetectionSet"]) -> "DetectionSet":
+        """
+        Join several sets of the same class
+
+        Args:
+            key: Object class
+            sets: Sets to join, in order
+
+        Returns:
+            New DetectionSet; ids are kept as they are
+        """
+        sets = [s for s in sets if len(s)]
+        if not sets:
+            return cls.empty(key)
+        records = np.concatenate([s.records for s in sets])
+        if SCHEMAS[key][1] is None:
+            return cls(key, records)
+
+        lengths = np.concatenate([np.diff(s.offsets) for s in sets])
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        weights = None
+        if all(s.weights is not None for s in sets):
+            weights = np.concatenate([s.weights for s in sets])
+        return cls(key, records, offsets, np.concatenate([s.points for s in sets]), weights)
+
+    def with_weights(self) -> "DetectionSet":
+        """
+        Copy with the Douglas-Peucker rank of every path point computed
+
+        Returns:
+            New DetectionSet; classes without paths are returned unchanged
+        """
+        if self.path_key is None:
+            return self
+        weights = douglas_peucker_weights(self.points, self.offsets, closed=self.path_key == "polygon")
+        return self._with(self.records.copy(), weights=weights)
+
+    def simplify(self, tolerance: Optional[float]) -> "DetectionSet":
+        """
+        Drop the path points a Douglas-Peucker pass with a tolerance removes
+
+        Args:
+            tolerance: Largest allowed deviation in pixels; unset or 0 keeps every point
+
+        Returns:
+            New DetectionSet; weights are computed first if missing
+        """
+        if self.path_key is None or not tolerance or tolerance <= 0:
+            return self
+        detections = self if self.weights is not None else self.with_weights()
+        keep = simplify_mask(detections.weights, tolerance)
+        kept_before = np.concatenate(([0], np.cumsum(keep)))
+        offsets = kept_before[detections.offsets].astype(np.int64)
+        return DetectionSet(
+            self.key,
+            self.records.copy(),
+            offsets,
+            detections.points[keep],
+            detections.weights[keep]
+        )
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Convert to one dictionary per detection, for API responses
+
+        Returns:
+            Detection dictionaries; NaN fields are left out
+        """
+        columns = {}
+        for name in self.records.dtype.names:
+            values = self.records[name]
+            if name != "id":
+                values = np.round(values.astype(np.float64), 3)
+            columns[name] = values.tolist()
+        missing = {
+            name: np.isnan(self.records[name]).tolist()
+            for name in self.records.dtype.names
+            if name != "id" and not self.records.dtype[name].shape
+        }
+        paths = [np.round(path.astype(np.float64), 3).tolist() for path in self.paths()]
+
+        dicts = []
+        for index in range(len(self)):
+            detection = {}
+            for name, values in columns.items():
+                if name in missing and missing[name][index]:
+                    continue
+                detection[name] = values[index]
+            if self.path_key is not None:
+                detection[self.path_key] = paths[index]
+            dicts.append(detection)
+        return dicts
+
+class Detections(dict):
+    """
+    Detection sets of all object classes, keyed by detail key
+
+    Behaves like the plain details dictionary it replaces, so code can index
+    and iterate it by class, and adds conversion to and from the binary
+    sidecar format.
+    """
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        """Empty sets for every object class"""
+        return cls({key: DetectionSet.empty(key) for key in DETAIL_KEYS})
+
+    @classmethod
+    def from_details(cls, details: Dict[str, Any]) -> "Detections":
+        """
+        Build from a details mapping whose values are sets or lists of dictionaries
+
+        Args:
+            details: Detail key -> DetectionSet or list of detection dictionaries;
+                missing object classes get empty sets
+
+        Returns:
+            New Detections
+        """
+        if isinstance(details, Detections):
+            return details
+        detections = cls.empty()
+        for key, value in details.items():
+            detections[key] = value if isinstance(value, DetectionSet) else DetectionSet.from_dicts(key, value or [])
+        return detections
+
+    def with_weights(self) -> "Detections":
+        """Copy whose path sets carry simplification weights, computing missing ones"""
+        return Detections(
+            (key, detections if detections.weights is not None else detections.with_weights())
+            for key, detections in self.items()
+        )
+
+    def to_details(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Plain dictionaries for API responses"""
+        return {key: detections.to_dicts() for key, detections in self.items()}
+
+    def to_bytes(self, meta: Optional[Dict[str, Any]] = None) -> bytes:
+        """
+        Serialize to the sidecar format, an uncompressed .npz archive
+
+        Args:
+            meta: JSON-serializable values stored alongside the arrays
+
+        Returns:
+            Archive bytes
+        """
+        arrays = {"meta": np.frombuffer(json.dumps(meta or {}).encode("utf-8"), dtype=np.uint8)}
+        for key, detections in self.items():
+            arrays[f"{key}.records"] = detections.records
+            if detections.path_key is not None:
+                arrays[f"{key}.offsets"] = detections.offsets
+                arrays[f"{key}.points"] = detections.points
+            if detections.weights is not None:
+                arrays[f"{key}.weights"] = detections.weights
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Tuple["Detections", Dict[str, Any]]:
+        """
+        Read the sidecar format
+
+        Args:
+            data: Bytes written by to_bytes
+
+        Returns:
+            Tuple of (Detections, meta dictionary)
+        """
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+            keys = [name[:-len(".records")] for name in archive.files if name.endswith(".records")]
+            detections = cls()
+            for key in keys:
+                offsets = archive[f"{key}.offsets"] if f"{key}.offsets" in archive.files else None
+                points = archive[f"{key}.points"] if f"{key}.points" in archive.files else None
+                weights = archive[f"{key}.weights"] if f"{key}.weights" in archive.files else None
+                detections[key] = DetectionSet(key, archive[f"{key}.records"], offsets, points, weights)
+        return detections, meta
+
+    def save(self, path: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Write the sidecar file, replacing any previous one atomically"""
+        atomic_write(path, self.to_bytes(meta))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Detections"]:
+        """
+        Read a sidecar file
+
+        Args:
+            path: Path written by save
+
+        Returns:
+            Detections, or None if the file is missing or unreadable
+        """
+        try:
+            with open(path, "rb") as f:
+                return cls.from_bytes(f.read())[0]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read detections from {path}: {str(e)}")
+            return None
+
+    def digest(self) -> str:
+        """Content hash of all sets"""
+        hasher = hashlib.blake2b(digest_size=20)
+        for key in sorted(self):
+            detections = self[key]
+            hasher.update(key.encode("utf-8"))
+            for array in (detections.records, detections.offsets, detections.points):
+                if array is not None:
+                    hasher.update(np.ascontiguousarray(array).tobytes())
+        return hasher.hexdigest()
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Write a file through a temporary one in the same directory, then replace it
+
+    The temporary name is unique, so concurrent writers of the same path never
+    share a half-written file; the last replace wins.
+
+    Args:
+        path: Target file path
+        data: File contents
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def sidecar_path(image_path: str) -> str:
+    """Path of the detections sidecar stored next to an image"""
+    return f"{image_path}.detections.npz"
+
+def pack_results(results: Dict[str, Any]) -> bytes:
+    """
+    Serialize a detect_objects results dictionary
+
+    Args:
+        results: Results whose "details" are Detections; every other value
+            must be JSON-serializable
+
+    Returns:
+        Sidecar bytes with the other values as metadata
+    """
+    meta = {name: value for name, value in results.items() if name != "details"}
+    return Detections.from_details(results["details"]).to_bytes(meta)
+
+def unpack_results(data: bytes) -> Dict[str, Any]:
+    """Inverse of pack_results"""
+    details, meta = Detections.from_bytes(data)
+    return {**meta, "details": details}
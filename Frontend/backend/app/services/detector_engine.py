@@ -0,0 +1,122 @@
+"""
+Detector execution engine
+Runs the per-class detectors of one image concurrently on a bounded thread pool,
+and whole images concurrently on a process pool
+"""
+import os
+import atexit
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default degree of parallelism; OpenCV releases the GIL inside its kernels
+DETECTOR_WORKERS = int(os.getenv('DETECTOR_WORKERS', min(5, os.cpu_count() or 1)))
+
+# Worker processes used for batch detection over many images
+BATCH_WORKERS = int(os.getenv('BATCH_DETECTION_WORKERS', os.cpu_count() or 1))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide detector thread pool, creating it on first use
+
+    Returns:
+        Shared ThreadPoolExecutor bounded to DETECTOR_WORKERS threads
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, DETECTOR_WORKERS),
+                thread_name_prefix="detector"
+            )
+        return _executor
+
+def shutdown_executor() -> None:
+    """Shut down the shared detector thread pool, e.g. before forking workers"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Get the process-wide batch detection pool, creating it on first use
+
+    Workers are spawned rather than forked so they never inherit database
+    connections or the detector threads of the web worker.
+
+    Returns:
+        Shared ProcessPoolExecutor bounded to BATCH_WORKERS processes
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max(1, BATCH_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+def shutdown_process_pool() -> None:
+    """Shut down the batch detection pool, or discard it after a worker crash"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True, cancel_futures=True)
+            _process_pool = None
+
+# Release the pools at interpreter exit; both shutdowns are no-ops for pools never started
+atexit.register(shutdown_executor)
+atexit.register(shutdown_process_pool)
+
+async def execute_detectors(
+    detectors: Dict[str, Callable[[Any], Any]],
+    contexts: Any,
+    parallelism: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Run several detectors over the same image contexts
+
+    With a parallelism of 1 the detectors run one after another in the
+    calling thread. Otherwise at most `parallelism` of them run at once on
+    the shared pool, so wall-clock time approaches that of the slowest one.
+    Detectors must not share mutable state for the results to match the
+    sequential path.
+
+    Args:
+        detectors: Mapping of detail key to detector function
+        contexts: ImageContexts passed to every detector
+        parallelism: Maximum number of detectors running at once
+            (defaults to DETECTOR_WORKERS)
+
+    Returns:
+        Detector outputs keyed like the input mapping
+    """
+    if parallelism is None:
+        parallelism = DETECTOR_WORKERS
+
+    if parallelism <= 1 or len(detectors) <= 1:
+        return {key: detector(contexts) for key, detector in detectors.items()}
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run_one(detector):
+        async with semaphore:
+            return await loop.run_in_executor(executor, detector, contexts)
+
+    outputs = await asyncio.gather(*(run_one(detector) for detector in detectors.values()))
+    return dict(zip(detectors.keys(), outputs))
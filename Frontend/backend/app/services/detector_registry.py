@@ -0,0 +1,297 @@
+"""
+Detector registry
+Maps each object class to the detectors that can serve it: heuristics or CPU models run through OpenCV DNN
+"""
+import os
+import logging
+import threading
+from typing import Dict, List, Any, Callable, Optional, Tuple
+import numpy as np
+import cv2
+
+from app.services.detections import DetectionSet
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Backend used for a class when the settings do not name one
+DEFAULT_BACKEND = "heuristic"
+
+# Largest number of images passed to a model in one forward call
+DNN_MAX_BATCH = int(os.getenv('DNN_MAX_BATCH', 16))
+
+# Pyramid levels are never coarser than this many pixels along the short edge
+PYRAMID_MIN_DIMENSION = 64
+
+class Detector:
+    """
+    Base class for detectors served through the registry
+
+    Subclasses implement detect for one image and may override detect_batch
+    when several images can be processed in a single call.
+
+    A detector declares the coarsest pyramid level it needs through `level`:
+    level n sees the image downsampled by 2**n, and detect_pyramid maps its
+    detections back to full resolution.
+    """
+
+    def __init__(self, detail_key: str, name: str, version: str, level: int = 0):
+        self.detail_key = detail_key
+        self.name = name
+        self.version = version
+        self.level = level
+
+    @property
+    def version_tag(self) -> str:
+        """Identifies the detector and its version in stored results and cache keys"""
+        return f"{self.name}:{self.version}"
+
+    def detect(self, context) -> DetectionSet:
+        """
+        Detect objects in one image
+
+        Args:
+            context: ImageContext of the image
+
+        Returns:
+            Detections in the image's pixel coordinates
+        """
+        raise NotImplementedError
+
+    def detect_batch(self, contexts: List[Any]) -> List[DetectionSet]:
+        """
+        Detect objects in several images or tiles
+
+        Args:
+            contexts: ImageContexts to process
+
+        Returns:
+            One detector output per context, in the same order
+        """
+        return [self.detect(context) for context in contexts]
+
+    def pyramid_level(self, contexts: List[Any]) -> int:
+        """
+        Pyramid level to run at, backing off for contexts too small for self.level
+
+        Args:
+            contexts: ImageContexts about to be processed
+
+        Returns:
+            Level shared by the whole batch
+        """
+        if self.level <= 0 or not contexts:
+            return 0
+        short_edge = min(min(context.shape[:2]) for context in contexts)
+        level = self.level
+        while level > 0 and short_edge >> level < PYRAMID_MIN_DIMENSION:
+            level -= 1
+        return level
+
+    def detect_pyramid(self, contexts: List[Any]) -> List[DetectionSet]:
+        """
+        Run detect_batch at the detector's pyramid level
+
+        The levels are cached on each context, so detectors sharing a level
+        share one downsampled image.
+
+        Args:
+            contexts: Full resolution ImageContexts
+
+        Returns:
+            One detector output per context, in full resolution pixel coordinates
+        """
+        level = self.pyramid_level(contexts)
+        if level == 0:
+            return self.detect_batch(contexts)
+
+        factor = 2 ** level
+        outputs = self.detect_batch([context.level(level) for context in contexts])
+        return [output.scale(factor, measurements=True) for output in outputs]
+
+class HeuristicDetector(Detector):
+    """
+    Detector backed by a plain function of an ImageContext
+
+    The function returns a DetectionSet, or a dictionary with a "locations"
+    list of detection dictionaries that is converted on the way out.
+    """
+
+    def __init__(
+        self,
+        detail_key: str,
+        name: str,
+        function: Callable[[Any], Dict[str, Any]],
+        version: str,
+        level: int = 0
+    ):
+        super().__init__(detail_key, name, version, level)
+        self.function = function
+
+    def detect(self, context) -> DetectionSet:
+        output = self.function(context)
+        if isinstance(output, DetectionSet):
+            return output
+        return DetectionSet.from_dicts(self.detail_key, output["locations"])
+
+# Models loaded in this process, keyed by path; each has a lock because an
+# OpenCV DNN net must not run two forward passes at once
+_nets: Dict[str, Tuple[Any, threading.Lock]] = {}
+_nets_lock = threading.Lock()
+
+def load_net(model_path: str):
+    """
+    Load an ONNX model once per process and keep it warm
+
+    Args:
+        model_path: Path to the ONNX file
+
+    Returns:
+        Tuple of (cv2.dnn.Net, lock guarding its forward calls)
+    """
+    with _nets_lock:
+        if model_path not in _nets:
+            logger.info(f"Loading detection model {model_path}")
+            net = cv2.dnn.readNetFromONNX(model_path)
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            _nets[model_path] = (net, threading.Lock())
+        return _nets[model_path]
+
+class DnnDetector(Detector):
+    """
+    CPU model run through OpenCV DNN that outputs a grid of objectness scores
+
+    The model takes a (N, 3, input_size, input_size) batch scaled to [0, 1] and
+    returns (N, 1, grid, grid) scores. Connected cells above score_threshold
+    become one detection each, mapped back to image pixels.
+    """
+
+    def __init__(
+        self,
+        detail_key: str,
+        name: str,
+        model_path: str,
+        version: str,
+        input_size: int = 256,
+        score_threshold: float = 0.5,
+        max_batch: int = DNN_MAX_BATCH,
+        level: int = 0
+    ):
+        super().__init__(detail_key, name, version, level)
+        self.model_path = str(model_path)
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+        self.max_batch = max_batch
+
+    def detect(self, context) -> DetectionSet:
+        return self.detect_batch([context])[0]
+
+    def detect_batch(self, contexts: List[Any]) -> List[DetectionSet]:
+        net, lock = load_net(self.model_path)
+        outputs = []
+
+        for start in range(0, len(contexts), self.max_batch):
+            chunk = contexts[start:start + self.max_batch]
+            blob = cv2.dnn.blobFromImages(
+                [context.rgb for context in chunk],
+                scalefactor=1.0 / 255.0,
+                size=(self.input_size, self.input_size)
+            )
+            with lock:
+                net.setInput(blob)
+                scores = net.forward()
+
+            for context, grid in zip(chunk, scores):
+                outputs.append(self._decode(grid[0], context.shape))
+
+        return outputs
+
+    def _decode(self, grid: np.ndarray, shape: Tuple[int, ...]) -> DetectionSet:
+        height, width = shape[:2]
+        scale = np.array(
+            [width / grid.shape[1], height / grid.shape[0]] * 2, dtype=np.float64
+        )
+
+        mask = (grid > self.score_threshold).astype(np.uint8)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if count <= 1:
+            return DetectionSet.empty(self.detail_key)
+
+        # Highest score inside each component, computed for all components at once
+        peak = np.zeros(count, dtype=np.float32)
+        np.maximum.at(peak, labels.ravel(), grid.ravel())
+
+        # Component boxes in grid cells, mapped to image pixels for all components at once
+        x, y, w, h = (stats[1:, i].astype(np.float64) for i in range(4))
+        bbox = np.floor(np.column_stack((x, y, x + w, y + h)) * scale)
+        box_w = bbox[:, 2] - bbox[:, 0]
+        box_h = bbox[:, 3] - bbox[:, 1]
+        return DetectionSet.from_columns(
+            self.detail_key,
+            confidence=peak[1:],
+            bbox=bbox,
+            center=np.floor((bbox[:, :2] + bbox[:, 2:]) / 2),
+            width=box_w,
+            height=box_h,
+            area=box_w * box_h
+        )
+
+# Registered detectors: detail key -> backend name -> detector
+_registry: Dict[str, Dict[str, Detector]] = {}
+
+def register_detector(detector: Detector) -> None:
+    """
+    Make a detector available for its object class
+
+    Args:
+        detector: Detector to register; replaces one with the same name
+    """
+    _registry.setdefault(detector.detail_key, {})[detector.name] = detector
+
+def get_detector(detail_key: str, name: Optional[str] = None) -> Detector:
+    """
+    Look up a registered detector
+
+    Args:
+        detail_key: Object class, e.g. "aircraft"
+        name: Backend name, defaults to DEFAULT_BACKEND
+
+    Returns:
+        The registered detector
+
+    Raises:
+        KeyError: If no such detector is registered
+    """
+    return _registry[detail_key][name or DEFAULT_BACKEND]
+
+def available_detectors() -> Dict[str, List[str]]:
+    """
+    List the registered backends of every object class
+
+    Returns:
+        Backend names keyed by detail key
+    """
+    return {key: sorted(detectors) for key, detectors in _registry.items()}
+
+def validate_backends(backends: Optional[Dict[str, str]]) -> Optional[str]:
+    """
+    Check a detail key -> backend name mapping against the registry
+
+    Args:
+        backends: Mapping from user settings or a request
+
+    Returns:
+        Error message, or None if every entry names a registered detector
+    """
+    if backends is None:
+        return None
+    if not isinstance(backends, dict):
+        return "detector_backends must be an object"
+    available = available_detectors()
+    for key, name in backends.items():
+        if key not in available:
+            return f"Unknown object class: {key}"
+        if name not in available[key]:
+            return f"Unknown detector '{name}' for {key}; available: {', '.join(available[key])}"
+    return None
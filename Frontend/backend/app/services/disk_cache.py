@@ -0,0 +1,146 @@
+"""
+Size-bounded on-disk store with least-recently-used eviction
+Shared by the caches that keep one file per entry and may be used by several worker processes
+"""
+import os
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class DiskCache:
+    """
+    One file per entry, named <key><suffix>, in a single directory
+
+    Writes are atomic, so several worker processes can share one directory.
+    Reads refresh the file's mtime, and once the directory grows past
+    max_bytes the entries with the oldest mtime are removed.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, suffix: str):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        # Running estimate of the store size; a directory scan only happens
+        # when it crosses max_bytes
+        self._disk_bytes: Optional[int] = None
+
+    def path(self, key: str) -> Path:
+        """File holding the entry for key"""
+        return self.directory / f"{key}{self.suffix}"
+
+    def read(self, key: str) -> Optional[bytes]:
+        """
+        Read an entry and mark it as recently used
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Stored bytes, or None on a miss
+        """
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        self.touch(key)
+        return data
+
+    def touch(self, key: str) -> None:
+        """Record an access to an entry for LRU eviction"""
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+
+    def write(self, key: str, data: bytes) -> Optional[Path]:
+        """
+        Store an entry, evicting old entries if the store grows too large
+
+        Args:
+            key: Cache key
+            data: Bytes to store
+
+        Returns:
+            Path of the stored entry, or None if it could not be written
+        """
+        path = self.path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._atomic_write(path, data)
+
+            if self._disk_bytes is None or self._disk_bytes + len(data) > self.max_bytes:
+                self.evict()
+            else:
+                self._disk_bytes += len(data)
+            return path
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {path}: {str(e)}")
+            return None
+
+    def _atomic_write(self, path: Path, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def forget(self, key: str) -> None:
+        """Called when an entry leaves the directory, for subclasses holding their own copies"""
+
+    def evict(self) -> int:
+        """
+        Remove least recently used entries until the store fits in max_bytes
+
+        Returns:
+            Number of entries removed
+        """
+        entries = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self.forget(path.name[:-len(self.suffix)])
+            total -= size
+            removed += 1
+
+        self._disk_bytes = total
+        if removed:
+            logger.info(f"Evicted {removed} entries from {self.directory}")
+        return removed
+
+    def remove(self, key: str) -> None:
+        """Drop a single entry"""
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+        self.forget(key)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        self._disk_bytes = None
+        if self.directory.exists():
+            for path in self.directory.glob(f"*{self.suffix}"):
+                path.unlink(missing_ok=True)
+                self.forget(path.name[:-len(self.suffix)])
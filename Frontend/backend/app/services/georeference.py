@@ -0,0 +1,226 @@
+"""
+Geo-referencing of detection results
+Maps pixel coordinates to longitude/latitude through a raster's affine transform and CRS
+"""
+import os
+import math
+import logging
+from typing import List, Optional, Sequence
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.errors import RasterioIOError
+from rasterio.transform import Affine
+from rasterio.warp import transform as warp_transform
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Coordinate system of GeoJSON output
+WGS84 = CRS.from_epsg(4326)
+
+# Ground resolution assumed for fetched imagery, which carries no georeferencing
+FETCHED_IMAGE_RESOLUTION_M = float(os.getenv('FETCHED_IMAGE_RESOLUTION_M', 1.0))
+
+# Metres per degree of latitude, and of longitude at the equator
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+
+# Decimal places kept in output coordinates (about 1 cm)
+COORDINATE_PRECISION = 7
+
+class GeoReference:
+    """
+    Affine transform from pixel (column, row) to CRS coordinates
+
+    Pixel coordinates refer to pixel corners, as rasterio's transforms do,
+    so a bbox [x1, y1, x2, y2] maps to the outer edges of its pixels.
+    """
+
+    def __init__(self, transform: Affine, crs: CRS, pixel_size_m: float):
+        self.transform = transform
+        self.crs = crs
+        self.pixel_size_m = pixel_size_m
+
+    @classmethod
+    def from_raster(cls, image_path: str) -> Optional["GeoReference"]:
+        """
+        Read the georeferencing of a raster file, e.g. a GeoTIFF
+
+        Args:
+            image_path: Path to the raster
+
+        Returns:
+            GeoReference, or None if the file is not georeferenced
+        """
+        try:
+            with rasterio.open(image_path) as dataset:
+                if dataset.crs is None or dataset.transform.is_identity:
+                    return None
+                transform, crs = dataset.transform, dataset.crs
+                center = transform * (dataset.width / 2, dataset.height / 2)
+        except RasterioIOError:
+            return None
+
+        pixel_size = math.sqrt(abs(transform.determinant))
+        if crs.is_geographic:
+            # Degrees per pixel; take the geometric mean of both axes at the scene center
+            pixel_size_m = pixel_size * math.sqrt(
+                METERS_PER_DEGREE_LAT * METERS_PER_DEGREE_LON * math.cos(math.radians(center[1]))
+            )
+        else:
+            pixel_size_m = pixel_size * (crs.linear_units_factor[1] if crs.linear_units_factor else 1.0)
+        return cls(transform, crs, pixel_size_m)
+
+    @classmethod
+    def from_center(
+        cls,
+        latitude: float,
+        longitude: float,
+        width: int,
+        height: int,
+        resolution_m: float = FETCHED_IMAGE_RESOLUTION_M
+    ) -> "GeoReference":
+        """
+        Footprint of a north-up image centered on a location
+
+        Args:
+            latitude: Latitude of the image center
+            longitude: Longitude of the image center
+            width: Image width in pixels
+            height: Image height in pixels
+            resolution_m: Ground size of one pixel in metres
+
+        Returns:
+            GeoReference in WGS84 degrees
+        """
+        degrees_lat = resolution_m / METERS_PER_DEGREE_LAT
+        degrees_lon = resolution_m / (METERS_PER_DEGREE_LON * max(math.cos(math.radians(latitude)), 1e-6))
+        transform = Affine(
+            degrees_lon, 0.0, longitude - width / 2 * degrees_lon,
+            0.0, -degrees_lat, latitude + height / 2 * degrees_lat
+        )
+        return cls(transform, WGS84, resolution_m)
+
+    def to_lonlat(self, points: np.ndarray) -> np.ndarray:
+        """
+        Convert pixel coordinates to longitude/latitude in one vectorized pass
+
+        Args:
+            points: Array of shape (N, 2) with (x, y) pixel coordinates
+
+        Returns:
+            Array of shape (N, 2) with (longitude, latitude) rows
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        t = self.transform
+        xs = t.a * points[:, 0] + t.b * points[:, 1] + t.c
+        ys = t.d * points[:, 0] + t.e * points[:, 1] + t.f
+
+        if self.crs != WGS84 and len(points):
+            xs, ys = warp_transform(self.crs, WGS84, xs, ys)
+
+        return np.column_stack((xs, ys))
+
+    def to_pixels(self, points: np.ndarray) -> np.ndarray:
+        """
+        Convert longitude/latitude to pixel coordinates, the inverse of to_lonlat
+
+        Args:
+            points: Array of shape (N, 2) with (longitude, latitude) rows
+
+        Returns:
+            Array of shape (N, 2) with (x, y) pixel coordinates
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xs, ys = points[:, 0], points[:, 1]
+        if self.crs != WGS84 and len(points):
+            xs, ys = warp_transform(WGS84, self.crs, xs, ys)
+            xs, ys = np.asarray(xs), np.asarray(ys)
+
+        t = ~self.transform
+        return np.column_stack((t.a * xs + t.b * ys + t.c, t.d * xs + t.e * ys + t.f))
+
+    def pixel_bbox(self, bbox: Sequence[float]) -> List[float]:
+        """
+        Pixel box covering a longitude/latitude box
+
+        Args:
+            bbox: [min_lon, min_lat, max_lon, max_lat]
+
+        Returns:
+            [x1, y1, x2, y2] bounding the box's corners in pixel coordinates
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        corners = self.to_pixels(np.array([
+            [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat]
+        ]))
+        return [*corners.min(axis=0).tolist(), *corners.max(axis=0).tolist()]
+
+def resolve_georeference(
+    image_path: str,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    shape: Optional[Sequence[int]] = None
+) -> Optional[GeoReference]:
+    """
+    Find the georeferencing of an image
+
+    The raster's own transform wins; otherwise imagery fetched for a location
+    is assumed to be a north-up footprint centered on it.
+
+    Args:
+        image_path: Path to the image
+        latitude: Latitude the image was fetched for
+        longitude: Longitude the image was fetched for
+        shape: Image (height, width), read from the file when omitted
+
+    Returns:
+        GeoReference, or None when neither source is available
+    """
+    georef = GeoReference.from_raster(image_path)
+    if georef is not None or latitude is None or longitude is None:
+        return georef
+
+    if shape is None:
+        try:
+            with rasterio.open(image_path) as dataset:
+                shape = (dataset.height, dataset.width)
+        except RasterioIOError:
+            logger.warning(f"Could not read the size of {image_path}")
+            return None
+
+    return GeoReference.from_center(float(latitude), float(longitude), shape[1], shape[0])
+
+def georeference_paths(
+    georef: Optional[GeoReference],
+    points: np.ndarray,
+    offsets: Optional[np.ndarray] = None,
+    precision: Optional[int] = None
+) -> List:
+    """
+    Convert the points of a whole feature class with a single transform call
+
+    Args:
+        georef: Georeferencing, or None to keep pixel coordinates
+        points: Array of shape (N, 2) with the points of all features
+        offsets: Ragged offsets; feature i owns points[offsets[i]:offsets[i + 1]].
+            Without offsets every point is its own feature
+        precision: Decimal places kept; defaults to COORDINATE_PRECISION for
+            longitude/latitude and 3 for pixels
+
+    Returns:
+        List of [x, y] points, or of point lists when offsets are given
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if georef is not None and len(points):
+        points = np.round(georef.to_lonlat(points), COORDINATE_PRECISION if precision is None else precision)
+    else:
+        points = np.round(points, 3 if precision is None else precision)
+
+    # One conversion to Python lists, then cheap slicing per feature
+    flat = points.tolist()
+    if offsets is None:
+        return flat
+    bounds = np.asarray(offsets).tolist()
+    return [flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
@@ -1,10 +1,31 @@
 import os
+import time
+import asyncio
+import hashlib
+import shutil
+import uuid
 import logging
 import aiofiles
 import httpx
 from pathlib import Path
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
+
+from app.services.http_client import imagery_client
+from app.services.single_flight import SingleFlight
+from app.services.synthetic_scene import generate_scene
+from app.services.imagery_cache import (
+    imagery_cache,
+    make_imagery_key,
+    tile_index,
+    tile_center,
+    is_fresh,
+    conditional_headers,
+    response_meta,
+    CONTENT_EXTENSIONS,
+    IMAGERY_CACHE_DIR
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -13,65 +34,179 @@ logger = logging.getLogger(__name__)
 IMAGES_DIR = Path("./images")
 IMAGES_DIR.mkdir(exist_ok=True)
 
-async def fetch_satellite_image(latitude: float, longitude: float, analysis_id: int) -> str:
+# Imagery provider settings. The URL is a template that may use the tile
+# ({z}, {x}, {y}), its center ({lat}, {lon}) and the acquisition {date}
+IMAGERY_PROVIDER = os.getenv('IMAGERY_PROVIDER', 'placeholder')
+IMAGERY_URL = os.getenv('IMAGERY_URL', 'https://api.placeholder.com/1024x1024')
+# Zoom level of the tile grid fetched locations are snapped to
+IMAGERY_ZOOM = int(os.getenv('IMAGERY_ZOOM', 18))
+# Whether fetches of the same tile are also deduplicated across worker processes
+IMAGERY_CROSS_PROCESS_LOCKS = os.getenv('IMAGERY_CROSS_PROCESS_LOCKS', 'true').lower() == 'true'
+# Edge of the synthetic images generated when imagery cannot be fetched
+SYNTHETIC_IMAGE_SIZE = int(os.getenv('SYNTHETIC_IMAGE_SIZE', 1024))
+
+# Deduplicates concurrent fetches of the same tile
+imagery_flights = SingleFlight(IMAGERY_CACHE_DIR / "locks" if IMAGERY_CROSS_PROCESS_LOCKS else None)
+
+async def fetch_satellite_image(
+    latitude: float,
+    longitude: float,
+    analysis_id: int,
+    acquisition_date: Optional[date] = None,
+    zoom: int = IMAGERY_ZOOM,
+    provider: str = IMAGERY_PROVIDER
+) -> str:
     """
     Fetch a satellite image for the given coordinates.
     
-    In a production environment, this would use a real satellite imagery API.
-    For this implementation, we'll use a placeholder approach.
+    The location is snapped to a tile of the zoom level's grid, and imagery
+    is cached per provider, acquisition date and tile. Fresh entries are
+    served from disk; stale ones are revalidated with a conditional request.
+    Each fetch gets its own hard link to the cached file, so the image is
+    stored once however many analyses and runs use it, and a later download
+    never changes an earlier run's image. Concurrent fetches of one tile, in this
+    or another worker process, wait for a single download.
     
     Args:
         latitude: Latitude coordinate
         longitude: Longitude coordinate
         analysis_id: ID of the analysis
+        acquisition_date: Date of the imagery, or None for the latest
+        zoom: Zoom level of the tile grid
+        provider: Imagery provider name
         
     Returns:
         Path to the downloaded image, or None if the download failed
     """
     try:
-        # In a real implementation, this would call a satellite imagery API
-        # For example: Google Earth Engine, Sentinel Hub, Planet, etc.
-        
-        # For this implementation, we'll use a placeholder approach:
-        # 1. Generate a unique filename based on coordinates and analysis ID
-        # 2. Download a placeholder satellite image or generate one
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"satellite_{analysis_id}_{timestamp}.jpg"
-        image_path = IMAGES_DIR / filename
-        
-        # For demo purposes, download a placeholder satellite image
-        # In a real app, this would be replaced with an actual API call
-        placeholder_url = "https://api.placeholder.com/1024x1024"
-        
-        # Use httpx for async HTTP requests
-        async with httpx.AsyncClient() as client:
-            try:
-                # Try to download from placeholder service
-                response = await client.get(placeholder_url, timeout=30)
-                response.raise_for_status()
-                
-                # Save the image
-                async with aiofiles.open(image_path, 'wb') as f:
-                    await f.write(response.content)
-                
-                logger.info(f"Downloaded placeholder image for analysis {analysis_id}")
-                return str(image_path)
-                
-            except httpx.HTTPError:
-                # If placeholder service fails, generate a basic image
-                logger.warning(f"Failed to download placeholder, generating synthetic image for analysis {analysis_id}")
-                return await generate_synthetic_satellite_image(latitude, longitude, image_path)
+        latitude, longitude = float(latitude), float(longitude)
+        key = make_imagery_key(latitude, longitude, zoom, acquisition_date, provider)
+        x, y = tile_index(latitude, longitude, zoom)
+        center_latitude, center_longitude = tile_center(zoom, x, y)
+        url = IMAGERY_URL.format(
+            lat=center_latitude,
+            lon=center_longitude,
+            z=zoom,
+            x=x,
+            y=y,
+            date=acquisition_date.isoformat() if acquisition_date is not None else "latest"
+        )
+        
+        # Concurrent requests for the same tile share one download
+        cached_path = await imagery_flights.do(
+            key, lambda: fetch_cached_imagery(key, url, provider, immutable=acquisition_date is not None)
+        )
+        # Every fetch gets a file of its own, so images processed earlier keep
+        # their pixels and detection sidecars
+        name = f"satellite_{analysis_id}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}"
+        if cached_path is not None:
+            return str(link_image(cached_path, name))
+        
+        # If the provider fails, generate a basic image
+        logger.warning(f"Failed to download imagery, generating synthetic image for analysis {analysis_id}")
+        image_path = IMAGES_DIR / f"{name}.jpg"
+        return await generate_synthetic_satellite_image(latitude, longitude, image_path)
                 
     except Exception as e:
         logger.exception(f"Error fetching satellite image: {str(e)}")
         return None
 
+async def fetch_cached_imagery(
+    key: str,
+    url: str,
+    provider: str = IMAGERY_PROVIDER,
+    immutable: bool = False
+) -> Optional[Path]:
+    """
+    Get imagery through the imagery cache
+    
+    Downloads go through the shared imagery client, which pools connections
+    and retries transient failures.
+    
+    Args:
+        key: Cache key, e.g. from make_imagery_key
+        url: Provider URL of the imagery
+        provider: Imagery provider name
+        immutable: Whether the imagery never changes, e.g. for a fixed acquisition date
+        
+    Returns:
+        Path of the image, or None if it could not be downloaded
+    """
+    meta = imagery_cache.read_meta(key)
+    if meta is not None and is_fresh(meta):
+        imagery_cache.touch(key)
+        return imagery_cache.path(key)
+    
+    try:
+        response = await imagery_client.get(url, provider, headers=conditional_headers(meta))
+        if response.status_code == 304 and meta is not None:
+            meta["fetched_at"] = time.time()
+            imagery_cache.write_meta(key, meta)
+            imagery_cache.touch(key)
+            logger.info(f"Revalidated cached imagery {key}")
+            return imagery_cache.path(key)
+        response.raise_for_status()
+        if response.status_code != 200:
+            raise httpx.HTTPStatusError(
+                f"Unexpected status {response.status_code}", request=response.request, response=response
+            )
+    except httpx.HTTPError as e:
+        if meta is not None:
+            logger.warning(f"Failed to revalidate imagery {key}, serving the cached copy: {str(e)}")
+            return imagery_cache.path(key)
+        logger.warning(f"Failed to download imagery {key}: {str(e)}")
+        return None
+    
+    meta = response_meta(response.headers, immutable)
+    path = imagery_cache.store(key, response.content, meta)
+    if path is None:
+        # Cache not writable; keep the download outside of it
+        path = IMAGES_DIR / f"{key}{CONTENT_EXTENSIONS.get(meta['content_type'], '.jpg')}"
+        # Replaced rather than overwritten, as earlier fetches link the old file
+        temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        async with aiofiles.open(temporary, 'wb') as f:
+            await f.write(response.content)
+        os.replace(temporary, path)
+    logger.info(f"Downloaded imagery {key}")
+    return path
+
+def link_image(source: Path, name: str) -> Path:
+    """
+    Give a cached image its own name in IMAGES_DIR
+    
+    The file is hard-linked where possible, so evicting or replacing the
+    cache entry leaves the linked image in place without storing it twice.
+    
+    Args:
+        source: Path of the cached image
+        name: File name without extension
+        
+    Returns:
+        Path of the image in IMAGES_DIR
+    """
+    source = Path(source)
+    meta = imagery_cache.read_meta(source.name[:-len(imagery_cache.suffix)]) or {}
+    target = IMAGES_DIR / f"{name}{CONTENT_EXTENSIONS.get(meta.get('content_type'), '.jpg')}"
+    if target.exists() and os.path.samefile(source, target):
+        return target
+    
+    temporary = target.with_name(target.name + ".tmp")
+    temporary.unlink(missing_ok=True)
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    os.replace(temporary, target)
+    return target
+
 async def generate_synthetic_satellite_image(latitude: float, longitude: float, image_path: Path) -> str:
     """
     Generate a synthetic satellite image for testing purposes.
     
+    The scene is seeded from the coordinates, so the same location always
+    produces the same image. Locations north of the equator get a runway
+    with parked aircraft (just for demo).
+    
     Args:
         latitude: Latitude coordinate
         longitude: Longitude coordinate
@@ -81,65 +216,16 @@ async def generate_synthetic_satellite_image(latitude: float, longitude: float,
         Path to the generated image
     """
     try:
-        # Import PIL here to avoid circular imports
-        from PIL import Image, ImageDraw
-        
-        # Create a blank image (1024x1024 pixels)
-        width, height = 1024, 1024
-        image = Image.new('RGB', (width, height), color='#1a5276')  # Dark blue base color
-        
-        # Get a drawing context
-        draw = ImageDraw.Draw(image)
-        
-        # Use latitude and longitude to seed some random patterns
-        # This ensures the same coordinates always produce the same image
-        import random
-        seed = int(abs(latitude * 100) + abs(longitude * 100))
-        random.seed(seed)
-        
-        # Draw some land masses (greenish)
-        for _ in range(5):
-            x1 = random.randint(0, width)
-            y1 = random.randint(0, height)
-            x2 = x1 + random.randint(100, 400)
-            y2 = y1 + random.randint(100, 400)
-            draw.ellipse([x1, y1, x2, y2], fill='#2ecc71', outline='#27ae60')
-        
-        # Add some roads or rivers (gray lines)
-        for _ in range(10):
-            x1 = random.randint(0, width)
-            y1 = random.randint(0, height)
-            x2 = random.randint(0, width)
-            y2 = random.randint(0, height)
-            draw.line([x1, y1, x2, y2], fill='#95a5a6', width=3)
-        
-        # Add some buildings (small white rectangles)
-        for _ in range(50):
-            x = random.randint(0, width)
-            y = random.randint(0, height)
-            size = random.randint(5, 15)
-            draw.rectangle([x, y, x+size, y+size], fill='#ecf0f1')
-        
-        # Add an airport runway if latitude is positive (just for demo)
-        if latitude > 0:
-            center_x = width // 2
-            center_y = height // 2
-            runway_length = 300
-            runway_width = 30
-            draw.rectangle(
-                [center_x - runway_width//2, center_y - runway_length//2,
-                 center_x + runway_width//2, center_y + runway_length//2],
-                fill='#7f8c8d'
-            )
-            
-            # Add a few aircraft near the runway
-            for _ in range(3):
-                x = center_x + random.randint(-100, 100)
-                y = center_y + random.randint(-150, 150)
-                draw.ellipse([x-5, y-5, x+5, y+5], fill='#e74c3c')
-        
-        # Save the image
-        image.save(image_path)
+        digest = hashlib.sha256(f"{latitude:.6f},{longitude:.6f}".encode("utf-8")).digest()
+        scene = generate_scene(
+            SYNTHETIC_IMAGE_SIZE,
+            SYNTHETIC_IMAGE_SIZE,
+            seed=int.from_bytes(digest[:8], "little"),
+            runways=1 if latitude > 0 else 0
+        )
+        
+        # Rendering is CPU-bound; keep it off the event loop
+        await asyncio.to_thread(scene.save, str(image_path))
         logger.info(f"Generated synthetic satellite image at {image_path}")
         
         return str(image_path)
@@ -147,36 +233,3 @@ async def generate_synthetic_satellite_image(latitude: float, longitude: float,
     except Exception as e:
         logger.exception(f"Error generating synthetic image: {str(e)}")
         return None
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Calculate the Haversine distance between two points.
-    
-    Args:
-        lat1: Latitude of first point
-        lon1: Longitude of first point
-        lat2: Latitude of second point
-        lon2: Longitude of second point
-        
-    Returns:
-        Distance in kilometers
-    """
-    # Implementation of the Haversine formula
-    from math import radians, sin, cos, sqrt, atan2
-    
-    # Convert latitude and longitude from degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    
-    # Radius of earth in kilometers
-    radius = 6371.0
-    
-    # Calculate the distance
-    distance = radius * c
-    
-    return distance
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+Shared HTTP client for imagery providers
+Pools connections per event loop, limits concurrency per provider, retries with jittered backoff and trips a circuit breaker on failing providers
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict, Any, Optional
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Connection pool settings
+IMAGERY_MAX_CONNECTIONS = int(os.getenv('IMAGERY_MAX_CONNECTIONS', 20))
+IMAGERY_MAX_KEEPALIVE = int(os.getenv('IMAGERY_MAX_KEEPALIVE', 10))
+IMAGERY_KEEPALIVE_EXPIRY = 30.0
+IMAGERY_HTTP2 = os.getenv('IMAGERY_HTTP2', 'true').lower() == 'true'
+
+# Timeouts in seconds
+IMAGERY_CONNECT_TIMEOUT = float(os.getenv('IMAGERY_CONNECT_TIMEOUT', 5.0))
+IMAGERY_READ_TIMEOUT = float(os.getenv('IMAGERY_READ_TIMEOUT', 30.0))
+IMAGERY_POOL_TIMEOUT = float(os.getenv('IMAGERY_POOL_TIMEOUT', 10.0))
+
+# Requests in flight per provider
+IMAGERY_PROVIDER_CONCURRENCY = int(os.getenv('IMAGERY_PROVIDER_CONCURRENCY', 4))
+
+# Retry settings; delays are drawn uniformly below an exponentially growing cap
+RETRY_ATTEMPTS = int(os.getenv('IMAGERY_RETRY_ATTEMPTS', 4))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Consecutive failed requests that open a provider's circuit, and the
+# seconds it stays open before a trial request is let through
+BREAKER_THRESHOLD = int(os.getenv('IMAGERY_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.getenv('IMAGERY_BREAKER_COOLDOWN', 30.0))
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised instead of sending a request to a provider whose circuit is open"""
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker
+
+    Closed while requests succeed; opens after `threshold` consecutive
+    failures and rejects requests for `cooldown` seconds, then lets one
+    trial request through (half-open), which closes or reopens it.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Start of the trial request while half-open; a trial that never
+        # reports back is replaced after another cooldown
+        self.trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """State of the circuit: closed, open or half_open"""
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            if state == "half_open" and (self.trial_started is None or now - self.trial_started >= self.cooldown):
+                self.trial_started = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.trial_started is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Opening circuit after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self.trial_started = None
+
+class ImageryClient:
+    """
+    Process-wide client for imagery downloads
+
+    httpx clients are bound to the event loop they were created on, so one
+    pooled client is kept per running loop; the circuit breakers and metrics
+    are shared by all of them.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = IMAGERY_MAX_CONNECTIONS,
+        max_keepalive: int = IMAGERY_MAX_KEEPALIVE,
+        concurrency: int = IMAGERY_PROVIDER_CONCURRENCY,
+        attempts: int = RETRY_ATTEMPTS,
+        http2: bool = IMAGERY_HTTP2
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=IMAGERY_KEEPALIVE_EXPIRY
+        )
+        self.timeout = httpx.Timeout(
+            connect=IMAGERY_CONNECT_TIMEOUT,
+            read=IMAGERY_READ_TIMEOUT,
+            write=IMAGERY_READ_TIMEOUT,
+            pool=IMAGERY_POOL_TIMEOUT
+        )
+        self.concurrency = concurrency
+        self.attempts = max(1, attempts)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "rejected": 0,
+            "connect_timeouts": 0,
+            "read_timeouts": 0,
+            "pool_timeouts": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0
+        }
+
+    def client(self) -> httpx.AsyncClient:
+        """Pooled client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            self._clients[loop] = client
+        return client
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """Circuit breaker of a provider"""
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker()
+            return self._breakers[provider]
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(self.concurrency)
+        return semaphores[provider]
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before a retry, with full jitter
+
+        Args:
+            attempt: Number of the failed attempt, from 0
+            retry_after: Delay asked for by the provider, if any
+
+        Returns:
+            Seconds to wait
+        """
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, RETRY_MAX_DELAY))
+        return delay
+
+    async def get(self, url: str, provider: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        GET a URL from a provider, retrying transient failures
+
+        Connection errors, timeouts and 429/5xx responses are retried. When
+        the attempts run out the last response is returned, or the last error
+        raised, and the failure counts towards the provider's circuit.
+
+        Args:
+            url: URL to fetch
+            provider: Provider name, for concurrency limits and the circuit breaker
+            headers: Request headers
+
+        Returns:
+            httpx.Response
+
+        Raises:
+            CircuitOpenError: If the provider's circuit is open
+            httpx.HTTPError: If every attempt failed without a response
+        """
+        breaker = self.breaker(provider)
+        if not breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"Circuit open for imagery provider {provider}")
+
+        client = self.client()
+        semaphore = self._semaphore(provider)
+        response: Optional[httpx.Response] = None
+        error: Optional[httpx.HTTPError] = None
+
+        for attempt in range(self.attempts):
+            response, error, retry_after = None, None, None
+            self._count("waiting")
+            async with semaphore:
+                self._count("waiting", -1)
+                self._count("in_flight")
+                self._count("requests")
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url, headers=headers)
+                except httpx.ConnectTimeout as e:
+                    self._count("connect_timeouts")
+                    error = e
+                except httpx.ReadTimeout as e:
+                    self._count("read_timeouts")
+                    error = e
+                except httpx.PoolTimeout as e:
+                    self._count("pool_timeouts")
+                    error = e
+                except httpx.TransportError as e:
+                    error = e
+                finally:
+                    elapsed = time.perf_counter() - started
+                    self._count("in_flight", -1)
+                    self._count("latency_total", elapsed)
+                    with self._lock:
+                        self._counters["latency_max"] = max(self._counters["latency_max"], elapsed)
+
+            if response is not None:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                try:
+                    retry_after = float(response.headers.get("retry-after", ""))
+                except ValueError:
+                    retry_after = None
+
+            if attempt + 1 < self.attempts:
+                self._count("retries")
+                await asyncio.sleep(self.backoff(attempt, retry_after))
+
+        self._count("failures")
+        breaker.record_failure()
+        if response is not None:
+            return response
+        raise error
+
+    def metrics(self) -> Dict[str, Any]:
+        """Pool settings, timeouts, request counters and circuit states"""
+        with self._lock:
+            counters = dict(self._counters)
+            breakers = {provider: breaker.state for provider, breaker in self._breakers.items()}
+        requests = counters.pop("requests")
+        latency_total = counters.pop("latency_total")
+        return {
+            "pool": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+                "http2": self.http2,
+                "clients": len(self._clients),
+                "provider_concurrency": self.concurrency
+            },
+            "timeouts": {
+                "connect": self.timeout.connect,
+                "read": self.timeout.read,
+                "pool": self.timeout.pool
+            },
+            "requests": int(requests),
+            "latency_mean": latency_total / requests if requests else None,
+            **{name: (int(value) if name != "latency_max" else value) for name, value in counters.items()},
+            "circuits": breakers
+        }
+
+    async def aclose(self) -> None:
+        """Close the client of the running event loop, e.g. before the loop is closed"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+# Client shared by imagery fetches
+imagery_client = ImageryClient()
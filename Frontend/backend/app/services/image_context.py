@@ -0,0 +1,140 @@
+"""
+Per-job image context for the detection pipeline
+Decodes an image once and lazily caches the derived planes every stage reads from
+"""
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+import numpy as np
+import cv2
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def _freeze(array: np.ndarray) -> np.ndarray:
+    """Mark a shared plane read-only so no stage can modify it in place"""
+    array.flags.writeable = False
+    return array
+
+class ImageContext:
+    """
+    Decoded image shared by the detectors and the visualizer of one job
+
+    The image is held in the channel order it was decoded in (BGR from OpenCV,
+    RGB from rasterio) and every other plane is derived on first access and
+    cached. All planes are read-only; a stage that needs to draw must copy.
+    Planes are derived under a lock so concurrent detectors compute each one once.
+    """
+
+    def __init__(self, bgr: Optional[np.ndarray] = None, rgb: Optional[np.ndarray] = None):
+        if bgr is None and rgb is None:
+            raise ValueError("ImageContext needs a BGR or an RGB image")
+
+        self._bgr = _freeze(bgr) if bgr is not None else None
+        self._rgb = _freeze(rgb) if rgb is not None else None
+        self._gray = None
+        self._binary: Dict[int, np.ndarray] = {}
+        self._levels: Dict[int, "ImageContext"] = {}
+        self._digest = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_path(cls, image_path: str) -> Optional["ImageContext"]:
+        """
+        Decode an image file into a new context
+
+        Args:
+            image_path: Path to the image
+
+        Returns:
+            ImageContext, or None if the image could not be decoded
+        """
+        image = cv2.imread(image_path)
+        if image is None:
+            return None
+        return cls(bgr=image)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the decoded image as (height, width, channels)"""
+        return (self._bgr if self._bgr is not None else self._rgb).shape
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """Image in OpenCV channel order"""
+        with self._lock:
+            if self._bgr is None:
+                self._bgr = _freeze(cv2.cvtColor(self._rgb, cv2.COLOR_RGB2BGR))
+            return self._bgr
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Image in RGB channel order"""
+        with self._lock:
+            if self._rgb is None:
+                self._rgb = _freeze(cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB))
+            return self._rgb
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Single channel luminance plane, converted straight from the decoded order"""
+        with self._lock:
+            if self._gray is None:
+                if self._bgr is not None:
+                    gray = cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY)
+                else:
+                    gray = cv2.cvtColor(self._rgb, cv2.COLOR_RGB2GRAY)
+                self._gray = _freeze(gray)
+            return self._gray
+
+    @property
+    def digest(self) -> str:
+        """Content hash of the pixels in BGR order, independent of how the image was decoded"""
+        with self._lock:
+            if self._digest is None:
+                hasher = hashlib.blake2b(digest_size=20)
+                hasher.update(str(self.shape).encode("utf-8"))
+                hasher.update(memoryview(np.ascontiguousarray(self.bgr)).cast("B"))
+                self._digest = hasher.hexdigest()
+            return self._digest
+
+    def binary(self, threshold: int = 100) -> np.ndarray:
+        """
+        Binary threshold of the grayscale plane
+
+        Args:
+            threshold: Pixels brighter than this become 255
+
+        Returns:
+            Binary uint8 plane
+        """
+        with self._lock:
+            if threshold not in self._binary:
+                _, binary = cv2.threshold(self.gray, threshold, 255, cv2.THRESH_BINARY)
+                self._binary[threshold] = _freeze(binary)
+            return self._binary[threshold]
+
+    def level(self, level: int) -> "ImageContext":
+        """
+        Downsampled pyramid level of this image as its own context
+
+        Level 0 is the image itself; each further level halves both dimensions.
+
+        Args:
+            level: Pyramid level
+
+        Returns:
+            ImageContext for that level
+        """
+        if level <= 0:
+            return self
+
+        with self._lock:
+            if level not in self._levels:
+                parent = self.level(level - 1)
+                if parent._bgr is not None:
+                    self._levels[level] = ImageContext(bgr=cv2.pyrDown(parent._bgr))
+                else:
+                    self._levels[level] = ImageContext(rgb=cv2.pyrDown(parent._rgb))
+            return self._levels[level]
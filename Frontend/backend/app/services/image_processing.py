@@ -1,26 +1,49 @@
-import os
+import atexit
 import logging
 import time
+import asyncio
+import threading
 from datetime import datetime
+from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
 import requests
+import numpy as np
 
-from app.models.analysis import Analysis
-from app.services.object_detection import detect_objects
+from app.models.analysis import Analysis, AnalysisImage
+from app.models.analysis_settings import AnalysisSettings
+from app.services.object_detection import (
+    detect_objects,
+    enabled_detector_versions,
+    get_detection_flags,
+    get_detector_backends,
+    reusable_detail_keys,
+    DETAIL_KEYS
+)
 from app.services.geospatial import fetch_satellite_image
+from app.services.http_client import imagery_client
+from app.services.georeference import GeoReference, resolve_georeference
+from app.services.detections import Detections, sidecar_path
+from app.services.spatial_index import PackedRTree, index_path
+from app.services.timeseries import update_image_stats
 
 logger = logging.getLogger(__name__)
 
+# Event loop of queued processing jobs, see get_processing_loop
+_processing_loop: Optional[asyncio.AbstractEventLoop] = None
+_processing_loop_lock = threading.Lock()
+
 async def process_image(analysis_id: int, db: Session):
     """
     Process a satellite image for the given analysis.
     
     This function:
-    1. Updates the analysis status to "processing"
+    1. Adds an image record with status "processing" to the analysis
     2. Fetches the satellite image for the given coordinates
-    3. Runs object detection on the image
-    4. Updates the analysis with the results
+    3. Runs object detection with the owner's detection settings
+    4. Stores the results like a re-detection does: sidecar, spatial index,
+       summary counts and time-series aggregates
     """
+    image = None
     try:
         # Get the analysis from the database
         analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
@@ -28,8 +51,10 @@ async def process_image(analysis_id: int, db: Session):
             logger.error(f"Analysis {analysis_id} not found")
             return
         
-        # Update status to processing
-        analysis.status = "processing"
+        # Add the image being processed
+        image = AnalysisImage(analysis_id=analysis.id, image_date=datetime.utcnow(), source_type='api')
+        image.status = "processing"
+        db.add(image)
         db.commit()
         
         # Fetch satellite image
@@ -41,39 +66,31 @@ async def process_image(analysis_id: int, db: Session):
         
         if not image_path:
             logger.error(f"Failed to fetch satellite image for analysis {analysis_id}")
-            analysis.status = "failed"
+            image.status = "failed"
             db.commit()
             return
         
-        # Update image URL
-        image_filename = os.path.basename(image_path)
-        analysis.image_url = f"/api/v1/images/{image_filename}"
+        image.image_path = image_path
         db.commit()
         
         # Perform object detection
+        settings = db.query(AnalysisSettings).filter(AnalysisSettings.user_id == analysis.user_id).first()
         detection_results = await detect_objects(
             image_path=image_path,
-            detect_runways=analysis.detect_runways,
-            detect_aircraft=analysis.detect_aircraft,
-            detect_houses=analysis.detect_houses,
-            detect_roads=analysis.detect_roads,
-            detect_water_bodies=analysis.detect_water_bodies
+            backends=get_detector_backends(settings),
+            **get_detection_flags(settings)
         )
         
         if not detection_results:
             logger.error(f"Object detection failed for analysis {analysis_id}")
-            analysis.status = "failed"
+            image.status = "failed"
             db.commit()
             return
         
-        # Update analysis with results
-        analysis.status = "completed"
-        analysis.result_image_url = f"/api/v1/images/{detection_results['result_image_filename']}"
-        analysis.runway_detected = detection_results.get('runway_detected', False)
-        analysis.aircraft_count = detection_results.get('aircraft_count', 0)
-        analysis.house_count = detection_results.get('house_count', 0)
-        analysis.details = detection_results.get('details', {})
-        analysis.analysis_date = datetime.utcnow()
+        # Update the image with the results
+        georef = resolve_georeference(image_path, analysis.latitude, analysis.longitude)
+        apply_detection_results(image, detection_results, georef)
+        update_image_stats(db, image)
         
         db.commit()
         logger.info(f"Analysis {analysis_id} completed successfully")
@@ -81,14 +98,41 @@ async def process_image(analysis_id: int, db: Session):
     except Exception as e:
         logger.exception(f"Error processing analysis {analysis_id}: {str(e)}")
         
-        # Update analysis status to failed
+        # Update image status to failed
         try:
-            analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
-            if analysis:
-                analysis.status = "failed"
+            db.rollback()
+            if image is not None and image.id is not None:
+                image.status = "failed"
                 db.commit()
         except Exception as db_error:
-            logger.exception(f"Error updating analysis status: {str(db_error)}")
+            logger.exception(f"Error updating image status: {str(db_error)}")
+
+def get_processing_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the event loop that runs queued image processing, starting it on first use
+    
+    The loop lives on a daemon thread for the whole process, so the pooled
+    imagery client bound to it keeps its connections from job to job.
+    
+    Returns:
+        Running event loop shared by processing jobs
+    """
+    global _processing_loop
+    with _processing_loop_lock:
+        if _processing_loop is None:
+            _processing_loop = asyncio.new_event_loop()
+            threading.Thread(target=_processing_loop.run_forever, name="image-processing", daemon=True).start()
+            atexit.register(shutdown_processing_loop)
+        return _processing_loop
+
+def shutdown_processing_loop() -> None:
+    """Close the processing loop's pooled imagery client and stop the loop, e.g. at shutdown"""
+    global _processing_loop
+    with _processing_loop_lock:
+        loop, _processing_loop = _processing_loop, None
+    if loop is not None:
+        asyncio.run_coroutine_threadsafe(imagery_client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
 
 def queue_image_processing(analysis_id: int, db: Session):
     """
@@ -103,20 +147,190 @@ def queue_image_processing(analysis_id: int, db: Session):
         time.sleep(1)
         
         # For now, process directly (in a real app, this would be handled by a worker)
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(process_image(analysis_id, db))
-        loop.close()
+        asyncio.run_coroutine_threadsafe(process_image(analysis_id, db), get_processing_loop()).result()
         
     except Exception as e:
         logger.exception(f"Error queuing image processing task: {str(e)}")
+
+def apply_detection_results(
+    image: AnalysisImage,
+    results: Dict[str, Any],
+    georef: Optional[GeoReference] = None
+) -> None:
+    """
+    Copy detect_objects results onto an AnalysisImage row
+    
+    The details are written to a binary sidecar next to the image, along with
+    a spatial index over them; the row keeps the summary counts and the
+    sidecar's path.
+    
+    Args:
+        image: Image to update
+        results: Dictionary returned by detect_objects
+        georef: Georeferencing of the image, used to store runway sizes in metres
+    """
+    details = Detections.from_details(results.get('details') or {})
+    image.runway_detected = results.get('runway_detected', False)
+    
+    # Longest runway, converted to metres when the image is georeferenced
+    runways = details.get('runways')
+    lengths = runways.records['length'] if runways is not None and len(runways) else np.empty(0)
+    if georef is not None and np.any(~np.isnan(lengths)):
+        longest = runways.records[np.nanargmax(lengths)]
+        image.runway_length = float(longest['length']) * georef.pixel_size_m
+        image.runway_width = float(longest['runway_width']) * georef.pixel_size_m
+    else:
+        image.runway_length = None
+        image.runway_width = None
+    
+    image.aircraft_count = results.get('aircraft_count', 0)
+    image.house_count = results.get('house_count', 0)
+    image.road_count = results.get('road_count', 0)
+    image.water_body_count = results.get('water_body_count', 0)
+    
+    image.details_path = sidecar_path(image.image_path)
+    details.save(image.details_path)
+    PackedRTree.build(details).save(index_path(image.image_path))
+    
+    image.detector_versions = results.get('detector_versions', {})
+    image.processing_date = datetime.utcnow()
+    image.status = "completed"
+
+def load_image_details(image: AnalysisImage) -> Optional[Detections]:
+    """
+    Read the stored detection details of an image
+    
+    Args:
+        image: Processed image
+        
+    Returns:
+        Detections, or None if the image has not been processed
+    """
+    if not image.details_path:
+        return None
+    return Detections.load(image.details_path)
+
+def load_image_index(image: AnalysisImage, details: Detections) -> PackedRTree:
+    """
+    Read the spatial index of an image's detections
+    
+    Images processed before indexes were stored get theirs built and saved
+    on first use.
+    
+    Args:
+        image: Processed image
+        details: The image's detections, as returned by load_image_details
         
-        # Update analysis status to failed
+    Returns:
+        PackedRTree over details
+    """
+    index = PackedRTree.load(index_path(image.image_path))
+    if index is None or len(index) != sum(len(detections) for detections in details.values()):
+        index = PackedRTree.build(details)
         try:
-            analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
-            if analysis:
-                analysis.status = "failed"
-                db.commit()
-        except Exception as db_error:
-            logger.exception(f"Error updating analysis status: {str(db_error)}")
\ No newline at end of file
+            index.save(index_path(image.image_path))
+        except OSError as e:
+            logger.warning(f"Failed to save spatial index for image {image.id}: {str(e)}")
+    return index
+
+def needs_redetection(
+    image: AnalysisImage,
+    flags: Dict[str, bool],
+    backends: Optional[Dict[str, str]] = None
+) -> bool:
+    """
+    Check whether an image's stored details differ from what these settings would produce
+    
+    Args:
+        image: Processed image
+        flags: detect_* flags, e.g. from get_detection_flags
+        backends: Detector name per object class, e.g. from get_detector_backends
+        
+    Returns:
+        True if a detector must run or a disabled class must be dropped
+    """
+    enabled = {key: flags[f"detect_{key}"] for key in DETAIL_KEYS}
+    versions = enabled_detector_versions(enabled, backends)
+    reusable = reusable_detail_keys(versions, load_image_details(image), image.detector_versions)
+    wanted = set(versions)
+    stored = set(image.detector_versions or {})
+    return set(reusable) != wanted or stored != wanted
+
+async def redetect_image(
+    image_id: int,
+    flags: Dict[str, bool],
+    db: Session,
+    backends: Optional[Dict[str, str]] = None
+):
+    """
+    Bring a processed image up to date with new detection settings
+    
+    Stored details of classes that are still enabled and whose detector is
+    unchanged are kept; only newly enabled or outdated detectors run.
+    
+    Args:
+        image_id: ID of the AnalysisImage
+        flags: detect_* flags, e.g. from get_detection_flags
+        db: Database session
+        backends: Detector name per object class
+    """
+    try:
+        image = db.query(AnalysisImage).filter(AnalysisImage.id == image_id).first()
+        if not image or not image.image_path:
+            logger.error(f"Image {image_id} not found or has no stored file")
+            return
+        
+        results = await detect_objects(
+            image_path=image.image_path,
+            previous_details=load_image_details(image),
+            previous_versions=image.detector_versions,
+            backends=backends,
+            **flags
+        )
+        
+        if not results:
+            logger.error(f"Re-detection failed for image {image_id}")
+            return
+        
+        georef = resolve_georeference(image.image_path, image.analysis.latitude, image.analysis.longitude)
+        apply_detection_results(image, results, georef)
+        update_image_stats(db, image)
+        db.commit()
+        logger.info(f"Image {image_id} re-detected with updated settings")
+        
+    except Exception as e:
+        logger.exception(f"Error re-detecting image {image_id}: {str(e)}")
+        db.rollback()
+
+def queue_image_redetection(
+    app,
+    image_ids: List[int],
+    flags: Dict[str, bool],
+    backends: Optional[Dict[str, str]] = None
+):
+    """
+    Re-detect images in the background after detection settings change
+    
+    Like queue_image_processing, this stands in for a real task queue; the
+    work runs on a daemon thread inside its own application context.
+    
+    Args:
+        app: Flask application instance
+        image_ids: IDs of the AnalysisImage rows to refresh
+        flags: detect_* flags, e.g. from get_detection_flags
+        backends: Detector name per object class
+    """
+    if not image_ids:
+        return
+    
+    def run():
+        from app.database import db
+        with app.app_context():
+            loop = asyncio.new_event_loop()
+            try:
+                for image_id in image_ids:
+                    loop.run_until_complete(redetect_image(image_id, flags, db.session, backends))
+            finally:
+                loop.close()
+    
+    threading.Thread(target=run, name="redetection", daemon=True).start()
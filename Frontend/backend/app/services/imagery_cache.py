@@ -0,0 +1,195 @@
+"""
+On-disk cache of fetched satellite imagery
+Keys imagery by provider, acquisition date and a Web Mercator tile, and revalidates stale entries with conditional requests
+"""
+import os
+import json
+import math
+import time
+import logging
+from datetime import date
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from app.services.disk_cache import DiskCache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Imagery cache settings
+IMAGERY_CACHE_DIR = Path(os.getenv('IMAGERY_CACHE_DIR', './cache/imagery'))
+IMAGERY_CACHE_MAX_BYTES = int(os.getenv('IMAGERY_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+# Seconds an entry of the latest imagery is served without revalidation;
+# imagery of a given acquisition date never changes and is never revalidated
+IMAGERY_MAX_AGE = int(os.getenv('IMAGERY_MAX_AGE', 24 * 60 * 60))
+
+# File extension of each image content type
+CONTENT_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/tiff": ".tif",
+    "image/geotiff": ".tif"
+}
+
+def tile_index(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """
+    XYZ Web Mercator tile containing a location
+
+    Args:
+        latitude: Latitude in degrees
+        longitude: Longitude in degrees
+        zoom: Zoom level
+
+    Returns:
+        Tuple of (column, row), rows counted from the north
+    """
+    n = 2 ** zoom
+    lat = math.radians(min(max(latitude, -85.0511), 85.0511))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_center(zoom: int, x: int, y: int) -> Tuple[float, float]:
+    """
+    Center of an XYZ tile
+
+    Args:
+        zoom: Zoom level
+        x: Tile column
+        y: Tile row
+
+    Returns:
+        Tuple of (latitude, longitude)
+    """
+    n = 2 ** zoom
+    longitude = (x + 0.5) / n * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return latitude, longitude
+
+def make_imagery_key(
+    latitude: float,
+    longitude: float,
+    zoom: int,
+    acquisition_date: Optional[date],
+    provider: str
+) -> str:
+    """
+    Build the cache key of the imagery around a location
+
+    Locations in the same tile share an entry.
+
+    Args:
+        latitude: Latitude in degrees
+        longitude: Longitude in degrees
+        zoom: Zoom level of the tile grid
+        acquisition_date: Date of the imagery, or None for the latest
+        provider: Imagery provider name
+
+    Returns:
+        Cache key
+    """
+    x, y = tile_index(latitude, longitude, zoom)
+    acquired = acquisition_date.isoformat() if acquisition_date is not None else "latest"
+    return f"{provider}_{acquired}_{zoom}_{x}_{y}"
+
+class ImageryCache(DiskCache):
+    """
+    DiskCache of image bytes with the HTTP validators of each entry
+
+    Validators are kept in a <key>.json file next to the image and removed
+    with it.
+    """
+
+    def meta_path(self, key: str) -> Path:
+        """File holding the validators of an entry"""
+        return self.directory / f"{key}.json"
+
+    def read_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Read the validators of an entry
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Metadata dictionary, or None if the entry or its metadata is missing
+        """
+        if not self.path(key).exists():
+            return None
+        try:
+            return json.loads(self.meta_path(key).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        """Store the validators of an entry"""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._atomic_write(self.meta_path(key), json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Failed to write cache metadata for {key}: {str(e)}")
+
+    def store(self, key: str, data: bytes, meta: Dict[str, Any]) -> Optional[Path]:
+        """
+        Store an image and its validators
+
+        Args:
+            key: Cache key
+            data: Image bytes
+            meta: Validators, e.g. from response_meta
+
+        Returns:
+            Path of the stored image, or None if it could not be written
+        """
+        path = self.write(key, data)
+        if path is not None:
+            self.write_meta(key, meta)
+        return path
+
+    def forget(self, key: str) -> None:
+        self.meta_path(key).unlink(missing_ok=True)
+
+def response_meta(headers, immutable: bool = False) -> Dict[str, Any]:
+    """
+    Validators and content type of an imagery response
+
+    Args:
+        headers: Response headers
+        immutable: Whether the entry never needs revalidation
+
+    Returns:
+        Metadata dictionary for ImageryCache.store
+    """
+    return {
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "content_type": headers.get("content-type", "image/jpeg").split(";")[0].strip(),
+        "fetched_at": time.time(),
+        "immutable": immutable
+    }
+
+def is_fresh(meta: Dict[str, Any], max_age: Optional[int] = None) -> bool:
+    """Whether an entry can be served without asking the provider, by default for IMAGERY_MAX_AGE seconds"""
+    max_age = IMAGERY_MAX_AGE if max_age is None else max_age
+    return bool(meta.get("immutable")) or time.time() - meta.get("fetched_at", 0) < max_age
+
+def conditional_headers(meta: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Request headers revalidating a cached entry
+
+    Args:
+        meta: Metadata of the entry, or None on a miss
+
+    Returns:
+        If-None-Match / If-Modified-Since headers for the validators known
+    """
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+# Cache shared by imagery fetches
+imagery_cache = ImageryCache(IMAGERY_CACHE_DIR, IMAGERY_CACHE_MAX_BYTES, ".img")
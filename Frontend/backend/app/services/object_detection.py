@@ -5,30 +5,80 @@ Provides functionality to detect various features in satellite imagery
 import os
 import logging
 import json
-import uuid
-from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+import zlib
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator, AsyncIterator
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import cv2
+import rasterio
+
+from app.services.detector_engine import (
+    execute_detectors,
+    get_process_pool,
+    shutdown_process_pool,
+    BATCH_WORKERS
+)
+from app.services.detection_cache import detection_cache, make_cache_key
+from app.services.detector_registry import (
+    HeuristicDetector,
+    DnnDetector,
+    register_detector,
+    get_detector
+)
+from app.services.standin_model import STANDIN_MODEL_PATH
+from app.services.image_context import ImageContext
+from app.services.georeference import GeoReference, georeference_paths
+from app.services.detections import DetectionSet, Detections, DETAIL_KEYS
+from app.services.simplification import ragged_arange
+from app.services.tiling import (
+    get_scene_shape,
+    scene_digest,
+    iter_windows,
+    read_window,
+    scene_gain,
+    merge_tile_detections
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Configure paths
-RESULTS_DIR = Path("./results")
-RESULTS_DIR.mkdir(exist_ok=True)
-
 # Detection settings
 CONFIDENCE_THRESHOLD = 0.5
 
+# Tiled execution settings for large scenes
+TILE_SIZE = int(os.getenv('DETECTION_TILE_SIZE', 2048))
+TILE_OVERLAP = int(os.getenv('DETECTION_TILE_OVERLAP', 256))
+TILE_NMS_IOU = 0.5
+# Scenes with more pixels than this are processed tile by tile
+TILING_MIN_PIXELS = int(os.getenv('DETECTION_TILING_MIN_PIXELS', 4096 * 4096))
+# Opacity of the water body fill
+WATER_FILL_ALPHA = 0.4
+# Detections converted and serialized per step when streaming GeoJSON
+GEOJSON_CHUNK_SIZE = int(os.getenv('GEOJSON_CHUNK_SIZE', 1000))
+# Tiles decoded together and passed to each detector in one call
+TILE_BATCH_SIZE = int(os.getenv('DETECTION_TILE_BATCH_SIZE', 4))
+
+# Runway heuristic: minimum length/width ratio, minimum rectangle area as a
+# fraction of the image and minimum share of the rectangle that is bright
+RUNWAY_MIN_ASPECT = 5.0
+RUNWAY_MIN_AREA_FRACTION = 0.01
+RUNWAY_MIN_FILL = 0.5
+
 async def detect_objects(
     image_path: str,
     detect_runways: bool = True,
     detect_aircraft: bool = True,
     detect_houses: bool = True,
     detect_roads: bool = True,
-    detect_water_bodies: bool = True
+    detect_water_bodies: bool = True,
+    tiled: Optional[bool] = None,
+    parallelism: Optional[int] = None,
+    use_cache: bool = True,
+    previous_details: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    previous_versions: Optional[Dict[str, str]] = None,
+    backends: Optional[Dict[str, str]] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Perform object detection on a satellite image
@@ -40,9 +90,21 @@ async def detect_objects(
         detect_houses: Whether to detect houses/buildings
         detect_roads: Whether to detect roads
         detect_water_bodies: Whether to detect water bodies
+        tiled: Read and process the scene in overlapping tiles. When None,
+            tiling is used for scenes larger than TILING_MIN_PIXELS
+        parallelism: Maximum number of detectors running at once; 1 runs
+            them sequentially (defaults to DETECTOR_WORKERS)
+        use_cache: Serve and store results through the detection cache
+        previous_details: Details stored by an earlier run on the same image
+        previous_versions: Detector versions that produced previous_details.
+            Classes that are still enabled and whose detector version is
+            unchanged are reused; only the other enabled detectors run
+        backends: Registered detector name to use per object class, e.g.
+            {"aircraft": "standin-onnx"}; unnamed classes use the heuristics
         
     Returns:
-        Dictionary with detection results
+        Dictionary with summary counts, detector versions and the details as
+        Detections in pixel coordinates
     """
     try:
         logger.info(f"Starting object detection on {image_path}")
@@ -51,80 +113,76 @@ async def detect_objects(
         if not os.path.exists(image_path):
             logger.error(f"Image not found: {image_path}")
             return None
-            
-        image = cv2.imread(image_path)
-        if image is None:
-            logger.error(f"Failed to load image: {image_path}")
-            return None
-            
-        # Convert from BGR to RGB for processing
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         
-        # Initialize results dictionary
-        results = {
-            "runway_detected": False,
-            "aircraft_count": 0,
-            "house_count": 0,
-            "road_count": 0,
-            "water_body_count": 0,
-            "details": {
-                "runways": [],
-                "aircraft": [],
-                "houses": [],
-                "roads": [],
-                "water_bodies": []
-            }
+        flags = {
+            "runways": detect_runways,
+            "aircraft": detect_aircraft,
+            "houses": detect_houses,
+            "roads": detect_roads,
+            "water_bodies": detect_water_bodies
         }
         
-        # In a real implementation, this would use pre-trained models
-        # For this prototype, we'll use a mock implementation
-        if detect_runways:
-            runway_results = await detect_runways_mock(image_rgb)
-            results["runway_detected"] = runway_results["detected"]
-            results["details"]["runways"] = runway_results["locations"]
-        
-        if detect_aircraft:
-            aircraft_results = await detect_aircraft_mock(image_rgb)
-            results["aircraft_count"] = len(aircraft_results["locations"])
-            results["details"]["aircraft"] = aircraft_results["locations"]
+        if tiled is None:
+            height, width = get_scene_shape(image_path)
+            tiled = height * width > TILING_MIN_PIXELS
         
-        if detect_houses:
-            house_results = await detect_houses_mock(image_rgb)
-            results["house_count"] = len(house_results["locations"])
-            results["details"]["houses"] = house_results["locations"]
+        versions = enabled_detector_versions(flags, backends)
+        context = None
+        cache_key = None
+        if use_cache:
+            if tiled:
+                digest = scene_digest(image_path)
+            else:
+                context = ImageContext.from_path(image_path)
+                if context is None:
+                    logger.error(f"Failed to load image: {image_path}")
+                    return None
+                digest = context.digest
+            
+            cache_key = make_cache_key(digest, flags, versions, tiled)
+            cached = detection_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Serving cached detection results for {image_path}")
+                return cached
         
-        if detect_roads:
-            road_results = await detect_roads_mock(image_rgb)
-            results["road_count"] = len(road_results["locations"])
-            results["details"]["roads"] = road_results["locations"]
+        # Only run detectors whose stored output is missing or outdated
+        reusable = reusable_detail_keys(versions, previous_details, previous_versions)
+        run_flags = {key: flags[key] and key not in reusable for key in DETAIL_KEYS}
+        if reusable:
+            logger.info(
+                f"Reusing stored {', '.join(reusable)} for {image_path}; running "
+                f"{sum(run_flags.values())} detector(s)"
+            )
         
-        if detect_water_bodies:
-            water_results = await detect_water_bodies_mock(image_rgb)
-            results["water_body_count"] = len(water_results["locations"])
-            results["details"]["water_bodies"] = water_results["locations"]
+        if tiled:
+            if any(run_flags.values()):
+                details = await detect_objects_tiled(
+                    image_path, run_flags, parallelism=parallelism, backends=backends
+                )
+            else:
+                details = Detections.empty()
+        else:
+            # Decode once; the cache digest and the detectors share this context
+            if context is None:
+                context = ImageContext.from_path(image_path)
+            if context is None:
+                logger.error(f"Failed to load image: {image_path}")
+                return None
+                
+            details = await run_detectors(context, run_flags, parallelism, backends)
         
-        # Generate visualization
-        result_image = await generate_visualization(
-            image_path, 
-            results,
-            detect_runways,
-            detect_aircraft,
-            detect_houses,
-            detect_roads,
-            detect_water_bodies
-        )
+        if reusable:
+            previous_details = Detections.from_details(previous_details)
+            for key in reusable:
+                details[key] = previous_details[key]
         
-        # Save the result image
-        result_filename = f"result_{uuid.uuid4().hex}.jpg"
-        result_path = RESULTS_DIR / result_filename
-        cv2.imwrite(str(result_path), result_image)
+        # Rank outline points once so any level of detail is a threshold when served
+        results = build_results(details.with_weights())
+        results["detector_versions"] = versions
         
-        # Add result image filename to results
-        results["result_image_filename"] = result_filename
-        
-        # Generate GeoJSON data
-        geojson_data = generate_geojson(results)
-        results["geojson_data"] = geojson_data
+        # Results stay in pixel coordinates; GeoJSON is built when served
+        if cache_key is not None:
+            detection_cache.put(cache_key, results)
         
         logger.info(f"Object detection completed for {image_path}")
         return results
@@ -133,258 +191,588 @@ async def detect_objects(
         logger.exception(f"Error in object detection: {str(e)}")
         return None
 
-async def detect_runways_mock(image: np.ndarray) -> Dict[str, Any]:
+def resolve_detectors(
+    flags: Dict[str, bool],
+    backends: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
     """
-    Mock implementation of runway detection
+    Pick the registered detector of every enabled object class
     
-    In a real application, this would use a trained model for runway detection
+    Args:
+        flags: Mapping of detail key to whether that object class is enabled
+        backends: Detector name per object class; missing classes use the default
+        
+    Returns:
+        Detector keyed by detail key, for enabled classes only
     """
-    # Image dimensions
-    height, width = image.shape[:2]
+    backends = backends or {}
+    return {key: get_detector(key, backends.get(key)) for key in DETAIL_KEYS if flags[key]}
+
+def enabled_detector_versions(
+    flags: Dict[str, bool],
+    backends: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Get the version tags of the detectors a run with these flags executes
     
-    # For the mock implementation, we'll use simple image processing
-    # to look for large rectangular shapes that could be runways
+    Args:
+        flags: Mapping of detail key to whether that object class is enabled
+        backends: Detector name per object class
+        
+    Returns:
+        Detector version tag keyed by detail key, for enabled classes only
+    """
+    return {key: detector.version_tag for key, detector in resolve_detectors(flags, backends).items()}
+
+def reusable_detail_keys(
+    versions: Dict[str, str],
+    previous_details: Optional[Dict[str, Any]],
+    previous_versions: Optional[Dict[str, str]]
+) -> List[str]:
+    """
+    Find the enabled object classes whose stored details are still current
     
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    Args:
+        versions: Version tags of the detectors the run would execute
+        previous_details: Details stored by an earlier run
+        previous_versions: Detector versions that produced those details
+        
+    Returns:
+        Detail keys that can be reused without running their detector
+    """
+    if not previous_details or not previous_versions:
+        return []
     
-    # Apply threshold
-    _, binary = cv2.threshold(gray, 100, 255, cv2.THRESH_BINARY)
+    return [
+        key for key in DETAIL_KEYS
+        if key in versions
+        and key in previous_details
+        and previous_versions.get(key) == versions[key]
+    ]
+
+def stable_seed(shape: Tuple[int, ...], salt: str = "") -> int:
+    """
+    Seed for the mock detectors that is identical in every worker process
     
-    # Find contours
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    Python's hash() of a string changes with PYTHONHASHSEED, so a CRC is used instead.
+    """
+    return zlib.crc32(f"{shape}{salt}".encode("utf-8")) % 10000
+
+def get_detection_flags(settings: Any) -> Dict[str, bool]:
+    """
+    Extract the detect_* flags from an AnalysisSettings row or a plain dictionary
     
-    # Look for rectangle-like contours with appropriate aspect ratio
-    runways = []
-    runway_detected = False
+    Args:
+        settings: AnalysisSettings instance, dictionary of flags, or None for defaults
+        
+    Returns:
+        Dictionary of detect_objects keyword arguments
+    """
+    names = ("detect_runways", "detect_aircraft", "detect_houses", "detect_roads", "detect_water_bodies")
+    if settings is None:
+        return {name: True for name in names}
+    if isinstance(settings, dict):
+        return {name: bool(settings.get(name, True)) for name in names}
+    return {name: bool(getattr(settings, name, True)) for name in names}
+
+def get_detector_backends(settings: Any) -> Optional[Dict[str, str]]:
+    """
+    Extract the per-class detector choice from an AnalysisSettings row or a plain dictionary
     
-    for contour in contours:
-        # Get the rectangle bounding the contour
-        x, y, w, h = cv2.boundingRect(contour)
+    Args:
+        settings: AnalysisSettings instance, dictionary, or None for defaults
         
-        # Calculate aspect ratio
-        aspect_ratio = float(w) / h if h > 0 else 0
+    Returns:
+        Detector name keyed by detail key, or None to use the defaults
+    """
+    if settings is None:
+        return None
+    if isinstance(settings, dict):
+        return settings.get("detector_backends")
+    return getattr(settings, "detector_backends", None)
+
+def _detect_objects_worker(
+    image_path: str,
+    flags: Dict[str, bool],
+    backends: Optional[Dict[str, str]]
+) -> Optional[Dict[str, Any]]:
+    """Run detect_objects inside a batch worker process"""
+    # Each worker already owns a core, so detectors run sequentially inside it;
+    # models it loads stay warm for the following images
+    return asyncio.run(detect_objects(image_path, parallelism=1, backends=backends, **flags))
+
+async def detect_objects_batch(
+    image_paths: Iterable[str],
+    settings: Any = None,
+    max_in_flight: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run object detection over many images on a process pool
+    
+    Results are yielded as soon as each image finishes, not in input order.
+    At most max_in_flight images are submitted at once; the next path is only
+    taken from image_paths when a slot frees up, so a long or lazy input is
+    never queued up in full. A failing image is reported in its own entry and
+    does not affect the rest of the batch.
+    
+    Args:
+        image_paths: Paths of the images to process
+        settings: AnalysisSettings instance or dictionary with the detect_* flags
+            and optional detector_backends
+        max_in_flight: Maximum number of images submitted at once
+            (defaults to twice BATCH_WORKERS)
         
-        # Runways typically have high aspect ratio (long and narrow)
-        if (aspect_ratio > 5 or aspect_ratio < 0.2) and w * h > (width * height * 0.01):
-            # This could be a runway
-            runway_detected = True
+    Returns:
+        Async iterator of dictionaries with image_path, results and error keys
+    """
+    flags = get_detection_flags(settings)
+    backends = get_detector_backends(settings)
+    if max_in_flight is None:
+        max_in_flight = 2 * max(1, BATCH_WORKERS)
+    
+    loop = asyncio.get_running_loop()
+    paths = iter(image_paths)
+    retries = []
+    pending = {}
+    exhausted = False
+    
+    while True:
+        # Refill the in-flight window, retrying images caught in a worker crash first
+        while len(pending) < max_in_flight:
+            if retries:
+                image_path, attempt = retries.pop(), 2
+            elif not exhausted:
+                try:
+                    image_path, attempt = next(paths), 1
+                except StopIteration:
+                    exhausted = True
+                    continue
+            else:
+                break
+            pool = get_process_pool()
+            future = loop.run_in_executor(pool, _detect_objects_worker, image_path, flags, backends)
+            pending[future] = (image_path, attempt, pool)
+        
+        if not pending:
+            break
+        
+        done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            image_path, attempt, pool = pending.pop(future)
+            try:
+                results = future.result()
+                error = None if results else "Object detection failed"
+            except BrokenProcessPool as e:
+                # A worker died (e.g. OOM kill) and took the whole pool down;
+                # start a fresh pool and give every affected image one more try
+                if pool is get_process_pool():
+                    logger.error(f"Detection worker crashed while processing {image_path}")
+                    shutdown_process_pool()
+                if attempt == 1:
+                    retries.append(image_path)
+                    continue
+                results, error = None, f"Worker process crashed: {str(e)}"
+            except Exception as e:
+                logger.exception(f"Error in batch object detection for {image_path}: {str(e)}")
+                results, error = None, str(e)
             
-            # Get the center point and dimensions
-            center_x = x + w // 2
-            center_y = y + h // 2
+            yield {
+                "image_path": image_path,
+                "results": results,
+                "error": error
+            }
+
+async def run_detectors(
+    context: ImageContext,
+    flags: Dict[str, bool],
+    parallelism: Optional[int] = None,
+    backends: Optional[Dict[str, str]] = None
+) -> Detections:
+    """
+    Run the enabled detectors over a single image or tile
+    
+    Args:
+        context: Decoded image shared by the detectors
+        flags: Mapping of detail key to whether that object class is enabled
+        parallelism: Maximum number of detectors running at once
+        backends: Detector name per object class
+        
+    Returns:
+        Detection details keyed by object class
+    """
+    return (await run_detectors_batch([context], flags, parallelism, backends))[0]
+
+async def run_detectors_batch(
+    contexts: List[ImageContext],
+    flags: Dict[str, bool],
+    parallelism: Optional[int] = None,
+    backends: Optional[Dict[str, str]] = None
+) -> List[Detections]:
+    """
+    Run the enabled detectors over several images or tiles
+    
+    Each detector receives all contexts in one call, so model-backed
+    detectors run a single batched inference instead of one per tile.
+    Detectors run at their declared pyramid level and report full
+    resolution coordinates.
+    
+    Args:
+        contexts: Decoded images
+        flags: Mapping of detail key to whether that object class is enabled
+        parallelism: Maximum number of detectors running at once
+        backends: Detector name per object class
+        
+    Returns:
+        Detection details keyed by object class, one entry per context
+    """
+    detectors = resolve_detectors(flags, backends)
+    outputs = await execute_detectors(
+        {key: detector.detect_pyramid for key, detector in detectors.items()},
+        contexts,
+        parallelism
+    )
+    
+    return [
+        Detections({
+            key: outputs[key][index] if key in outputs else DetectionSet.empty(key)
+            for key in DETAIL_KEYS
+        })
+        for index in range(len(contexts))
+    ]
+
+async def detect_objects_tiled(
+    image_path: str,
+    flags: Dict[str, bool],
+    tile_size: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    parallelism: Optional[int] = None,
+    backends: Optional[Dict[str, str]] = None,
+    batch_size: int = TILE_BATCH_SIZE
+) -> Detections:
+    """
+    Run the detectors over overlapping windows of a large scene
+    
+    Tiles are decoded batch_size at a time and each detector processes a
+    batch in one call, so peak memory depends on tile_size and batch_size
+    rather than on the scene size. Objects seen by several tiles are merged
+    with non-maximum suppression.
+    
+    Args:
+        image_path: Path to the satellite image
+        flags: Mapping of detail key to whether that object class is enabled
+        tile_size: Edge length of each tile in pixels
+        overlap: Pixels shared between neighbouring tiles
+        parallelism: Maximum number of detectors running at once per batch
+        backends: Detector name per object class
+        batch_size: Tiles passed to each detector call
+        
+    Returns:
+        Detection details keyed by object class, in scene pixel coordinates
+    """
+    collected = {key: [] for key in DETAIL_KEYS}
+    
+    with rasterio.open(image_path) as dataset:
+        windows = list(iter_windows(dataset.width, dataset.height, tile_size, overlap))
+        logger.info(f"Processing {image_path} as {len(windows)} tiles of {tile_size}px")
+        # One gain for the whole scene, so brightness thresholds see every tile alike
+        gain = scene_gain(dataset)
+        
+        for start in range(0, len(windows), batch_size):
+            batch = windows[start:start + batch_size]
+            tile_contexts = [ImageContext(rgb=read_window(dataset, window, gain)) for window in batch]
+            batch_details = await run_detectors_batch(tile_contexts, flags, parallelism, backends)
+            del tile_contexts
             
-            runways.append({
-                "id": len(runways) + 1,
-                "confidence": 0.75,  # Mock confidence score
-                "bbox": [x, y, x + w, y + h],
-                "center": [center_x, center_y],
-                "width": w,
-                "height": h
-            })
+            for window, tile_details in zip(batch, batch_details):
+                dx, dy = int(window.col_off), int(window.row_off)
+                for key in DETAIL_KEYS:
+                    if len(tile_details[key]):
+                        collected[key].append(tile_details[key].translate(dx, dy))
+    
+    return Detections({
+        key: merge_tile_detections(DetectionSet.concatenate(key, collected[key]), TILE_NMS_IOU)
+        for key in DETAIL_KEYS
+    })
+
+def build_results(details: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the results dictionary returned by detect_objects from detection details
     
+    Args:
+        details: Detections, or detection dictionaries keyed by object class
+        
+    Returns:
+        Results dictionary with summary counts and details as Detections
+    """
+    details = Detections.from_details(details)
     return {
-        "detected": runway_detected,
-        "locations": runways
+        "runway_detected": len(details["runways"]) > 0,
+        "aircraft_count": len(details["aircraft"]),
+        "house_count": len(details["houses"]),
+        "road_count": len(details["roads"]),
+        "water_body_count": len(details["water_bodies"]),
+        "details": details
     }
 
-async def detect_aircraft_mock(image: np.ndarray) -> Dict[str, Any]:
+def detect_runways_mock(context: ImageContext) -> DetectionSet:
+    """
+    Mock implementation of runway detection
+
+    Bright connected components are filtered on their statistics with NumPy;
+    only the surviving candidates are fitted with a rotated rectangle, so
+    runways at any orientation are found with their true length, width and
+    heading.
+
+    In a real application, this would use a trained model for runway detection
+    """
+    # Image dimensions
+    height, width = context.shape[:2]
+    min_area = width * height * RUNWAY_MIN_AREA_FRACTION
+
+    # Label the bright regions of the shared binary plane (cached on the context)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(context.binary(100), connectivity=8)
+
+    # Cheap filter over all components at once. A long thin component of
+    # length L and width W covers about L * W pixels and has a bounding box
+    # diagonal of about L, so diagonal^2 / pixels approximates L / W at any
+    # orientation.
+    box_w = stats[1:, cv2.CC_STAT_WIDTH].astype(np.float64)
+    box_h = stats[1:, cv2.CC_STAT_HEIGHT].astype(np.float64)
+    pixels = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+    elongation = (box_w * box_w + box_h * box_h) / np.maximum(pixels, 1.0)
+    candidates = np.flatnonzero(
+        (elongation > RUNWAY_MIN_ASPECT) & (pixels >= min_area * RUNWAY_MIN_FILL)
+    ) + 1
+
+    survivors, rects, polygons = [], [], []
+    for label in candidates:
+        x, y, w, h, area = (int(v) for v in stats[label])
+        # Pixel coordinates of this component only, taken from its bounding box
+        rows, cols = np.nonzero(labels[y:y + h, x:x + w] == label)
+        points = np.column_stack((cols + x, rows + y)).astype(np.float32)
+
+        (center_x, center_y), (side_a, side_b), _ = rect = cv2.minAreaRect(points)
+        # minAreaRect measures pixel centres; add one pixel to get the extent
+        length, runway_width = max(side_a, side_b) + 1.0, min(side_a, side_b) + 1.0
+        if length / runway_width <= RUNWAY_MIN_ASPECT or length * runway_width <= min_area:
+            continue
+        fill = area / (length * runway_width)
+        if fill < RUNWAY_MIN_FILL:
+            continue
+
+        corners = cv2.boxPoints(rect)
+        survivors.append(label)
+        rects.append((center_x, center_y, length, runway_width, fill, runway_heading(corners)))
+        polygons.append(corners)
+
+    if not survivors:
+        return DetectionSet.empty("runways")
+
+    x, y, w, h = (stats[survivors, i] for i in range(4))
+    center_x, center_y, length, runway_width, fill, heading = np.array(rects).T
+    return DetectionSet.from_columns(
+        "runways",
+        paths=polygons,
+        confidence=np.minimum(0.95, 0.5 + 0.45 * fill),
+        bbox=np.column_stack((x, y, x + w, y + h)),
+        center=np.column_stack((center_x, center_y)),
+        width=w,
+        height=h,
+        length=length,
+        runway_width=runway_width,
+        heading=heading
+    )
+
+def runway_heading(corners: np.ndarray) -> float:
+    """
+    Direction of the long axis of a rotated rectangle
+
+    Args:
+        corners: Four corners as returned by cv2.boxPoints
+
+    Returns:
+        Degrees clockwise from image up, in [0, 180)
+    """
+    edges = np.roll(corners, -1, axis=0) - corners
+    dx, dy = edges[np.argmax(np.hypot(edges[:, 0], edges[:, 1]))]
+    # Image rows grow downwards, so up is -y
+    return float(np.degrees(np.arctan2(dx, -dy)) % 180.0)
+
+def clamped_boxes(center: np.ndarray, size: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Boxes of the given sizes around centers, clipped to the image
+
+    Args:
+        center: Array of shape (N, 2) with [x, y] rows
+        size: Array of shape (N, 2) with [w, h] rows
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        Array of shape (N, 4) with [x1, y1, x2, y2] rows
+    """
+    half = size // 2
+    return np.hstack((
+        np.maximum(center - half, 0),
+        np.minimum(center + half, [width, height])
+    ))
+
+def detect_aircraft_mock(context: ImageContext) -> DetectionSet:
     """
     Mock implementation of aircraft detection
     
     In a real application, this would use a trained model for aircraft detection
     """
     # Image dimensions
-    height, width = image.shape[:2]
+    height, width = context.shape[:2]
     
     # For mock implementation, we'll randomly place 0-5 aircraft
-    import random
-    random.seed(hash(str(image.shape)) % 10000)  # Deterministic based on image shape
+    # A private generator keeps concurrent detectors from sharing random state
+    rng = np.random.default_rng(stable_seed(context.shape))  # Deterministic based on image shape
     
-    num_aircraft = random.randint(0, 5)
-    aircraft = []
+    count = int(rng.integers(0, 5, endpoint=True))
     
-    for i in range(num_aircraft):
-        # Random position (but try to place near runways if possible)
-        center_x = random.randint(width // 4, 3 * width // 4)
-        center_y = random.randint(height // 4, 3 * height // 4)
-        
-        # Aircraft are usually small in satellite images
-        w = random.randint(10, 30)
-        h = random.randint(10, 30)
-        
-        # Calculate bounding box
-        x1 = max(0, center_x - w // 2)
-        y1 = max(0, center_y - h // 2)
-        x2 = min(width, center_x + w // 2)
-        y2 = min(height, center_y + h // 2)
-        
-        aircraft.append({
-            "id": i + 1,
-            "confidence": random.uniform(0.6, 0.95),
-            "bbox": [x1, y1, x2, y2],
-            "center": [center_x, center_y],
-            "width": w,
-            "height": h
-        })
+    # Random positions (but try to place near runways if possible)
+    center = np.column_stack((
+        rng.integers(width // 4, 3 * width // 4, count, endpoint=True),
+        rng.integers(height // 4, 3 * height // 4, count, endpoint=True)
+    ))
     
-    return {
-        "locations": aircraft
-    }
+    # Aircraft are usually small in satellite images
+    size = rng.integers(10, 30, (count, 2), endpoint=True)
+    
+    return DetectionSet.from_columns(
+        "aircraft",
+        confidence=rng.uniform(0.6, 0.95, count),
+        bbox=clamped_boxes(center, size, width, height),
+        center=center,
+        width=size[:, 0],
+        height=size[:, 1]
+    )
 
-async def detect_houses_mock(image: np.ndarray) -> Dict[str, Any]:
+def detect_houses_mock(context: ImageContext) -> DetectionSet:
     """
     Mock implementation of house/building detection
     
     In a real application, this would use a trained model for building detection
     """
     # Image dimensions
-    height, width = image.shape[:2]
+    height, width = context.shape[:2]
     
     # For mock implementation, we'll randomly place 10-50 houses
-    import random
-    random.seed(hash(str(image.shape) + "houses") % 10000)  # Deterministic based on image
+    rng = np.random.default_rng(stable_seed(context.shape, "houses"))  # Deterministic based on image
     
-    num_houses = random.randint(10, 50)
-    houses = []
+    count = int(rng.integers(10, 50, endpoint=True))
+    center = np.column_stack((
+        rng.integers(0, width, count),
+        rng.integers(0, height, count)
+    ))
     
-    for i in range(num_houses):
-        # Random position
-        center_x = random.randint(0, width - 1)
-        center_y = random.randint(0, height - 1)
-        
-        # Houses are usually small in satellite images
-        w = random.randint(8, 20)
-        h = random.randint(8, 20)
-        
-        # Calculate bounding box
-        x1 = max(0, center_x - w // 2)
-        y1 = max(0, center_y - h // 2)
-        x2 = min(width, center_x + w // 2)
-        y2 = min(height, center_y + h // 2)
-        
-        houses.append({
-            "id": i + 1,
-            "confidence": random.uniform(0.6, 0.95),
-            "bbox": [x1, y1, x2, y2],
-            "center": [center_x, center_y],
-            "width": w,
-            "height": h,
-            "area": w * h
-        })
+    # Houses are usually small in satellite images
+    size = rng.integers(8, 20, (count, 2), endpoint=True)
     
-    return {
-        "locations": houses
-    }
+    return DetectionSet.from_columns(
+        "houses",
+        confidence=rng.uniform(0.6, 0.95, count),
+        bbox=clamped_boxes(center, size, width, height),
+        center=center,
+        width=size[:, 0],
+        height=size[:, 1],
+        area=size[:, 0] * size[:, 1]
+    )
 
-async def detect_roads_mock(image: np.ndarray) -> Dict[str, Any]:
+def detect_roads_mock(context: ImageContext) -> DetectionSet:
     """
     Mock implementation of road detection
     
     In a real application, this would use a trained model for road detection
     """
     # Image dimensions
-    height, width = image.shape[:2]
+    height, width = context.shape[:2]
     
     # For mock implementation, we'll create a few roads as line segments
-    import random
-    random.seed(hash(str(image.shape) + "roads") % 10000)  # Deterministic based on image
+    rng = np.random.default_rng(stable_seed(context.shape, "roads"))  # Deterministic based on image
     
-    num_roads = random.randint(3, 8)
-    roads = []
+    count = int(rng.integers(3, 8, endpoint=True))
     
-    for i in range(num_roads):
-        # Roads are represented as polylines (list of connected points)
-        num_points = random.randint(2, 5)
-        polyline = []
-        
-        # Generate starting point
-        x = random.randint(0, width - 1)
-        y = random.randint(0, height - 1)
-        polyline.append([x, y])
-        
-        # Generate subsequent points to form a polyline
-        for j in range(num_points - 1):
-            # Create a point that's a reasonable distance away from the previous one
-            angle = random.uniform(0, 2 * 3.14159)
-            distance = random.randint(50, 200)
-            
-            x = int(polyline[-1][0] + distance * np.cos(angle))
-            y = int(polyline[-1][1] + distance * np.sin(angle))
-            
-            # Clamp to image boundaries
-            x = max(0, min(width - 1, x))
-            y = max(0, min(height - 1, y))
-            
-            polyline.append([x, y])
-        
-        roads.append({
-            "id": i + 1,
-            "confidence": random.uniform(0.7, 0.95),
-            "polyline": polyline,
-            "width": random.randint(2, 8)  # Road width in pixels
-        })
+    # Roads are polylines of 2-5 points, each step 50-200 px in a random direction
+    lengths = rng.integers(2, 5, count, endpoint=True)
+    first = np.cumsum(lengths) - lengths
+    angle = rng.uniform(0, 2 * np.pi, lengths.sum())
+    distance = rng.integers(50, 200, lengths.sum(), endpoint=True)
+    steps = distance[:, None] * np.column_stack((np.cos(angle), np.sin(angle)))
+    steps[first] = 0
     
-    return {
-        "locations": roads
-    }
+    # Walk from a random start point of every road, clamped to the image
+    start = np.column_stack((rng.integers(0, width, count), rng.integers(0, height, count)))
+    walked = np.cumsum(steps, axis=0)
+    points = np.repeat(start - walked[first], lengths, axis=0) + walked
+    points = np.clip(points.astype(np.int64), 0, [width - 1, height - 1])
+    
+    return DetectionSet.from_columns(
+        "roads",
+        paths=np.split(points, first[1:]),
+        confidence=rng.uniform(0.7, 0.95, count),
+        width=rng.integers(2, 8, count, endpoint=True)  # Road width in pixels
+    )
 
-async def detect_water_bodies_mock(image: np.ndarray) -> Dict[str, Any]:
+def detect_water_bodies_mock(context: ImageContext) -> DetectionSet:
     """
     Mock implementation of water body detection
     
     In a real application, this would use a trained model or spectral analysis
     """
     # Image dimensions
-    height, width = image.shape[:2]
+    height, width = context.shape[:2]
     
     # For mock implementation, we'll randomly place 0-3 water bodies
-    import random
-    random.seed(hash(str(image.shape) + "water") % 10000)  # Deterministic based on image
+    rng = np.random.default_rng(stable_seed(context.shape, "water"))  # Deterministic based on image
     
-    num_water_bodies = random.randint(0, 3)
-    water_bodies = []
+    count = int(rng.integers(0, 3, endpoint=True))
     
-    for i in range(num_water_bodies):
-        # Water bodies as polygons with 5-10 vertices
-        num_points = random.randint(5, 10)
-        
-        # Generate center of the water body
-        center_x = random.randint(width // 4, 3 * width // 4)
-        center_y = random.randint(height // 4, 3 * height // 4)
-        
-        # Generate points around the center
-        polygon = []
-        radius = random.randint(30, 100)
-        
-        for j in range(num_points):
-            angle = j * 2 * 3.14159 / num_points
-            # Add some randomness to make the shape irregular
-            r = radius * random.uniform(0.7, 1.3)
-            
-            x = int(center_x + r * np.cos(angle))
-            y = int(center_y + r * np.sin(angle))
-            
-            # Clamp to image boundaries
-            x = max(0, min(width - 1, x))
-            y = max(0, min(height - 1, y))
-            
-            polygon.append([x, y])
-        
-        # Close the polygon
-        polygon.append(polygon[0])
-        
-        water_bodies.append({
-            "id": i + 1,
-            "confidence": random.uniform(0.6, 0.9),
-            "polygon": polygon,
-            "center": [center_x, center_y],
-            "area": 3.14159 * radius * radius  # Approximate area
-        })
+    # Water bodies as polygons with 5-10 vertices around a center
+    vertices = rng.integers(5, 10, count, endpoint=True)
+    center = np.column_stack((
+        rng.integers(width // 4, 3 * width // 4, count, endpoint=True),
+        rng.integers(height // 4, 3 * height // 4, count, endpoint=True)
+    ))
+    radius = rng.integers(30, 100, count, endpoint=True)
     
-    return {
-        "locations": water_bodies
-    }
+    # Randomize each vertex's distance to make the shape irregular
+    angle = ragged_arange(vertices) * 2 * np.pi / np.repeat(vertices, vertices)
+    r = np.repeat(radius, vertices) * rng.uniform(0.7, 1.3, vertices.sum())
+    ring = np.repeat(center, vertices, axis=0) + r[:, None] * np.column_stack((np.cos(angle), np.sin(angle)))
+    ring = np.clip(ring.astype(np.int64), 0, [width - 1, height - 1])
+    
+    # Close every polygon by repeating its first vertex
+    first = np.cumsum(vertices) - vertices
+    closed = np.repeat(first, vertices + 1) + ragged_arange(vertices + 1) % np.repeat(vertices, vertices + 1)
+    
+    return DetectionSet.from_columns(
+        "water_bodies",
+        paths=np.split(ring[closed], (first + np.arange(count))[1:]),
+        confidence=rng.uniform(0.6, 0.9, count),
+        center=center,
+        area=np.pi * radius.astype(np.float64) ** 2  # Approximate area
+    )
+
+# Register the built-in detectors. The heuristics serve every class by
+# default; bump a version when its output changes so cached and stored
+# results produced by the old version are recomputed. Runways are hundreds
+# of pixels long and are found at a quarter of the resolution; aircraft and
+# houses are 8-30 px and need full resolution
+for _key, _function, _version, _level in (
+    ("runways", detect_runways_mock, "3", 2),
+    ("aircraft", detect_aircraft_mock, "2", 0),
+    ("houses", detect_houses_mock, "2", 0),
+    ("roads", detect_roads_mock, "2", 0),
+    ("water_bodies", detect_water_bodies_mock, "2", 0)
+):
+    register_detector(HeuristicDetector(_key, "heuristic", _function, version=_version, level=_level))
+
+# Bundled stand-in CPU model for the point-like classes
+for _key in ("aircraft", "houses"):
+    register_detector(DnnDetector(_key, "standin-onnx", STANDIN_MODEL_PATH, version="1"))
 
 async def generate_visualization(
     image_path: str,
@@ -393,7 +781,9 @@ async def generate_visualization(
     show_aircraft: bool = True,
     show_houses: bool = True,
     show_roads: bool = True,
-    show_water_bodies: bool = True
+    show_water_bodies: bool = True,
+    context: Optional[ImageContext] = None,
+    max_dimension: Optional[int] = None
 ) -> np.ndarray:
     """
     Generate a visualization of the detection results
@@ -402,13 +792,31 @@ async def generate_visualization(
         image_path: Path to the original image
         results: Detection results
         show_*: Flags for which object types to visualize
+        context: Decoded image of the job, used instead of reading image_path again
+        max_dimension: Largest edge of the output; larger images are drawn downscaled
         
     Returns:
         Visualization image as a numpy array
     """
-    # Load the original image
-    image = cv2.imread(image_path)
-    image_vis = image.copy()
+    base = context.bgr if context is not None else cv2.imread(image_path)
+    details = Detections.from_details(results["details"])
+    
+    height, width = base.shape[:2]
+    if max_dimension and max(height, width) > max_dimension:
+        # Draw on a downscaled copy and bring the detections to its scale
+        scale = max_dimension / max(height, width)
+        image_vis = cv2.resize(
+            base,
+            (max(1, int(width * scale)), max(1, int(height * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+        details = Detections({key: detections.scale(scale) for key, detections in details.items()})
+    elif context is not None:
+        # The shared planes are read-only, so draw on a single private copy
+        image_vis = base.copy()
+    else:
+        # A freshly decoded image is ours to draw on
+        image_vis = base
     
     # Define colors for different object types (BGR format)
     colors = {
@@ -421,43 +829,46 @@ async def generate_visualization(
     
     # Draw runways
     if show_runways:
-        for runway in results["details"]["runways"]:
-            bbox = runway["bbox"]
-            cv2.rectangle(image_vis, (bbox[0], bbox[1]), (bbox[2], bbox[3]), colors["runway"], 2)
-            cv2.putText(image_vis, f"Runway {runway['id']} ({runway['confidence']:.2f})", 
-                     (bbox[0], bbox[1] - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, colors["runway"], 2)
+        runways = details["runways"]
+        boxes = np.round(runways.bboxes()).astype(np.int32).tolist()
+        outlines = [np.round(path).astype(np.int32) for path in runways.paths()]
+        for index, record in enumerate(runways.records):
+            x1, y1, x2, y2 = boxes[index]
+            if index < len(outlines) and len(outlines[index]):
+                cv2.polylines(image_vis, [outlines[index]], True, colors["runway"], 2)
+            else:
+                cv2.rectangle(image_vis, (x1, y1), (x2, y2), colors["runway"], 2)
+            cv2.putText(image_vis, f"Runway {record['id']} ({record['confidence']:.2f})", 
+                     (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, colors["runway"], 2)
     
     # Draw aircraft
     if show_aircraft:
-        for aircraft in results["details"]["aircraft"]:
-            bbox = aircraft["bbox"]
-            cv2.rectangle(image_vis, (bbox[0], bbox[1]), (bbox[2], bbox[3]), colors["aircraft"], 2)
-            cv2.putText(image_vis, f"Aircraft {aircraft['id']} ({aircraft['confidence']:.2f})", 
-                     (bbox[0], bbox[1] - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, colors["aircraft"], 2)
+        aircraft = details["aircraft"]
+        boxes = np.round(aircraft.bboxes()).astype(np.int32).tolist()
+        for (x1, y1, x2, y2), record in zip(boxes, aircraft.records):
+            cv2.rectangle(image_vis, (x1, y1), (x2, y2), colors["aircraft"], 2)
+            cv2.putText(image_vis, f"Aircraft {record['id']} ({record['confidence']:.2f})", 
+                     (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, colors["aircraft"], 2)
     
     # Draw houses
     if show_houses:
-        for house in results["details"]["houses"]:
-            bbox = house["bbox"]
-            cv2.rectangle(image_vis, (bbox[0], bbox[1]), (bbox[2], bbox[3]), colors["house"], 1)
+        for x1, y1, x2, y2 in np.round(details["houses"].bboxes()).astype(np.int32).tolist():
+            cv2.rectangle(image_vis, (x1, y1), (x2, y2), colors["house"], 1)
             
     # Draw roads
     if show_roads:
-        for road in results["details"]["roads"]:
-            polyline = np.array(road["polyline"], dtype=np.int32)
-            cv2.polylines(image_vis, [polyline], False, colors["road"], road["width"])
+        roads = details["roads"]
+        widths = np.nan_to_num(roads.records["width"], nan=2.0)
+        for polyline, road_width in zip(roads.paths(), widths):
+            polyline = np.round(polyline).astype(np.int32)
+            cv2.polylines(image_vis, [polyline], False, colors["road"], max(1, int(road_width)))
     
     # Draw water bodies
-    if show_water_bodies:
-        for water in results["details"]["water_bodies"]:
-            polygon = np.array(water["polygon"], dtype=np.int32)
-            cv2.polylines(image_vis, [polygon], True, colors["water_body"], 2)
-            
-            # Fill with semi-transparent color
-            overlay = image_vis.copy()
-            cv2.fillPoly(overlay, [polygon], colors["water_body"])
-            alpha = 0.4  # Transparency factor
-            cv2.addWeighted(overlay, alpha, image_vis, 1 - alpha, 0, image_vis)
+    if show_water_bodies and len(details["water_bodies"]):
+        polygons = [np.round(path).astype(np.int32) for path in details["water_bodies"].paths()]
+        # Fill all of them with a semi-transparent color in one blend
+        blend_fills(image_vis, polygons, colors["water_body"], WATER_FILL_ALPHA)
+        cv2.polylines(image_vis, polygons, True, colors["water_body"], 2)
     
     # Add summary text
     summary_text = []
@@ -479,110 +890,296 @@ async def generate_visualization(
     
     return image_vis
 
-def generate_geojson(results: Dict[str, Any]) -> Dict[str, Any]:
+def blend_fills(
+    image: np.ndarray,
+    polygons: List[np.ndarray],
+    color: Tuple[int, int, int],
+    alpha: float
+) -> None:
     """
-    Generate GeoJSON data from the detection results
+    Alpha-blend filled polygons onto an image in place
     
-    In a real implementation, this would convert pixel coordinates to geographic coordinates
+    All polygons are rasterized into one mask and blended in a single pass
+    restricted to their union bounding box, so the cost does not grow with
+    the number of polygons times the image size. Overlapping polygons are
+    blended once.
+    
+    Args:
+        image: BGR image to draw on
+        polygons: Polygons as int32 arrays of (x, y) points
+        color: Fill color in BGR order
+        alpha: Opacity of the fill
+    """
+    height, width = image.shape[:2]
+    points = np.concatenate([polygon.reshape(-1, 2) for polygon in polygons])
+    x1, y1 = np.maximum(points.min(axis=0), 0)
+    x2, y2 = np.minimum(points.max(axis=0) + 1, [width, height])
+    if x2 <= x1 or y2 <= y1:
+        return
+    
+    origin = np.array([x1, y1], dtype=np.int32)
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+    for polygon in polygons:
+        # One call per polygon: fillPoly treats several contours as one shape
+        # and would leave overlaps unfilled
+        cv2.fillPoly(mask, [polygon.reshape(-1, 2) - origin], 255)
+    
+    region = image[y1:y2, x1:x2]
+    fill = np.empty_like(region)
+    fill[:] = color
+    blended = cv2.addWeighted(fill, alpha, region, 1 - alpha, 0)
+    np.copyto(region, blended, where=mask.astype(bool)[..., None])
+
+def generate_geojson(results: Dict[str, Any], georef: Optional[GeoReference] = None) -> Dict[str, Any]:
+    """
+    Generate GeoJSON data from the detection results
     
     Args:
         results: Detection results
+        georef: Pixel to longitude/latitude mapping of the image
         
     Returns:
         GeoJSON data as a dictionary
     """
-    geojson = {
+    return {
         "type": "FeatureCollection",
-        "features": []
+        "features": list(iter_geojson_features(results["details"], georef))
     }
+
+def iter_geojson_features(
+    details: Dict[str, Any],
+    georef: Optional[GeoReference] = None,
+    chunk_size: int = GEOJSON_CHUNK_SIZE,
+    tolerance: Optional[float] = None,
+    precision: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Generate the GeoJSON features of detection details one by one
+    
+    Each object class is converted in chunks of chunk_size detections, one
+    vectorized coordinate transform per chunk, so only a chunk's features
+    exist as Python objects at any time. Without georeferencing the features
+    keep pixel coordinates.
+    
+    Args:
+        details: Detections, or detection dictionaries keyed by object class
+        georef: Pixel to longitude/latitude mapping of the image
+        chunk_size: Detections converted per transform call
+        tolerance: Douglas-Peucker tolerance in pixels applied to outlines
+        precision: Decimal places of the output coordinates
+        
+    Yields:
+        GeoJSON Feature dictionaries, runways first
+    """
+    details = Detections.from_details(details)
+    builders = (
+        ("runways", runway_features),
+        ("aircraft", aircraft_features),
+        ("houses", house_features),
+        ("roads", road_features),
+        ("water_bodies", water_body_features)
+    )
+    for key, builder in builders:
+        detections = details[key].simplify(tolerance)
+        if len(detections) <= chunk_size:
+            yield from builder(detections, georef, precision)
+            continue
+        for start in range(0, len(detections), chunk_size):
+            chunk = detections.take(np.arange(start, min(start + chunk_size, len(detections))))
+            yield from builder(chunk, georef, precision)
+
+def _column(detections: DetectionSet, name: str) -> List[Any]:
+    return np.round(detections.records[name].astype(np.float64), 3).tolist()
+
+def runway_features(
+    runways: DetectionSet,
+    georef: Optional[GeoReference],
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """GeoJSON Polygon features of runways, rotated outlines where reported"""
+    if not len(runways):
+        return []
+    
+    # Rotated outlines where reported, axis-aligned boxes otherwise
+    has_outline = np.diff(runways.offsets) > 0
+    outlines = georeference_paths(georef, runways.points, runways.offsets, precision=precision)
+    x1, y1, x2, y2 = runways.bboxes().T
+    corners = np.stack([x1, y1, x2, y1, x2, y2, x1, y2], axis=1).reshape(-1, 2)
+    boxes = georeference_paths(georef, corners, np.arange(0, 4 * len(runways) + 1, 4), precision=precision)
+    confidences = _column(runways, "confidence")
+    measurements = {name: _column(runways, name) for name in ("length", "runway_width", "heading")}
     
-    # Add runways
-    for runway in results["details"]["runways"]:
+    features = []
+    for index, runway_id in enumerate(runways.records["id"].tolist()):
+        ring = outlines[index] if has_outline[index] else boxes[index]
         feature = {
             "type": "Feature",
             "geometry": {
                 "type": "Polygon",
-                "coordinates": [[
-                    [runway["bbox"][0], runway["bbox"][1]],
-                    [runway["bbox"][2], runway["bbox"][1]],
-                    [runway["bbox"][2], runway["bbox"][3]],
-                    [runway["bbox"][0], runway["bbox"][3]],
-                    [runway["bbox"][0], runway["bbox"][1]]
-                ]]
+                "coordinates": [ring + [ring[0]]]
             },
             "properties": {
-                "id": runway["id"],
+                "id": runway_id,
                 "type": "runway",
-                "confidence": runway["confidence"]
+                "confidence": confidences[index]
             }
         }
-        geojson["features"].append(feature)
-    
-    # Add aircraft
-    for aircraft in results["details"]["aircraft"]:
-        feature = {
+        for name, values in measurements.items():
+            if not np.isnan(values[index]):
+                feature["properties"][name] = values[index]
+        if georef is not None and not np.isnan(measurements["length"][index]):
+            feature["properties"]["length_m"] = round(measurements["length"][index] * georef.pixel_size_m, 1)
+            feature["properties"]["width_m"] = round(measurements["runway_width"][index] * georef.pixel_size_m, 1)
+        features.append(feature)
+    return features
+
+def aircraft_features(
+    aircraft: DetectionSet,
+    georef: Optional[GeoReference],
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """GeoJSON Point features of aircraft"""
+    centers = georeference_paths(georef, aircraft.records["center"], precision=precision)
+    return [
+        {
             "type": "Feature",
             "geometry": {
                 "type": "Point",
-                "coordinates": [aircraft["center"][0], aircraft["center"][1]]
+                "coordinates": center
             },
             "properties": {
-                "id": aircraft["id"],
+                "id": aircraft_id,
                 "type": "aircraft",
-                "confidence": aircraft["confidence"]
+                "confidence": confidence
             }
         }
-        geojson["features"].append(feature)
-    
-    # Add houses
-    for house in results["details"]["houses"]:
-        feature = {
+        for aircraft_id, center, confidence in zip(
+            aircraft.records["id"].tolist(), centers, _column(aircraft, "confidence")
+        )
+    ]
+
+def house_features(
+    houses: DetectionSet,
+    georef: Optional[GeoReference],
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """GeoJSON Point features of houses"""
+    centers = georeference_paths(georef, houses.records["center"], precision=precision)
+    return [
+        {
             "type": "Feature",
             "geometry": {
                 "type": "Point",
-                "coordinates": [house["center"][0], house["center"][1]]
+                "coordinates": center
             },
             "properties": {
-                "id": house["id"],
+                "id": house_id,
                 "type": "house",
-                "confidence": house["confidence"],
-                "area": house["area"]
+                "confidence": confidence,
+                "area": area
             }
         }
-        geojson["features"].append(feature)
-    
-    # Add roads
-    for road in results["details"]["roads"]:
-        feature = {
+        for house_id, center, confidence, area in zip(
+            houses.records["id"].tolist(), centers, _column(houses, "confidence"), _column(houses, "area")
+        )
+    ]
+
+def road_features(
+    roads: DetectionSet,
+    georef: Optional[GeoReference],
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """GeoJSON LineString features of roads"""
+    polylines = georeference_paths(georef, roads.points, roads.offsets, precision=precision)
+    return [
+        {
             "type": "Feature",
             "geometry": {
                 "type": "LineString",
-                "coordinates": road["polyline"]
+                "coordinates": polyline
             },
             "properties": {
-                "id": road["id"],
+                "id": road_id,
                 "type": "road",
-                "confidence": road["confidence"],
-                "width": road["width"]
+                "confidence": confidence,
+                "width": road_width
             }
         }
-        geojson["features"].append(feature)
-    
-    # Add water bodies
-    for water in results["details"]["water_bodies"]:
-        feature = {
+        for road_id, polyline, confidence, road_width in zip(
+            roads.records["id"].tolist(), polylines, _column(roads, "confidence"), _column(roads, "width")
+        )
+    ]
+
+def water_body_features(
+    water_bodies: DetectionSet,
+    georef: Optional[GeoReference],
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """GeoJSON Polygon features of water bodies"""
+    polygons = georeference_paths(georef, water_bodies.points, water_bodies.offsets, precision=precision)
+    return [
+        {
             "type": "Feature",
             "geometry": {
                 "type": "Polygon",
-                "coordinates": [water["polygon"]]
+                "coordinates": [polygon if polygon[:1] == polygon[-1:] else polygon + polygon[:1]]
             },
             "properties": {
-                "id": water["id"],
+                "id": water_id,
                 "type": "water_body",
-                "confidence": water["confidence"],
-                "area": water["area"]
+                "confidence": confidence,
+                "area": area
             }
         }
-        geojson["features"].append(feature)
+        for water_id, polygon, confidence, area in zip(
+            water_bodies.records["id"].tolist(), polygons,
+            _column(water_bodies, "confidence"), _column(water_bodies, "area")
+        )
+    ]
+
+def stream_geojson(features: Iterable[Dict[str, Any]], batch_size: int = GEOJSON_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Serialize a FeatureCollection incrementally
+    
+    Features are encoded as they arrive and emitted in batches, so the whole
+    document never exists as one string.
     
-    return geojson
\ No newline at end of file
+    Args:
+        features: GeoJSON features, e.g. from iter_geojson_features
+        batch_size: Features encoded per yielded chunk
+        
+    Yields:
+        Consecutive pieces of the JSON document
+    """
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = ""
+    batch = []
+    for feature in features:
+        batch.append(json.dumps(feature))
+        if len(batch) >= batch_size:
+            yield separator + ", ".join(batch)
+            separator = ", "
+            batch = []
+    if batch:
+        yield separator + ", ".join(batch)
+    yield "]}"
+
+def stream_ndjson(features: Iterable[Dict[str, Any]], batch_size: int = GEOJSON_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Serialize features as newline-delimited GeoJSON, one Feature per line
+    
+    Args:
+        features: GeoJSON features, e.g. from iter_geojson_features
+        batch_size: Features encoded per yielded chunk
+        
+    Yields:
+        Batches of complete lines
+    """
+    batch = []
+    for feature in features:
+        batch.append(json.dumps(feature) + "\n")
+        if len(batch) >= batch_size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
@@ -0,0 +1,213 @@
+"""
+Proximity queries over analysis sites
+Vectorized great-circle distances and a grid index on Analysis coordinates, so
+nearby sites are found with index range scans instead of a full table scan
+"""
+import os
+import math
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.models.analysis import Analysis
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Mean Earth radius in kilometres
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+# Edge of the grid cells in degrees; a query reads one index range per row of
+# cells it covers, and filters the sites of those cells by exact distance
+GEO_CELL_DEGREES = float(os.getenv('GEO_CELL_DEGREES', 0.1))
+GEO_GRID_COLUMNS = int(round(360.0 / GEO_CELL_DEGREES))
+GEO_GRID_ROWS = int(round(180.0 / GEO_CELL_DEGREES))
+
+# Largest radius accepted by proximity queries
+NEARBY_MAX_RADIUS_KM = float(os.getenv('NEARBY_MAX_RADIUS_KM', 500.0))
+# Sites of the same user closer than this are reported as duplicates
+DUPLICATE_SITE_RADIUS_KM = float(os.getenv('DUPLICATE_SITE_RADIUS_KM', 0.5))
+# Rows given a grid cell per batch when indexing existing analyses
+GEO_INDEX_BATCH = 1000
+
+def haversine_km(latitude: float, longitude: float, latitudes, longitudes) -> np.ndarray:
+    """
+    Great-circle distances from one point to many
+
+    Args:
+        latitude: Latitude of the point in degrees
+        longitude: Longitude of the point in degrees
+        latitudes: Latitudes of the other points, array-like of shape (N,)
+        longitudes: Longitudes of the other points, array-like of shape (N,)
+
+    Returns:
+        Distances in kilometres, array of shape (N,)
+    """
+    return haversine_matrix([latitude], [longitude], latitudes, longitudes)[0]
+
+def haversine_matrix(latitudes_a, longitudes_a, latitudes_b, longitudes_b) -> np.ndarray:
+    """
+    Great-circle distances between every pair of points of two sets
+
+    Args:
+        latitudes_a: Latitudes of the first set in degrees, shape (N,)
+        longitudes_a: Longitudes of the first set in degrees, shape (N,)
+        latitudes_b: Latitudes of the second set in degrees, shape (M,)
+        longitudes_b: Longitudes of the second set in degrees, shape (M,)
+
+    Returns:
+        Distances in kilometres, array of shape (N, M)
+    """
+    lat_a = np.radians(np.asarray(latitudes_a, dtype=np.float64))[:, None]
+    lon_a = np.radians(np.asarray(longitudes_a, dtype=np.float64))[:, None]
+    lat_b = np.radians(np.asarray(latitudes_b, dtype=np.float64))[None, :]
+    lon_b = np.radians(np.asarray(longitudes_b, dtype=np.float64))[None, :]
+
+    a = np.sin((lat_b - lat_a) / 2) ** 2 + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2
+    # arcsin form; clipping guards against rounding just above 1 for antipodes
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def grid_row(latitude: float) -> int:
+    """Row of the grid cell containing a latitude"""
+    return min(max(int(math.floor((latitude + 90.0) / GEO_CELL_DEGREES)), 0), GEO_GRID_ROWS - 1)
+
+def grid_column(longitude: float) -> int:
+    """Column of the grid cell containing a longitude, wrapping around the antimeridian"""
+    return int(math.floor((longitude + 180.0) / GEO_CELL_DEGREES)) % GEO_GRID_COLUMNS
+
+def grid_cell(latitude: float, longitude: float) -> int:
+    """
+    Grid cell of a location
+
+    Cells are numbered row by row from the south-west, so the cells of one
+    row form a contiguous range of numbers.
+
+    Args:
+        latitude: Latitude in degrees
+        longitude: Longitude in degrees
+
+    Returns:
+        Cell number, stored in Analysis.geo_cell
+    """
+    return grid_row(float(latitude)) * GEO_GRID_COLUMNS + grid_column(float(longitude))
+
+def cell_ranges(latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, int]]:
+    """
+    Ranges of grid cells covering a circle
+
+    Each row of cells crossed by the circle contributes the columns spanned
+    by the circle's bounding box at that row, split in two where it crosses
+    the antimeridian. Rows near a pole cover every column.
+
+    Args:
+        latitude: Latitude of the center in degrees
+        longitude: Longitude of the center in degrees
+        radius_km: Radius in kilometres
+
+    Returns:
+        List of inclusive (first cell, last cell) ranges
+    """
+    delta_latitude = radius_km / KM_PER_DEGREE
+    south, north = latitude - delta_latitude, latitude + delta_latitude
+
+    # Longitudes span widest at the latitude of the circle furthest from the equator
+    widest = min(max(abs(south), abs(north)), 90.0)
+    cos_widest = math.cos(math.radians(widest))
+    if north >= 90.0 or south <= -90.0 or cos_widest <= 0 or radius_km / (KM_PER_DEGREE * cos_widest) >= 180.0:
+        columns = [(0, GEO_GRID_COLUMNS - 1)]
+    else:
+        delta_longitude = radius_km / (KM_PER_DEGREE * cos_widest)
+        first, last = grid_column(longitude - delta_longitude), grid_column(longitude + delta_longitude)
+        columns = [(first, last)] if first <= last else [(first, GEO_GRID_COLUMNS - 1), (0, last)]
+
+    ranges = []
+    for row in range(grid_row(max(south, -90.0)), grid_row(min(north, 90.0)) + 1):
+        for first, last in columns:
+            ranges.append((row * GEO_GRID_COLUMNS + first, row * GEO_GRID_COLUMNS + last))
+    return ranges
+
+def index_analyses(session: Session) -> int:
+    """
+    Give a grid cell to analyses created before the column existed
+
+    The lookup of unindexed rows is itself served by the geo_cell index, so
+    calling this when everything is indexed costs one index probe.
+
+    Args:
+        session: Database session
+
+    Returns:
+        Number of analyses indexed
+    """
+    indexed = 0
+    while True:
+        batch = session.query(Analysis).filter(Analysis.geo_cell.is_(None)).limit(GEO_INDEX_BATCH).all()
+        if not batch:
+            break
+        for analysis in batch:
+            analysis.geo_cell = grid_cell(analysis.latitude, analysis.longitude)
+        session.flush()
+        indexed += len(batch)
+    if indexed:
+        logger.info(f"Indexed {indexed} analyses on the proximity grid")
+    return indexed
+
+def find_nearby(
+    session: Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    user_id: Optional[int] = None,
+    exclude_id: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[Tuple[Analysis, float]]:
+    """
+    Analyses within a distance of a location, nearest first
+
+    Candidates are read from the grid cells covering the circle through the
+    geo_cell index, then filtered by exact great-circle distance.
+
+    Args:
+        session: Database session
+        latitude: Latitude in degrees
+        longitude: Longitude in degrees
+        radius_km: Search radius in kilometres
+        user_id: Only return analyses of this user
+        exclude_id: Analysis left out of the results, e.g. the one being checked
+        limit: Largest number of analyses returned
+
+    Returns:
+        List of (analysis, distance in kilometres) pairs
+    """
+    ranges = cell_ranges(latitude, longitude, radius_km)
+    query = session.query(Analysis.id, Analysis.latitude, Analysis.longitude).filter(
+        or_(*(Analysis.geo_cell.between(first, last) for first, last in ranges))
+    )
+    if user_id is not None:
+        query = query.filter(Analysis.user_id == user_id)
+    if exclude_id is not None:
+        query = query.filter(Analysis.id != exclude_id)
+
+    candidates = query.all()
+    if not candidates:
+        return []
+
+    ids = np.array([row[0] for row in candidates], dtype=np.int64)
+    distances = haversine_km(
+        latitude, longitude,
+        [float(row[1]) for row in candidates],
+        [float(row[2]) for row in candidates]
+    )
+    inside = np.flatnonzero(distances <= radius_km)
+    inside = inside[np.argsort(distances[inside], kind="stable")][:limit]
+    if not len(inside):
+        return []
+
+    analyses = {
+        analysis.id: analysis
+        for analysis in session.query(Analysis).filter(Analysis.id.in_(ids[inside].tolist()))
+    }
+    return [(analyses[int(ids[index])], float(distances[index])) for index in inside]
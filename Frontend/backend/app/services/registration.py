@@ -0,0 +1,406 @@
+"""
+Co-registration of multi-date images of the same site
+Estimates the transform that maps one image onto another on a downsampled pyramid level,
+and keeps registrations and pre-warped image pairs in persistent caches
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+import cv2
+
+from app.services.disk_cache import DiskCache
+from app.services.image_context import ImageContext
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Longest edge of the pyramid level registrations are estimated on
+REGISTRATION_WORK_DIMENSION = int(os.getenv('REGISTRATION_WORK_DIMENSION', 1024))
+# Registrations and decoded images kept in memory
+REGISTRATION_CACHE_ENTRIES = int(os.getenv('REGISTRATION_CACHE_ENTRIES', 64))
+IMAGE_CACHE_ENTRIES = int(os.getenv('REGISTRATION_IMAGE_CACHE_ENTRIES', 8))
+
+# Persistent caches of registrations and of aligned image pairs
+REGISTRATION_CACHE_DIR = Path(os.getenv('REGISTRATION_CACHE_DIR', './cache/registrations'))
+REGISTRATION_CACHE_MAX_BYTES = int(os.getenv('REGISTRATION_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+ALIGNED_CACHE_DIR = Path(os.getenv('ALIGNED_CACHE_DIR', './cache/aligned'))
+ALIGNED_CACHE_MAX_BYTES = int(os.getenv('ALIGNED_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Feature matching settings
+ORB_FEATURES = 5000
+MIN_MATCHES = 12
+RANSAC_THRESHOLD = 3.0
+ECC_ITERATIONS = 100
+ECC_EPSILON = 1e-5
+
+# Output size limits of aligned pairs
+ALIGNED_DEFAULT_SIZE = 2048
+ALIGNED_MAX_SIZE = 4096
+ALIGNED_JPEG_QUALITY = 90
+
+registration_cache = DiskCache(REGISTRATION_CACHE_DIR, REGISTRATION_CACHE_MAX_BYTES, ".json")
+aligned_cache = DiskCache(ALIGNED_CACHE_DIR, ALIGNED_CACHE_MAX_BYTES, ".jpg")
+
+class Registration:
+    """
+    Transform from the pixels of an "after" image to those of a "before" image
+
+    matrix is a 3x3 homography in full-resolution pixel coordinates, and
+    score the method's confidence in [0, 1].
+    """
+
+    def __init__(self, matrix: np.ndarray, score: float, method: str):
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.score = float(score)
+        self.method = method
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form for API responses"""
+        return {
+            "matrix": np.round(self.matrix, 6).tolist(),
+            "score": round(self.score, 4),
+            "method": self.method
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Registration":
+        """Inverse of to_dict"""
+        return cls(np.array(data["matrix"], dtype=np.float64), data["score"], data["method"])
+
+    def apply(self, points: np.ndarray) -> np.ndarray:
+        """
+        Map after-image pixel coordinates into the before image
+
+        Args:
+            points: Array of shape (N, 2)
+
+        Returns:
+            Array of shape (N, 2)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        projected = np.hstack((points, np.ones((len(points), 1)))) @ self.matrix.T
+        return projected[:, :2] / projected[:, 2:3]
+
+def work_level(shape: Tuple[int, ...], max_dimension: int) -> int:
+    """Smallest pyramid level whose longest edge fits in max_dimension"""
+    level = 0
+    longest = max(shape[:2])
+    while longest > max_dimension:
+        longest = (longest + 1) // 2
+        level += 1
+    return level
+
+def match_features(reference: np.ndarray, moving: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
+    """
+    Homography between two grayscale images from matched ORB features
+
+    Args:
+        reference: Image to align with
+        moving: Image to align
+
+    Returns:
+        Tuple of (homography from moving to reference pixels, inlier ratio),
+        or None if too few features match
+    """
+    orb = cv2.ORB_create(ORB_FEATURES)
+    keypoints_ref, descriptors_ref = orb.detectAndCompute(reference, None)
+    keypoints_mov, descriptors_mov = orb.detectAndCompute(moving, None)
+    if descriptors_ref is None or descriptors_mov is None:
+        return None
+
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(descriptors_mov, descriptors_ref)
+    if len(matches) < MIN_MATCHES:
+        return None
+    source = np.float32([keypoints_mov[m.queryIdx].pt for m in matches])
+    target = np.float32([keypoints_ref[m.trainIdx].pt for m in matches])
+
+    matrix, inliers = cv2.findHomography(source, target, cv2.RANSAC, RANSAC_THRESHOLD)
+    if matrix is None or int(inliers.sum()) < MIN_MATCHES:
+        return None
+    return matrix, float(inliers.mean())
+
+def phase_correlation(reference: np.ndarray, moving: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Translation between two grayscale images by phase correlation
+
+    Both images are cropped to their common size.
+
+    Args:
+        reference: Image to align with
+        moving: Image to align
+
+    Returns:
+        Tuple of (translation from moving to reference pixels, peak response)
+    """
+    height = min(reference.shape[0], moving.shape[0])
+    width = min(reference.shape[1], moving.shape[1])
+    window = cv2.createHanningWindow((width, height), cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(
+        reference[:height, :width].astype(np.float32),
+        moving[:height, :width].astype(np.float32),
+        window
+    )
+    # A feature at p in the reference appears at p + (dx, dy) in the moving image
+    matrix = np.array([[1.0, 0.0, -dx], [0.0, 1.0, -dy], [0.0, 0.0, 1.0]])
+    return matrix, min(max(response, 0.0), 1.0)
+
+def refine_ecc(reference: np.ndarray, moving: np.ndarray, matrix: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
+    """
+    Refine a homography by maximizing the enhanced correlation coefficient
+
+    Args:
+        reference: Image to align with
+        moving: Image to align
+        matrix: Initial homography from moving to reference pixels
+
+    Returns:
+        Tuple of (refined homography, correlation coefficient), or None if
+        the optimization does not converge
+    """
+    # ECC estimates the warp from template (reference) to input (moving) pixels
+    warp = np.linalg.inv(matrix).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, ECC_ITERATIONS, ECC_EPSILON)
+    try:
+        correlation, warp = cv2.findTransformECC(
+            reference.astype(np.float32), moving.astype(np.float32), warp, cv2.MOTION_HOMOGRAPHY, criteria, None, 5
+        )
+    except cv2.error:
+        return None
+    return np.linalg.inv(warp.astype(np.float64)), float(correlation)
+
+def estimate_registration(before: ImageContext, after: ImageContext) -> Registration:
+    """
+    Estimate the homography between two images
+
+    Runs on a pyramid level whose longest edge fits REGISTRATION_WORK_DIMENSION.
+    ORB feature matching gives the initial estimate, falling back to phase
+    correlation on scenes with too little texture to match, and ECC refines
+    it; the result is scaled back to full resolution.
+
+    Args:
+        before: Reference image
+        after: Image to align with the reference
+
+    Returns:
+        Registration mapping after-image pixels to before-image pixels
+    """
+    level = work_level(before.shape, REGISTRATION_WORK_DIMENSION)
+    reference = before.level(level).gray
+    moving = after.level(level).gray
+
+    matched = match_features(reference, moving)
+    if matched is not None:
+        (matrix, score), method = matched, "orb"
+    else:
+        (matrix, score), method = phase_correlation(reference, moving), "phase_correlation"
+
+    refined = refine_ecc(reference, moving, matrix)
+    if refined is not None:
+        (matrix, score), method = refined, f"{method}+ecc"
+
+    to_level = np.diag([1.0 / 2 ** level, 1.0 / 2 ** level, 1.0])
+    matrix = np.linalg.inv(to_level) @ matrix @ to_level
+    return Registration(matrix / matrix[2, 2], min(max(score, 0.0), 1.0), method)
+
+class _LRU:
+    """Small thread-safe LRU mapping"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+_registrations = _LRU(REGISTRATION_CACHE_ENTRIES)
+_images = _LRU(IMAGE_CACHE_ENTRIES)
+
+def _file_key(image_path: str) -> Tuple[str, int, int]:
+    stat = os.stat(image_path)
+    return (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+
+def load_image(image_path: str) -> Optional[ImageContext]:
+    """
+    Decode an image, reusing the decoded context of recent comparisons
+
+    Args:
+        image_path: Path to the image
+
+    Returns:
+        ImageContext, or None if the image could not be read
+    """
+    try:
+        key = _file_key(image_path)
+    except OSError:
+        return None
+    context = _images.get(key)
+    if context is None:
+        context = ImageContext.from_path(image_path)
+        if context is not None:
+            _images.put(key, context)
+    return context
+
+def registration_key(
+    before_path: str,
+    after_path: str,
+    pair: Optional[Tuple[int, int]] = None
+) -> str:
+    """
+    Build the cache key of an image pair
+
+    The key starts with the pair's image ids when known; the files' sizes and
+    modification times make a replaced image yield a new key.
+
+    Args:
+        before_path: Path to the reference image
+        after_path: Path to the image to align
+        pair: Ids of the (before, after) AnalysisImage rows
+
+    Returns:
+        Cache key
+    """
+    payload = json.dumps([_file_key(before_path), _file_key(after_path)])
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    return f"{pair[0]}_{pair[1]}_{digest}" if pair is not None else digest
+
+def get_registration(
+    before_path: str,
+    after_path: str,
+    before: Optional[ImageContext] = None,
+    after: Optional[ImageContext] = None,
+    pair: Optional[Tuple[int, int]] = None
+) -> Optional[Registration]:
+    """
+    Get the registration of an image pair, estimating it on first use
+
+    Registrations are kept in memory and on disk, so each pair is estimated
+    once across requests and worker processes.
+
+    Args:
+        before_path: Path to the reference image
+        after_path: Path to the image to align
+        before: Decoded reference image, if already at hand
+        after: Decoded image to align, if already at hand
+        pair: Ids of the (before, after) AnalysisImage rows
+
+    Returns:
+        Registration, or None if either image could not be read
+    """
+    try:
+        key = registration_key(before_path, after_path, pair)
+    except OSError:
+        return None
+    registration = _registrations.get(key)
+    if registration is not None:
+        return registration
+
+    data = registration_cache.read(key)
+    if data is not None:
+        registration = Registration.from_dict(json.loads(data))
+    else:
+        before = before or load_image(before_path)
+        after = after or load_image(after_path)
+        if before is None or after is None:
+            return None
+        registration = estimate_registration(before, after)
+        registration_cache.write(key, json.dumps(registration.to_dict()).encode("utf-8"))
+        logger.info(f"Registered {after_path} onto {before_path} ({registration.method}, score {registration.score:.3f})")
+    _registrations.put(key, registration)
+    return registration
+
+def align_pair(
+    before: ImageContext,
+    after: ImageContext,
+    registration: Registration,
+    size: int = ALIGNED_DEFAULT_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resample both images onto the before image's grid at a common size
+
+    Args:
+        before: Reference image
+        after: Image to align
+        registration: Transform from after to before pixels
+        size: Largest edge of the output
+
+    Returns:
+        Tuple of (before, warped after) BGR images of the same shape; pixels
+        the after image does not cover are black
+    """
+    height, width = before.shape[:2]
+    scale = min(1.0, size / max(height, width))
+    output_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    # Warp from the pyramid level closest to the output resolution
+    level = int(np.floor(np.log2(1.0 / scale))) if scale < 1.0 else 0
+    source = after.level(level)
+    matrix = np.diag([scale, scale, 1.0]) @ registration.matrix @ np.diag([2.0 ** level, 2.0 ** level, 1.0])
+
+    reference = before.level(level).bgr
+    reference = cv2.resize(reference, output_size, interpolation=cv2.INTER_AREA)
+    warped = cv2.warpPerspective(source.bgr, matrix, output_size, flags=cv2.INTER_LINEAR)
+    return reference, warped
+
+def get_aligned_image(
+    before_path: str,
+    after_path: str,
+    side: str,
+    size: int = ALIGNED_DEFAULT_SIZE,
+    pair: Optional[Tuple[int, int]] = None
+) -> Optional[bytes]:
+    """
+    Get one side of an aligned image pair, rendering the pair on first use
+
+    Both sides are rendered and cached together, as a viewer comparing the
+    pair asks for the other side next.
+
+    Args:
+        before_path: Path to the reference image
+        after_path: Path to the image to align
+        side: "before" or "after"
+        size: Largest edge of the output
+        pair: Ids of the (before, after) AnalysisImage rows
+
+    Returns:
+        JPEG bytes, or None if either image could not be read
+    """
+    try:
+        key = f"{registration_key(before_path, after_path, pair)}_{size}"
+    except OSError:
+        return None
+    data = aligned_cache.read(f"{key}_{side}")
+    if data is not None:
+        return data
+
+    before = load_image(before_path)
+    after = load_image(after_path)
+    if before is None or after is None:
+        return None
+    registration = get_registration(before_path, after_path, before, after, pair)
+
+    encoded = {}
+    for name, image in zip(("before", "after"), align_pair(before, after, registration, size)):
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, ALIGNED_JPEG_QUALITY])
+        if not ok:
+            return None
+        encoded[name] = buffer.tobytes()
+        aligned_cache.write(f"{key}_{name}", encoded[name])
+    return encoded.get(side)
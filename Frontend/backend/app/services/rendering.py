@@ -0,0 +1,146 @@
+"""
+On-demand rendering of annotated detection images
+Renders stored detection results over their source image on first request and keeps the JPEGs in a bounded cache
+"""
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+import cv2
+
+from app.services.disk_cache import DiskCache
+from app.services.detections import Detections
+from app.services.image_context import ImageContext
+from app.services.object_detection import (
+    generate_visualization,
+    build_results,
+    TILING_MIN_PIXELS
+)
+from app.services.tiling import get_scene_shape, read_overview
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Render cache settings
+RENDER_CACHE_DIR = Path(os.getenv('RENDER_CACHE_DIR', './cache/renders'))
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Output size limits
+RENDER_DEFAULT_SIZE = 2048
+RENDER_MAX_SIZE = 4096
+RENDER_JPEG_QUALITY = 90
+
+# Layer toggles accepted by render_detection_image, in generate_visualization order
+LAYERS = ("show_runways", "show_aircraft", "show_houses", "show_roads", "show_water_bodies")
+
+# Cache shared by the render endpoint
+render_cache = DiskCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES, ".jpg")
+
+def make_render_key(
+    image_path: str,
+    details: Detections,
+    size: int,
+    layers: Dict[str, bool]
+) -> str:
+    """
+    Build the cache key of one rendering
+
+    The source file's size and modification time stand in for its content,
+    so replacing the image or re-running detection yields a new key.
+
+    Args:
+        image_path: Path to the source image
+        details: Detection details drawn on the image
+        size: Largest edge of the output
+        layers: show_* toggles
+
+    Returns:
+        Hex digest identifying the rendering
+    """
+    stat = os.stat(image_path)
+    payload = json.dumps({
+        "image": [os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns],
+        "details": Detections.from_details(details).digest(),
+        "size": size,
+        "layers": {name: bool(layers.get(name, True)) for name in LAYERS}
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def render_detection_image(
+    image_path: str,
+    details: Detections,
+    size: int = RENDER_DEFAULT_SIZE,
+    layers: Optional[Dict[str, bool]] = None
+) -> Optional[bytes]:
+    """
+    Draw detection details over their source image
+
+    Large scenes are read as a downsampled overview, so they are never
+    decoded at full resolution.
+
+    Args:
+        image_path: Path to the source image
+        details: Detection details in source pixel coordinates
+        size: Largest edge of the output
+        layers: show_* toggles; missing layers are shown
+
+    Returns:
+        JPEG bytes, or None if the image could not be read
+    """
+    layers = layers or {}
+    details = Detections.from_details(details)
+    results = build_results(details)
+
+    height, width = get_scene_shape(image_path)
+    if height * width > TILING_MIN_PIXELS:
+        overview, scale = read_overview(image_path, size)
+        context = ImageContext(rgb=overview)
+        results["details"] = Detections(
+            (key, detections.scale(scale)) for key, detections in details.items()
+        )
+    else:
+        context = ImageContext.from_path(image_path)
+        if context is None:
+            logger.error(f"Failed to load image: {image_path}")
+            return None
+
+    image = await generate_visualization(
+        image_path,
+        results,
+        *(bool(layers.get(name, True)) for name in LAYERS),
+        context=context,
+        max_dimension=size
+    )
+
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, RENDER_JPEG_QUALITY])
+    return encoded.tobytes() if ok else None
+
+async def get_rendered_image(
+    image_path: str,
+    details: Detections,
+    size: int = RENDER_DEFAULT_SIZE,
+    layers: Optional[Dict[str, bool]] = None
+) -> Optional[bytes]:
+    """
+    Get the annotated image, rendering it on the first request
+
+    Args:
+        image_path: Path to the source image
+        details: Detection details in source pixel coordinates
+        size: Largest edge of the output
+        layers: show_* toggles; missing layers are shown
+
+    Returns:
+        JPEG bytes, or None if the image could not be rendered
+    """
+    layers = layers or {}
+    key = make_render_key(image_path, details, size, layers)
+
+    data = render_cache.read(key)
+    if data is None:
+        data = await render_detection_image(image_path, details, size, layers)
+        if data is not None:
+            render_cache.write(key, data)
+    return data
@@ -0,0 +1,179 @@
+"""
+Level-of-detail simplification of detection outlines
+Ranks every vertex of a set of polylines or rings with Douglas-Peucker once, so
+any tolerance later reduces to a threshold on the stored weights
+"""
+import os
+import math
+import logging
+from typing import Optional
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Simplification error allowed on screen, in display pixels
+SIMPLIFY_SCREEN_PIXELS = float(os.getenv('SIMPLIFY_SCREEN_PIXELS', 0.5))
+
+# Metres per display pixel of a 256 px Web Mercator tile at zoom 0 on the equator
+WEB_MERCATOR_RESOLUTION_M = 156543.03392
+
+def ragged_arange(counts: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(count) for every count"""
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    return np.arange(total) - np.repeat(starts, counts)
+
+def segment_distances(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Distance of each point to the segment between the matching a and b rows"""
+    ab = b - a
+    length_sq = np.einsum("ij,ij->i", ab, ab)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("ij,ij->i", points - a, ab) / length_sq
+    t = np.where(length_sq > 0, np.clip(t, 0.0, 1.0), 0.0)
+    return np.linalg.norm(points - (a + t[:, None] * ab), axis=1)
+
+def first_max_per_group(values: np.ndarray, groups: np.ndarray, count: int) -> np.ndarray:
+    """
+    Position of the first largest value of each group
+
+    Args:
+        values: Values of all groups
+        groups: Group of each value; groups are contiguous, ascending and non-empty
+        count: Number of groups
+
+    Returns:
+        One index into values per group
+    """
+    starts = np.searchsorted(groups, np.arange(count))
+    maxima = np.maximum.reduceat(values, starts)
+    candidates = np.flatnonzero(values == maxima[groups])
+    first = np.ones(len(candidates), dtype=bool)
+    first[1:] = groups[candidates[1:]] != groups[candidates[:-1]]
+    return candidates[first]
+
+def douglas_peucker_weights(points: np.ndarray, offsets: np.ndarray, closed: bool = False) -> np.ndarray:
+    """
+    Douglas-Peucker rank of every vertex of many paths at once
+
+    The weight of a vertex is the distance at which Douglas-Peucker would
+    split on it, capped by the weight of the vertex that split its parent
+    segment. Simplifying with a tolerance therefore reduces to keeping the
+    vertices whose weight exceeds it, and the result equals a Douglas-Peucker
+    run with that tolerance. Each pass of the loop splits the segments of all
+    paths together, so the number of passes follows the recursion depth.
+
+    Args:
+        points: Array of shape (N, 2) with the points of all paths
+        offsets: Ragged offsets; path i owns points[offsets[i]:offsets[i + 1]]
+        closed: Whether the paths are rings whose last point connects to the first;
+            a ring may repeat its first point at the end
+
+    Returns:
+        Float32 weights aligned with points; vertices that are always kept are inf
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    weights = np.zeros(len(points), dtype=np.float64)
+    if not len(points):
+        return weights.astype(np.float32)
+
+    starts, lengths = offsets[:-1], np.diff(offsets)
+    paths = np.flatnonzero(lengths > 0)
+    starts, lengths = starts[paths], lengths[paths]
+    weights[starts] = np.inf
+    if closed:
+        # A ring that repeats its first point keeps the duplicate and is ranked
+        # without it, so simplified rings stay closed
+        last = starts + lengths - 1
+        repeated = (lengths > 1) & np.all(points[last] == points[starts], axis=1)
+        weights[last[repeated]] = np.inf
+        lengths = lengths - repeated
+    path_of_point = np.repeat(np.arange(len(paths)), lengths)
+    point_index = starts[path_of_point] + ragged_arange(lengths)
+
+    # Segments are (a, b) in path-relative positions; position == length wraps
+    # around to the first point of a ring
+    if closed:
+        # Anchor each ring at its first point and the point farthest from it
+        distances = np.linalg.norm(points[point_index] - points[starts[path_of_point]], axis=1)
+        far = point_index[first_max_per_group(distances, path_of_point, len(paths))] - starts
+        weights[starts + far] = np.inf
+        split = far > 0
+        a = np.concatenate((np.zeros(split.sum(), dtype=np.int64), far[split]))
+        b = np.concatenate((far[split], lengths[split]))
+        base = np.concatenate((starts[split], starts[split]))
+        size = np.concatenate((lengths[split], lengths[split]))
+    else:
+        weights[starts + lengths - 1] = np.inf
+        a = np.zeros(len(paths), dtype=np.int64)
+        b = lengths - 1
+        base, size = starts, lengths
+    parent = np.full(len(a), np.inf)
+
+    while len(a):
+        open_segments = b - a > 1
+        a, b, parent = a[open_segments], b[open_segments], parent[open_segments]
+        base, size = base[open_segments], size[open_segments]
+        if not len(a):
+            break
+
+        counts = b - a - 1
+        segment = np.repeat(np.arange(len(a)), counts)
+        positions = np.repeat(a + 1, counts) + ragged_arange(counts)
+        interior = np.repeat(base, counts) + positions % np.repeat(size, counts)
+        ends_a = points[base + a % size]
+        ends_b = points[base + b % size]
+        distances = segment_distances(points[interior], ends_a[segment], ends_b[segment])
+
+        best = first_max_per_group(distances, segment, len(a))
+        middle = positions[best]
+        weight = np.minimum(distances[best], parent)
+        weights[interior[best]] = weight
+
+        a, b = np.concatenate((a, middle)), np.concatenate((middle, b))
+        base, size = np.concatenate((base, base)), np.concatenate((size, size))
+        parent = np.concatenate((weight, weight))
+
+    if closed:
+        # Keep the most significant remaining vertex too, so rings never
+        # collapse below a triangle
+        eligible = np.isfinite(weights[point_index])
+        if np.any(eligible):
+            rings = path_of_point[eligible]
+            candidates = point_index[eligible]
+            order = np.lexsort((-weights[candidates], rings))
+            first = np.concatenate(([True], rings[order][1:] != rings[order][:-1]))
+            weights[candidates[order[first]]] = np.inf
+
+    return weights.astype(np.float32)
+
+def zoom_tolerance(
+    zoom: float,
+    latitude: float,
+    pixel_size_m: float,
+    screen_pixels: float = SIMPLIFY_SCREEN_PIXELS
+) -> float:
+    """
+    Simplification tolerance of a Web Mercator zoom level, in image pixels
+
+    Args:
+        zoom: Map zoom level, 256 px tiles
+        latitude: Latitude of the scene
+        pixel_size_m: Ground size of one image pixel
+        screen_pixels: Error allowed on screen
+
+    Returns:
+        Tolerance to pass to DetectionSet.simplify
+    """
+    metres_per_screen_pixel = WEB_MERCATOR_RESOLUTION_M * math.cos(math.radians(latitude)) / 2 ** zoom
+    return screen_pixels * metres_per_screen_pixel / pixel_size_m
+
+def simplify_mask(weights: np.ndarray, tolerance: Optional[float]) -> np.ndarray:
+    """Vertices to keep at a tolerance; everything when the tolerance is unset"""
+    if not tolerance or tolerance <= 0:
+        return np.ones(len(weights), dtype=bool)
+    return weights > tolerance
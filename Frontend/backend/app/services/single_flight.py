@@ -0,0 +1,100 @@
+"""
+Single-flight execution of concurrent identical work
+Lets one caller per key do the work while concurrent callers wait for and share its result
+"""
+import os
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key
+
+    Within a process, callers on any thread or event loop that ask for a key
+    while a call for it is in flight wait for that call instead of starting
+    their own. With a lock directory, calls for the same key in other
+    processes are also serialized through a file lock, so work that checks a
+    shared cache before doing anything finds the first process's result.
+    """
+
+    def __init__(self, lock_dir: Optional[Path] = None):
+        self.lock_dir = Path(lock_dir) if lock_dir is not None and fcntl is not None else None
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: str, work: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run work for a key, or wait for the run already in flight
+
+        Args:
+            key: Identity of the work, e.g. a cache key
+            work: Coroutine function doing the work
+
+        Returns:
+            Result of the leading call; followers get the same object
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+            self._counters["leaders" if leader else "followers"] += 1
+
+        if not leader:
+            # Shielded, so a cancelled follower does not cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        try:
+            async with self._file_lock(key):
+                result = await work()
+        except BaseException as e:
+            # Followers did not ask to be cancelled; they see an error instead
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError(f"Call for {key} was cancelled"))
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    @asynccontextmanager
+    async def _file_lock(self, key: str):
+        if self.lock_dir is None:
+            yield
+            return
+
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_dir / f"{key}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.debug(f"Waiting for another process working on {key}")
+                await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counts of leading and deduplicated calls, and calls in flight"""
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls), "cross_process": self.lock_dir is not None}
@@ -0,0 +1,270 @@
+"""
+Packed R-tree over the detections of an image
+Built once when detection results are stored and persisted next to them, so
+viewport queries only touch the detections they return
+"""
+import io
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+from app.services.detections import Detections, DETAIL_KEYS, FEATURE_TYPES, atomic_write
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Children per node; a query visits a few nodes per level
+RTREE_NODE_SIZE = 16
+
+class PackedRTree:
+    """
+    Static R-tree over axis-aligned boxes, packed bottom-up with
+    Sort-Tile-Recursive ordering
+
+    Level 0 holds the item boxes in packed order and every level above holds
+    the bounding boxes of RTREE_NODE_SIZE consecutive nodes of the level
+    below. All levels live in one (M, 4) array, so the tree is a handful of
+    flat arrays that load without any per-node objects.
+    """
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        level_bounds: np.ndarray,
+        order: np.ndarray,
+        classes: np.ndarray,
+        indices: np.ndarray,
+        node_size: int = RTREE_NODE_SIZE
+    ):
+        self.boxes = boxes
+        self.level_bounds = level_bounds
+        self.order = order
+        self.classes = classes
+        self.indices = indices
+        self.node_size = node_size
+
+    @classmethod
+    def build(cls, details: Detections, node_size: int = RTREE_NODE_SIZE) -> "PackedRTree":
+        """
+        Index the bounding boxes of all detections of an image
+
+        Args:
+            details: Detections in pixel coordinates
+            node_size: Children per node
+
+        Returns:
+            PackedRTree whose items are (object class, detection index) pairs
+        """
+        sets = [details[key] for key in DETAIL_KEYS if key in details]
+        boxes = np.concatenate(
+            [detections.bboxes().astype(np.float32).reshape(-1, 4) for detections in sets]
+            or [np.empty((0, 4), dtype=np.float32)]
+        )
+        classes = np.concatenate(
+            [np.full(len(detections), DETAIL_KEYS.index(detections.key), dtype=np.int8) for detections in sets]
+            or [np.empty(0, dtype=np.int8)]
+        )
+        indices = np.concatenate(
+            [np.arange(len(detections), dtype=np.int32) for detections in sets]
+            or [np.empty(0, dtype=np.int32)]
+        )
+
+        # Sort-Tile-Recursive: vertical slices by center x, then center y within each slice
+        count = len(boxes)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        leaves = max(1, -(-count // node_size))
+        slice_size = node_size * max(1, int(np.ceil(np.sqrt(leaves))))
+        slice_ids = np.empty(count, dtype=np.int64)
+        slice_ids[np.argsort(centers[:, 0], kind="stable")] = np.arange(count) // slice_size
+        order = np.lexsort((centers[:, 1], slice_ids)).astype(np.int32)
+
+        levels = [boxes[order]]
+        while len(levels[-1]) > 1:
+            level = levels[-1]
+            starts = np.arange(0, len(level), node_size)
+            levels.append(np.column_stack((
+                np.minimum.reduceat(level[:, 0], starts),
+                np.minimum.reduceat(level[:, 1], starts),
+                np.maximum.reduceat(level[:, 2], starts),
+                np.maximum.reduceat(level[:, 3], starts)
+            )))
+
+        level_bounds = np.zeros(len(levels) + 1, dtype=np.int64)
+        level_bounds[1:] = np.cumsum([len(level) for level in levels])
+        return cls(np.concatenate(levels), level_bounds, order, classes, indices, node_size)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def query(self, bbox: Sequence[float]) -> np.ndarray:
+        """
+        Find the items whose boxes intersect a box
+
+        The search descends level by level, testing only the children of
+        nodes that intersect, so its cost grows with the tree height and the
+        number of hits rather than the number of items.
+
+        Args:
+            bbox: Query box [x1, y1, x2, y2] in pixel coordinates
+
+        Returns:
+            Sorted item positions, i.e. indices into classes and indices
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+
+        x1, y1, x2, y2 = bbox
+        top = len(self.level_bounds) - 2
+        nodes = np.arange(self.level_bounds[top + 1] - self.level_bounds[top])
+        for level in range(top, -1, -1):
+            boxes = self.boxes[self.level_bounds[level] + nodes]
+            hits = (boxes[:, 0] <= x2) & (boxes[:, 2] >= x1) & (boxes[:, 1] <= y2) & (boxes[:, 3] >= y1)
+            nodes = nodes[hits]
+            if level == 0 or not len(nodes):
+                break
+            # Children of the surviving nodes on the level below
+            size = self.level_bounds[level] - self.level_bounds[level - 1]
+            children = (nodes[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+            nodes = children[children < size]
+
+        if level != 0:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(self.order[nodes])
+
+    def to_bytes(self) -> bytes:
+        """Serialize to an uncompressed .npz archive"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            boxes=self.boxes,
+            level_bounds=self.level_bounds,
+            order=self.order,
+            classes=self.classes,
+            indices=self.indices,
+            node_size=np.array(self.node_size)
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PackedRTree":
+        """Inverse of to_bytes"""
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            return cls(
+                archive["boxes"],
+                archive["level_bounds"],
+                archive["order"],
+                archive["classes"],
+                archive["indices"],
+                int(archive["node_size"])
+            )
+
+    def save(self, path: str) -> None:
+        """Write the index file, replacing any previous one atomically"""
+        atomic_write(path, self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> Optional["PackedRTree"]:
+        """
+        Read an index file
+
+        Args:
+            path: Path written by save
+
+        Returns:
+            PackedRTree, or None if the file is missing or unreadable
+        """
+        try:
+            with open(path, "rb") as f:
+                return cls.from_bytes(f.read())
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read spatial index from {path}: {str(e)}")
+            return None
+
+def index_path(image_path: str) -> str:
+    """Path of the spatial index stored next to an image"""
+    return f"{image_path}.rtree.npz"
+
+def select_detections(
+    details: Detections,
+    index: Optional[PackedRTree] = None,
+    bbox: Optional[Sequence[float]] = None,
+    keys: Optional[Iterable[str]] = None,
+    min_confidence: Optional[float] = None
+) -> Detections:
+    """
+    Subset of the detections matching viewport, class and confidence filters
+
+    Args:
+        details: Detections of one image
+        index: Spatial index built from details; required when bbox is given
+        bbox: Pixel box [x1, y1, x2, y2] the detections' boxes must intersect
+        keys: Object classes to keep; all when omitted
+        min_confidence: Lowest confidence to keep
+
+    Returns:
+        Detections with empty sets for the classes filtered out
+    """
+    keys = set(DETAIL_KEYS if keys is None else keys)
+    selected: Dict[str, np.ndarray] = {}
+    if bbox is not None:
+        hits = index.query(bbox)
+        for position, key in enumerate(DETAIL_KEYS):
+            selected[key] = index.indices[hits[index.classes[hits] == position]]
+
+    subset = Detections.empty()
+    for key in keys & set(details):
+        detections = details[key]
+        if key in selected:
+            detections = detections.take(np.sort(selected[key]))
+        if min_confidence is not None:
+            detections = detections.take(np.flatnonzero(detections.records["confidence"] >= min_confidence))
+        subset[key] = detections
+    return subset
+
+def filter_features(
+    features: Iterable[Dict[str, Any]],
+    bbox: Optional[Sequence[float]] = None,
+    keys: Optional[Iterable[str]] = None,
+    min_confidence: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Apply the select_detections filters to stored GeoJSON features
+
+    Used for images that only have GeoJSON and no detections sidecar. As
+    with select_detections, features without a confidence are dropped by a
+    confidence filter.
+
+    Args:
+        features: GeoJSON features with a type property
+        bbox: Box [x1, y1, x2, y2], in feature coordinates, the feature bounds must intersect
+        keys: Object classes to keep; all when omitted
+        min_confidence: Lowest confidence to keep
+
+    Returns:
+        Matching features, in order
+    """
+    types = {FEATURE_TYPES[key] for key in (DETAIL_KEYS if keys is None else keys)}
+    selected = []
+    for feature in features:
+        properties = feature.get("properties") or {}
+        if properties.get("type") not in types:
+            continue
+        if min_confidence is not None and not (properties.get("confidence") or 0) >= min_confidence:
+            continue
+        if bbox is not None:
+            points = np.asarray(list(_positions(feature["geometry"]["coordinates"])), dtype=np.float64)
+            if not len(points):
+                continue
+            low, high = points.min(axis=0), points.max(axis=0)
+            if low[0] > bbox[2] or high[0] < bbox[0] or low[1] > bbox[3] or high[1] < bbox[1]:
+                continue
+        selected.append(feature)
+    return selected
+
+def _positions(coordinates) -> Iterable[Sequence[float]]:
+    """Every [x, y] position of nested GeoJSON coordinates"""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates[:2]
+        return
+    for part in coordinates:
+        yield from _positions(part)
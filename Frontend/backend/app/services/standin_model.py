@@ -0,0 +1,98 @@
+"""
+Tiny stand-in ONNX model for the detector registry
+Lets the DNN detector path be exercised offline without real model weights
+"""
+import sys
+from pathlib import Path
+import numpy as np
+
+from app.utils.protobuf import varint_field, bytes_field, packed_varints
+
+# Location of the bundled model
+STANDIN_MODEL_PATH = Path(__file__).resolve().parent.parent / "assets" / "standin_bright_spots.onnx"
+
+# Model geometry: a single strided convolution maps 256x256 inputs to a 32x32 score grid
+INPUT_SIZE = 256
+CELL_SIZE = 8
+
+# ONNX enum values
+FLOAT = 1
+ATTRIBUTE_INT = 2
+ATTRIBUTE_INTS = 7
+
+def _tensor(name, array):
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return (
+        packed_varints(1, array.shape)
+        + varint_field(2, FLOAT)
+        + bytes_field(8, name)
+        + bytes_field(9, array.tobytes())
+    )
+
+def _value_info(name, dims):
+    shape = b''.join(
+        bytes_field(1, bytes_field(2, dim) if isinstance(dim, str) else varint_field(1, dim))
+        for dim in dims
+    )
+    tensor_type = varint_field(1, FLOAT) + bytes_field(2, shape)
+    return bytes_field(1, name) + bytes_field(2, bytes_field(1, tensor_type))
+
+def _ints_attribute(name, values):
+    return bytes_field(1, name) + varint_field(20, ATTRIBUTE_INTS) + b''.join(
+        varint_field(8, v) for v in values
+    )
+
+def _node(op_type, inputs, outputs, attributes=()):
+    return (
+        b''.join(bytes_field(1, name) for name in inputs)
+        + b''.join(bytes_field(2, name) for name in outputs)
+        + bytes_field(3, f"{op_type.lower()}_0")
+        + bytes_field(4, op_type)
+        + b''.join(bytes_field(5, attribute) for attribute in attributes)
+    )
+
+def build_standin_model(gain: float = 20.0, threshold: float = 0.6) -> bytes:
+    """
+    Build the stand-in "bright spots" model as serialized ONNX
+
+    Each output cell scores how bright the matching 8x8 input patch is:
+    sigmoid(gain * (mean(patch) - threshold)) for inputs scaled to [0, 1].
+
+    Args:
+        gain: Steepness of the score around the threshold
+        threshold: Mean brightness at which a cell scores 0.5
+
+    Returns:
+        Serialized ModelProto
+    """
+    weights = np.full((1, 3, CELL_SIZE, CELL_SIZE), gain / (3 * CELL_SIZE * CELL_SIZE))
+    bias = np.array([-gain * threshold])
+
+    nodes = [
+        _node("Conv", ["input", "weights", "bias"], ["logits"], [
+            _ints_attribute("kernel_shape", [CELL_SIZE, CELL_SIZE]),
+            _ints_attribute("strides", [CELL_SIZE, CELL_SIZE]),
+        ]),
+        _node("Sigmoid", ["logits"], ["scores"]),
+    ]
+    graph = (
+        b''.join(bytes_field(1, node) for node in nodes)
+        + bytes_field(2, "standin_bright_spots")
+        + bytes_field(5, _tensor("weights", weights))
+        + bytes_field(5, _tensor("bias", bias))
+        + bytes_field(11, _value_info("input", ["batch", 3, INPUT_SIZE, INPUT_SIZE]))
+        + bytes_field(12, _value_info("scores", ["batch", 1, INPUT_SIZE // CELL_SIZE, INPUT_SIZE // CELL_SIZE]))
+    )
+    opset = bytes_field(1, "") + varint_field(2, 11)
+    return (
+        varint_field(1, 7)
+        + bytes_field(2, "pistas_identification")
+        + bytes_field(7, graph)
+        + bytes_field(8, opset)
+    )
+
+if __name__ == "__main__":
+    # Regenerate the bundled model: python -m app.services.standin_model
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else STANDIN_MODEL_PATH
+    path.write_bytes(build_standin_model())
+    print(f"Wrote stand-in model to {path}")
@@ -0,0 +1,465 @@
+"""
+Synthetic satellite scenes with ground truth
+Generates reproducible scenes of any size with NumPy and OpenCV, renders them window by window and labels their objects as detections
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import cv2
+
+from app.services.detections import Detections, DetectionSet
+from app.services.georeference import FETCHED_IMAGE_RESOLUTION_M
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Largest scene edge accepted, in pixels
+SYNTHETIC_MAX_DIMENSION = 20000
+# Edge of the blocks large scenes are rendered and written in
+SCENE_BLOCK_SIZE = 2048
+# Edge of the value-noise lattice cells shaping the terrain, in pixels
+TERRAIN_CELL_SIZE = 256
+
+# Objects per square kilometre
+DEFAULT_DENSITIES = {"houses": 150.0, "roads": 3.0, "water_bodies": 0.5}
+AIRCRAFT_PER_RUNWAY = 4
+
+# Object sizes in metres
+RUNWAY_LENGTH_M = (1200.0, 3000.0)
+RUNWAY_WIDTH_M = (30.0, 60.0)
+AIRCRAFT_SPAN_M = (25.0, 60.0)
+HOUSE_SIZE_M = (8.0, 20.0)
+ROAD_WIDTH_M = (4.0, 10.0)
+ROAD_SEGMENT_M = (100.0, 400.0)
+WATER_RADIUS_M = (40.0, 250.0)
+
+# Vertices of generated shapes
+ROAD_VERTICES = 6
+WATER_VERTICES = 24
+
+# BGR colors; terrain, water and roads stay below the bright threshold the
+# runway detector segments on
+TERRAIN_DARK = np.array([30, 62, 38], dtype=np.float32)
+TERRAIN_LIGHT = np.array([55, 98, 72], dtype=np.float32)
+WATER_COLOR = (118, 82, 26)
+ROAD_COLOR = (84, 88, 90)
+RUNWAY_COLOR = (190, 190, 186)
+HOUSE_COLOR = (241, 240, 236)
+AIRCRAFT_COLOR = (225, 225, 230)
+
+def rotated_rectangles(centers: np.ndarray, lengths: np.ndarray, widths: np.ndarray, headings: np.ndarray) -> np.ndarray:
+    """
+    Corners of rotated rectangles
+
+    Args:
+        centers: Array of shape (N, 2)
+        lengths: Extent along the heading
+        widths: Extent across the heading
+        headings: Degrees clockwise from image up
+
+    Returns:
+        Array of shape (N, 4, 2)
+    """
+    radians = np.radians(headings)
+    # Unit vectors along and across the heading; image rows grow downwards
+    along = np.column_stack((np.sin(radians), -np.cos(radians)))
+    across = np.column_stack((np.cos(radians), np.sin(radians)))
+    half_length = (np.asarray(lengths) / 2)[:, None] * along
+    half_width = (np.asarray(widths) / 2)[:, None] * across
+    centers = np.asarray(centers, dtype=np.float64)
+    return np.stack((
+        centers - half_length - half_width,
+        centers + half_length - half_width,
+        centers + half_length + half_width,
+        centers - half_length + half_width
+    ), axis=1)
+
+def polygon_areas(polygons: np.ndarray) -> np.ndarray:
+    """Shoelace areas of an (N, K, 2) array of polygons"""
+    x, y = polygons[..., 0], polygons[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+
+def hash_noise(xs: np.ndarray, ys: np.ndarray, seed: int) -> np.ndarray:
+    """
+    Per-pixel noise in [-1, 1) from a hash of the pixel coordinates
+
+    The value of a pixel does not depend on the window it is rendered in.
+
+    Args:
+        xs: Column coordinates
+        ys: Row coordinates
+        seed: 64-bit seed
+
+    Returns:
+        Array of shape (len(ys), len(xs))
+    """
+    with np.errstate(over="ignore"):
+        h = (xs.astype(np.uint64)[None, :] * np.uint64(0x9E3779B97F4A7C15)) ^ \
+            (ys.astype(np.uint64)[:, None] * np.uint64(0xC2B2AE3D27D4EB4F)) ^ np.uint64(seed)
+        # splitmix64 finalizer
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xFF51AFD7ED558CCD)
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xC4CEB9FE1A85EC53)
+        h ^= h >> np.uint64(33)
+    return (h >> np.uint64(40)).astype(np.float32) / np.float32(2 ** 23) - np.float32(1.0)
+
+def fill_convex(image: np.ndarray, polygons: np.ndarray, bounds: np.ndarray, color: Tuple[int, int, int], x: int, y: int) -> None:
+    """
+    Fill convex polygons into a window of a scene
+
+    A pixel is filled when its center lies inside the polygon, tested in
+    scene coordinates, so a shape covers the same pixels whichever window it
+    is drawn in. OpenCV's fillPoly clips to the canvas before rasterizing and
+    leaves seams between windows.
+
+    Args:
+        image: Window to draw into, modified in place
+        polygons: Array of shape (N, K, 2), vertices in scene coordinates
+        bounds: Array of shape (N, 4) with each polygon's (x_min, y_min, x_max, y_max)
+        color: BGR fill color
+        x: Left edge of the window in the scene
+        y: Top edge of the window in the scene
+    """
+    height, width = image.shape[:2]
+    shown = np.flatnonzero(
+        (bounds[:, 2] >= x) & (bounds[:, 3] >= y) & (bounds[:, 0] < x + width) & (bounds[:, 1] < y + height)
+    )
+    if not len(shown):
+        return
+
+    polygons = polygons[shown]
+    # Orientation of each polygon, so "inside" is the same side of every edge
+    x0, y0 = polygons[..., 0], polygons[..., 1]
+    orientation = np.sign(np.sum(x0 * np.roll(y0, -1, axis=1) - np.roll(x0, -1, axis=1) * y0, axis=1))
+    edges = np.roll(polygons, -1, axis=1) - polygons
+    columns = np.clip(np.floor(bounds[shown][:, [0, 2]] - 0.5).astype(np.int64) + [0, 2], x, x + width) - x
+    rows = np.clip(np.floor(bounds[shown][:, [1, 3]] - 0.5).astype(np.int64) + [0, 2], y, y + height) - y
+
+    for polygon, edge, sign, (left, right), (top, bottom) in zip(polygons, edges, orientation, columns, rows):
+        if right <= left or bottom <= top or sign == 0:
+            continue
+        px = (np.arange(left, right) + (x + 0.5))[None, :]
+        py = (np.arange(top, bottom) + (y + 0.5))[:, None]
+        inside = np.ones((bottom - top, right - left), dtype=bool)
+        for (ax, ay), (dx, dy) in zip(polygon, edge):
+            inside &= sign * (dx * (py - ay) - dy * (px - ax)) >= 0
+        image[top:bottom, left:right][inside] = color
+
+class SyntheticScene:
+    """
+    A generated scene: terrain parameters, the shapes drawn over it, and its labels
+
+    Shapes are stored as convex vertex arrays, so any window of the scene can
+    be rendered on its own and large scenes never have to sit in memory whole.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        seed: int,
+        noise: float,
+        lattice: np.ndarray,
+        layers: List[Tuple[Tuple[int, int, int], np.ndarray]],
+        labels: Detections
+    ):
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.noise = noise
+        self.lattice = lattice
+        # (color, (N, K, 2) convex polygons, (N, 4) bounds) in drawing order
+        self.layers = [
+            (color, polygons, np.concatenate((polygons.min(axis=1), polygons.max(axis=1)), axis=1))
+            for color, polygons in layers if len(polygons)
+        ]
+        self.labels = labels
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (self.height, self.width, 3)
+
+    def terrain(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """
+        Background of a window: smooth value noise blending two land colors, plus pixel noise
+
+        Args:
+            x: Left edge of the window
+            y: Top edge of the window
+            width: Window width
+            height: Window height
+
+        Returns:
+            float32 BGR array of shape (height, width, 3)
+        """
+        xs = np.arange(x, x + width)
+        ys = np.arange(y, y + height)
+        gx = (xs + 0.5) / TERRAIN_CELL_SIZE
+        gy = (ys + 0.5) / TERRAIN_CELL_SIZE
+        ix, iy = gx.astype(np.int64), gy.astype(np.int64)
+        # Smoothstep weights hide the lattice
+        fx, fy = gx - ix, gy - iy
+        fx, fy = fx * fx * (3 - 2 * fx), fy * fy * (3 - 2 * fy)
+
+        lattice = self.lattice
+        top = lattice[iy][:, ix] * (1 - fx) + lattice[iy][:, ix + 1] * fx
+        bottom = lattice[iy + 1][:, ix] * (1 - fx) + lattice[iy + 1][:, ix + 1] * fx
+        field = (top * (1 - fy)[:, None] + bottom * fy[:, None]).astype(np.float32)
+
+        image = TERRAIN_DARK + field[..., None] * (TERRAIN_LIGHT - TERRAIN_DARK)
+        if self.noise:
+            image += (hash_noise(xs, ys, self.seed & 0xFFFFFFFFFFFFFFFF) * self.noise)[..., None]
+        return image
+
+    def render(self, x: int = 0, y: int = 0, width: Optional[int] = None, height: Optional[int] = None) -> np.ndarray:
+        """
+        Render a window of the scene
+
+        Args:
+            x: Left edge of the window
+            y: Top edge of the window
+            width: Window width, by default to the scene's right edge
+            height: Window height, by default to the scene's bottom edge
+
+        Returns:
+            uint8 BGR image
+        """
+        width = self.width - x if width is None else width
+        height = self.height - y if height is None else height
+        image = np.clip(self.terrain(x, y, width, height), 0, 255).astype(np.uint8, order="C")
+        for color, polygons, bounds in self.layers:
+            fill_convex(image, polygons, bounds, color, x, y)
+        return image
+
+    def save(self, path: str, block_size: int = SCENE_BLOCK_SIZE) -> str:
+        """
+        Write the scene to an image file
+
+        GeoTIFFs are written block by block, so scenes of any size can be
+        saved; other formats are rendered in one piece.
+
+        Args:
+            path: Output path; .tif/.tiff selects a tiled GeoTIFF
+            block_size: Edge of the blocks rendered at a time
+
+        Returns:
+            The output path
+        """
+        if not path.lower().endswith((".tif", ".tiff")):
+            if not cv2.imwrite(path, self.render()):
+                raise IOError(f"Failed to write {path}")
+            return path
+
+        import rasterio
+        from rasterio.windows import Window
+
+        profile = {
+            "driver": "GTiff",
+            "width": self.width,
+            "height": self.height,
+            "count": 3,
+            "dtype": "uint8",
+            "tiled": True,
+            "blockxsize": 256,
+            "blockysize": 256,
+        }
+        logger.info(f"Writing {self.width}x{self.height} synthetic scene to {path}")
+        with rasterio.open(path, "w", **profile) as dataset:
+            for row in range(0, self.height, block_size):
+                for col in range(0, self.width, block_size):
+                    height = min(block_size, self.height - row)
+                    width = min(block_size, self.width - col)
+                    block = self.render(col, row, width, height)
+                    # Bands in RGB order, as rasterio readers expect
+                    dataset.write(block[..., ::-1].transpose(2, 0, 1), window=Window(col, row, width, height))
+        return path
+
+def generate_scene(
+    width: int,
+    height: int,
+    seed: Optional[int] = None,
+    pixel_size_m: float = FETCHED_IMAGE_RESOLUTION_M,
+    runways: int = 1,
+    aircraft_per_runway: int = AIRCRAFT_PER_RUNWAY,
+    densities: Optional[Dict[str, float]] = None,
+    noise: float = 6.0
+) -> SyntheticScene:
+    """
+    Generate a synthetic scene and its ground truth
+
+    Every random choice comes from one numpy Generator seeded per call, so a
+    seed always yields the same scene.
+
+    Args:
+        width: Scene width in pixels
+        height: Scene height in pixels
+        seed: Seed of the scene; a random one is drawn (and kept on the scene) when omitted
+        pixel_size_m: Ground size of one pixel in metres
+        runways: Number of runways
+        aircraft_per_runway: Aircraft parked beside each runway
+        densities: Objects per square kilometre for "houses", "roads" and
+            "water_bodies"; missing classes use DEFAULT_DENSITIES
+        noise: Amplitude of the pixel noise in gray levels
+
+    Returns:
+        SyntheticScene whose labels hold every object in pixel coordinates
+    """
+    if not (0 < width <= SYNTHETIC_MAX_DIMENSION and 0 < height <= SYNTHETIC_MAX_DIMENSION):
+        raise ValueError(f"Scene dimensions must be between 1 and {SYNTHETIC_MAX_DIMENSION}")
+
+    seed = int(np.random.SeedSequence().entropy) if seed is None else int(seed)
+    rng = np.random.default_rng(seed)
+    densities = {**DEFAULT_DENSITIES, **(densities or {})}
+    area_km2 = width * height * pixel_size_m * pixel_size_m / 1e6
+    size = np.array([width, height], dtype=np.float64)
+
+    def metres(bounds: Tuple[float, float], count: int) -> np.ndarray:
+        return rng.uniform(*bounds, size=count) / pixel_size_m
+
+    lattice = rng.random((height // TERRAIN_CELL_SIZE + 2, width // TERRAIN_CELL_SIZE + 2))
+
+    # Runways, kept inside the scene
+    lengths = np.minimum(metres(RUNWAY_LENGTH_M, runways), 0.8 * min(width, height))
+    runway_widths = np.minimum(metres(RUNWAY_WIDTH_M, runways), lengths / 8)
+    runway_headings = rng.uniform(0, 180, size=runways)
+    reach = lengths[:, None] / 2 * np.abs(np.column_stack((
+        np.sin(np.radians(runway_headings)), np.cos(np.radians(runway_headings))
+    ))) + runway_widths[:, None]
+    runway_centers = reach + rng.random((runways, 2)) * np.maximum(size - 2 * reach, 0)
+    runway_polygons = rotated_rectangles(runway_centers, lengths, runway_widths, runway_headings)
+
+    # Aircraft parked in a row beside their runway, with random headings
+    owner = np.repeat(np.arange(runways), aircraft_per_runway)
+    spans = metres(AIRCRAFT_SPAN_M, len(owner))
+    radians = np.radians(runway_headings[owner])
+    along = np.column_stack((np.sin(radians), -np.cos(radians)))
+    across = np.column_stack((np.cos(radians), np.sin(radians)))
+    offsets_along = rng.uniform(-0.4, 0.4, size=len(owner)) * lengths[owner]
+    offsets_across = (runway_widths[owner] / 2 + spans + metres((10.0, 40.0), len(owner))) * rng.choice([-1, 1], size=len(owner))
+    aircraft_centers = np.clip(
+        runway_centers[owner] + along * offsets_along[:, None] + across * offsets_across[:, None],
+        spans[:, None], size - spans[:, None]
+    )
+    aircraft_headings = rng.uniform(0, 360, size=len(owner))
+    fuselages = rotated_rectangles(aircraft_centers, spans, spans * 0.14, aircraft_headings)
+    wings = rotated_rectangles(aircraft_centers, spans * 0.18, spans, aircraft_headings)
+    aircraft_corners = np.concatenate((fuselages, wings), axis=1)
+
+    # Houses, except on runways
+    house_count = rng.poisson(densities["houses"] * area_km2)
+    house_sides = np.column_stack((metres(HOUSE_SIZE_M, house_count), metres(HOUSE_SIZE_M, house_count)))
+    house_reach = np.hypot(house_sides[:, 0], house_sides[:, 1])[:, None] / 2
+    house_centers = house_reach + rng.random((house_count, 2)) * np.maximum(size - 2 * house_reach, 0)
+    house_polygons = rotated_rectangles(house_centers, house_sides[:, 0], house_sides[:, 1], rng.uniform(0, 90, size=house_count))
+    keep = np.ones(house_count, dtype=bool)
+    for center, length, runway_width, heading in zip(runway_centers, lengths, runway_widths, runway_headings):
+        rad = np.radians(heading)
+        relative = house_centers - center
+        distance_along = np.abs(relative @ [np.sin(rad), -np.cos(rad)])
+        distance_across = np.abs(relative @ [np.cos(rad), np.sin(rad)])
+        keep &= ~((distance_along < length / 2 + 20) & (distance_across < runway_width / 2 + 20))
+    house_polygons, house_centers = house_polygons[keep], house_centers[keep]
+
+    # Roads as random walks with a slowly turning heading
+    road_count = rng.poisson(densities["roads"] * area_km2)
+    turns = np.cumsum(rng.normal(0, 25, size=(road_count, ROAD_VERTICES - 1)), axis=1) + rng.uniform(0, 360, size=(road_count, 1))
+    steps = metres(ROAD_SEGMENT_M, road_count * (ROAD_VERTICES - 1)).reshape(road_count, ROAD_VERTICES - 1)
+    moves = np.stack((np.sin(np.radians(turns)), -np.cos(np.radians(turns))), axis=2) * steps[..., None]
+    starts = rng.random((road_count, 1, 2)) * size
+    road_paths = np.clip(np.concatenate((starts, starts + np.cumsum(moves, axis=1)), axis=1), 0, size - 1)
+    road_widths = np.maximum(1, np.round(metres(ROAD_WIDTH_M, road_count))).astype(np.int64)
+
+    # Water bodies as star-shaped blobs with a smooth, randomly perturbed radius
+    water_count = rng.poisson(densities["water_bodies"] * area_km2)
+    radii = metres(WATER_RADIUS_M, water_count)
+    angles = np.linspace(0, 2 * np.pi, WATER_VERTICES, endpoint=False)
+    harmonics = np.arange(1, 4)
+    amplitudes = rng.uniform(0, 0.15, size=(water_count, len(harmonics)))
+    phases = rng.uniform(0, 2 * np.pi, size=(water_count, len(harmonics)))
+    wobble = 1 + np.sum(amplitudes[:, :, None] * np.sin(harmonics[None, :, None] * angles + phases[:, :, None]), axis=1)
+    water_centers = rng.random((water_count, 2)) * size
+    water_polygons = water_centers[:, None, :] + (radii[:, None] * wobble)[..., None] * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    water_polygons = np.clip(water_polygons, 0, size - 1)
+
+    def boxes(polygons: np.ndarray) -> np.ndarray:
+        return np.concatenate((polygons.min(axis=1), polygons.max(axis=1)), axis=1) if len(polygons) else np.empty((0, 4))
+
+    runway_boxes, aircraft_boxes, house_boxes = boxes(runway_polygons), boxes(aircraft_corners), boxes(house_polygons)
+    labels = Detections({
+        "runways": DetectionSet.from_columns(
+            "runways",
+            paths=list(runway_polygons),
+            confidence=np.ones(runways),
+            bbox=runway_boxes,
+            center=runway_centers,
+            width=runway_boxes[:, 2] - runway_boxes[:, 0],
+            height=runway_boxes[:, 3] - runway_boxes[:, 1],
+            length=lengths,
+            runway_width=runway_widths,
+            heading=runway_headings
+        ),
+        "aircraft": DetectionSet.from_columns(
+            "aircraft",
+            confidence=np.ones(len(owner)),
+            bbox=aircraft_boxes,
+            center=aircraft_centers,
+            width=aircraft_boxes[:, 2] - aircraft_boxes[:, 0],
+            height=aircraft_boxes[:, 3] - aircraft_boxes[:, 1],
+            area=polygon_areas(fuselages) + polygon_areas(wings) - (spans * 0.14) * (spans * 0.18)
+        ),
+        "houses": DetectionSet.from_columns(
+            "houses",
+            confidence=np.ones(len(house_centers)),
+            bbox=house_boxes,
+            center=house_centers,
+            width=house_boxes[:, 2] - house_boxes[:, 0],
+            height=house_boxes[:, 3] - house_boxes[:, 1],
+            area=polygon_areas(house_polygons)
+        ),
+        "roads": DetectionSet.from_columns(
+            "roads",
+            paths=list(road_paths),
+            confidence=np.ones(road_count),
+            width=road_widths
+        ),
+        "water_bodies": DetectionSet.from_columns(
+            "water_bodies",
+            paths=[np.vstack((polygon, polygon[:1])) for polygon in water_polygons],
+            confidence=np.ones(water_count),
+            center=water_centers,
+            area=polygon_areas(water_polygons)
+        )
+    })
+
+    # Roads drawn as one rectangle per segment, with octagons rounding the joints
+    segment_starts, segment_ends = road_paths[:, :-1].reshape(-1, 2), road_paths[:, 1:].reshape(-1, 2)
+    segment_vectors = segment_ends - segment_starts
+    segment_widths = np.repeat(road_widths, ROAD_VERTICES - 1)
+    road_segments = rotated_rectangles(
+        (segment_starts + segment_ends) / 2,
+        np.hypot(segment_vectors[:, 0], segment_vectors[:, 1]),
+        segment_widths,
+        np.degrees(np.arctan2(segment_vectors[:, 0], -segment_vectors[:, 1]))
+    )
+    octagon = np.exp(1j * np.linspace(0, 2 * np.pi, 8, endpoint=False))
+    joints = road_paths[:, 1:-1].reshape(-1, 2)
+    joint_radii = np.repeat(road_widths, ROAD_VERTICES - 2) / 2
+    road_joints = joints[:, None, :] + joint_radii[:, None, None] * np.stack((octagon.real, octagon.imag), axis=1)
+
+    # Water drawn as a fan of triangles around each center, as the blobs are not convex
+    water_triangles = np.stack((
+        np.repeat(water_centers, WATER_VERTICES, axis=0),
+        water_polygons.reshape(-1, 2),
+        np.roll(water_polygons, -1, axis=1).reshape(-1, 2)
+    ), axis=1)
+
+    layers = [
+        (WATER_COLOR, water_triangles),
+        (ROAD_COLOR, road_segments),
+        (ROAD_COLOR, road_joints),
+        (RUNWAY_COLOR, runway_polygons),
+        (HOUSE_COLOR, house_polygons),
+        (AIRCRAFT_COLOR, np.concatenate((fuselages, wings)))
+    ]
+    return SyntheticScene(width, height, seed, noise, lattice, layers, labels)
@@ -0,0 +1,238 @@
+"""
+Tiling utilities for large satellite scenes
+Reads overlapping windows through rasterio and merges detections across tile seams
+"""
+import hashlib
+import logging
+from typing import Iterator, Optional, Tuple
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from app.services.detections import DetectionSet
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def get_scene_shape(image_path: str) -> Tuple[int, int]:
+    """
+    Read the pixel dimensions of a scene without decoding it
+
+    Args:
+        image_path: Path to the raster file
+
+    Returns:
+        Tuple of (height, width) in pixels
+    """
+    with rasterio.open(image_path) as dataset:
+        return dataset.height, dataset.width
+
+def scene_digest(image_path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    """
+    Content hash of a scene file, read in chunks without decoding it
+
+    Hashing the encoded bytes keeps a cache miss to one decode of the scene,
+    the one the tiled detection does.
+
+    Args:
+        image_path: Path to the raster file
+        chunk_bytes: Bytes read per chunk
+
+    Returns:
+        Hex digest of the file contents
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def iter_windows(
+    width: int,
+    height: int,
+    tile_size: int,
+    overlap: int
+) -> Iterator[Window]:
+    """
+    Iterate over overlapping windows covering the whole scene
+
+    Args:
+        width: Scene width in pixels
+        height: Scene height in pixels
+        tile_size: Edge length of each tile in pixels
+        overlap: Number of pixels shared between neighbouring tiles
+
+    Returns:
+        Iterator of rasterio windows in row-major order
+    """
+    if overlap >= tile_size:
+        raise ValueError("Tile overlap must be smaller than the tile size")
+
+    stride = tile_size - overlap
+    for row_off in range(0, max(height - overlap, 1), stride):
+        for col_off in range(0, max(width - overlap, 1), stride):
+            yield Window(
+                col_off,
+                row_off,
+                min(tile_size, width - col_off),
+                min(tile_size, height - row_off)
+            )
+
+def scene_gain(dataset, sample_size: int = 1024) -> Optional[float]:
+    """
+    Factor mapping a scene's samples into the 8-bit range, shared by all its tiles
+
+    Integer rasters are scaled by the range of their data type, as OpenCV
+    does when it decodes a whole image. Float rasters have no fixed range and
+    are scaled by the maximum of a decimated read of the scene.
+
+    Args:
+        dataset: Open rasterio dataset
+        sample_size: Largest edge of the decimated read for float rasters
+
+    Returns:
+        Multiplier for the samples, or None for 8-bit scenes
+    """
+    dtype = np.dtype(dataset.dtypes[0])
+    if dtype == np.uint8:
+        return None
+    if np.issubdtype(dtype, np.integer):
+        return 255.0 / np.iinfo(dtype).max
+
+    shrink = min(1.0, sample_size / max(dataset.width, dataset.height))
+    indexes = list(range(1, min(dataset.count, 3) + 1))
+    sample = dataset.read(
+        indexes,
+        out_shape=(len(indexes), max(1, int(dataset.height * shrink)), max(1, int(dataset.width * shrink))),
+        resampling=Resampling.nearest
+    )
+    max_value = float(np.nanmax(sample)) if sample.size else 0.0
+    return 255.0 / (max_value if max_value > 0 else 1.0)
+
+def to_rgb_uint8(data: np.ndarray, gain: Optional[float] = None) -> np.ndarray:
+    """
+    Convert a band-first raster array into an interleaved RGB uint8 image
+
+    Args:
+        data: Array of shape (bands, height, width) as read by rasterio
+        gain: Multiplier into the 8-bit range for other bit depths, e.g. from
+            scene_gain; defaults to stretching this array's own maximum
+
+    Returns:
+        Array of shape (height, width, 3)
+    """
+    if data.shape[0] >= 3:
+        data = data[:3]
+    else:
+        data = np.repeat(data[:1], 3, axis=0)
+
+    if data.dtype != np.uint8:
+        # Stretch other bit depths (e.g. 16-bit GeoTIFFs) into the 8-bit range
+        data = data.astype(np.float32)
+        if gain is None:
+            gain = 255.0 / (float(data.max()) or 1.0)
+        data = np.clip(data * gain, 0, 255).astype(np.uint8)
+
+    return np.ascontiguousarray(data.transpose(1, 2, 0))
+
+def read_window(dataset, window: Window, gain: Optional[float] = None) -> np.ndarray:
+    """
+    Read a single window of a scene as an RGB uint8 image
+
+    Args:
+        dataset: Open rasterio dataset
+        window: Window to read
+        gain: Scene-wide gain from scene_gain, so every tile is scaled alike
+
+    Returns:
+        Tile as a numpy array of shape (height, width, 3)
+    """
+    indexes = list(range(1, min(dataset.count, 3) + 1))
+    return to_rgb_uint8(dataset.read(indexes, window=window), gain)
+
+def read_overview(image_path: str, max_dimension: int) -> Tuple[np.ndarray, float]:
+    """
+    Read a downsampled overview of a scene, decoding at most max_dimension pixels per side
+
+    Args:
+        image_path: Path to the raster file
+        max_dimension: Largest allowed edge of the overview
+
+    Returns:
+        Tuple of (RGB overview image, scale factor from scene to overview pixels)
+    """
+    with rasterio.open(image_path) as dataset:
+        scale = min(1.0, max_dimension / max(dataset.width, dataset.height))
+        out_height = max(1, int(dataset.height * scale))
+        out_width = max(1, int(dataset.width * scale))
+        indexes = list(range(1, min(dataset.count, 3) + 1))
+        data = dataset.read(
+            indexes,
+            out_shape=(len(indexes), out_height, out_width),
+            resampling=Resampling.average
+        )
+        gain = scene_gain(dataset)
+
+    return to_rgb_uint8(data, gain), scale
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression over axis-aligned boxes
+
+    Args:
+        boxes: Array of shape (N, 4) with [x1, y1, x2, y2] rows
+        scores: Array of shape (N,) with confidence scores
+        iou_threshold: Boxes overlapping a kept box above this IoU are discarded
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    # Degenerate boxes (points, straight roads) still get a unit footprint
+    areas = np.maximum(x2 - x1, 1.0) * np.maximum(y2 - y1, 1.0)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+
+    keep = []
+    while order.size > 0:
+        current = order[0]
+        keep.append(current)
+        rest = order[1:]
+
+        inter_w = np.maximum(0.0, np.minimum(x2[current], x2[rest]) - np.maximum(x1[current], x1[rest]))
+        inter_h = np.maximum(0.0, np.minimum(y2[current], y2[rest]) - np.maximum(y1[current], y1[rest]))
+        intersection = inter_w * inter_h
+        iou = intersection / (areas[current] + areas[rest] - intersection)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+def merge_tile_detections(detections: DetectionSet, iou_threshold: float) -> DetectionSet:
+    """
+    Merge detections of one object class collected from overlapping tiles
+
+    Objects lying in the overlap between tiles are reported by every tile that
+    sees them; NMS keeps the most confident copy and ids are renumbered.
+
+    Args:
+        detections: Detections in scene pixel coordinates
+        iou_threshold: IoU above which two detections are considered the same object
+
+    Returns:
+        De-duplicated detections
+    """
+    if not len(detections):
+        return detections
+
+    scores = detections.records["confidence"].astype(np.float64)
+    keep = np.sort(non_max_suppression(detections.bboxes(), scores, iou_threshold))
+    return detections.take(keep).renumber()
@@ -0,0 +1,209 @@
+"""
+Time series of detection counts
+Maintains per-period aggregates of completed images so series are read without scanning image history
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+
+from app.models.analysis import AnalysisImage, AnalysisStats
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Resampling periods, each maintained as its own set of buckets
+PERIODS = ("day", "week", "month")
+
+# Count columns of AnalysisImage and the AnalysisStats columns aggregating them
+COUNT_COLUMNS = {
+    "aircraft": AnalysisImage.aircraft_count,
+    "house": AnalysisImage.house_count,
+    "road": AnalysisImage.road_count,
+    "water_body": AnalysisImage.water_body_count
+}
+
+def period_bounds(day: date, period: str) -> Tuple[date, date]:
+    """
+    First day of the period containing a day, and of the next period
+
+    Weeks start on Monday.
+
+    Args:
+        day: Any day
+        period: "day", "week" or "month"
+
+    Returns:
+        Tuple of (start, end) with end exclusive
+    """
+    if period == "day":
+        return day, day + timedelta(days=1)
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if period == "month":
+        start = day.replace(day=1)
+        end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+        return start, end
+    raise ValueError(f"Unknown period: {period}")
+
+def refresh_bucket(session: Session, analysis_id: int, period: str, day: date) -> Optional[AnalysisStats]:
+    """
+    Recompute the aggregates of one period from its completed images
+
+    Only the images dated inside the period are read, so the cost does not
+    grow with the analysis's history.
+
+    Args:
+        session: Database session
+        analysis_id: Analysis ID
+        period: "day", "week" or "month"
+        day: Any day inside the period
+
+    Returns:
+        Updated stats row, or None if the period has no completed images
+    """
+    start, end = period_bounds(day, period)
+    columns = [
+        func.count(AnalysisImage.id),
+        func.sum(case((AnalysisImage.runway_detected.is_(True), 1), else_=0)),
+        func.max(AnalysisImage.runway_length)
+    ]
+    for column in COUNT_COLUMNS.values():
+        columns += [func.sum(column), func.max(column)]
+
+    row = session.query(*columns).filter(
+        AnalysisImage.analysis_id == analysis_id,
+        AnalysisImage.status == "completed",
+        AnalysisImage.image_date >= datetime.combine(start, datetime.min.time()),
+        AnalysisImage.image_date < datetime.combine(end, datetime.min.time())
+    ).one()
+
+    stats = session.query(AnalysisStats).filter_by(
+        analysis_id=analysis_id, period=period, period_start=start
+    ).first()
+    if not row[0]:
+        if stats is not None:
+            session.delete(stats)
+        return None
+
+    if stats is None:
+        stats = AnalysisStats(analysis_id, period, start)
+        session.add(stats)
+    stats.image_count = row[0]
+    stats.runway_images = row[1] or 0
+    stats.runway_length_max = row[2]
+    for index, name in enumerate(COUNT_COLUMNS):
+        setattr(stats, f"{name}_sum", row[3 + 2 * index] or 0)
+        setattr(stats, f"{name}_max", row[4 + 2 * index] or 0)
+    return stats
+
+def update_image_stats(session: Session, image: AnalysisImage, previous_date: Optional[datetime] = None) -> None:
+    """
+    Bring the aggregates up to date after an image completes or changes
+
+    Call before committing the image; the refreshed rows join the same
+    transaction.
+
+    Args:
+        session: Database session
+        image: Image whose counts or status changed
+        previous_date: Former image_date, when the image was moved to another date
+    """
+    session.flush()
+    days = {moment.date() for moment in (image.image_date, previous_date) if moment is not None}
+    for day in days:
+        for period in PERIODS:
+            refresh_bucket(session, image.analysis_id, period, day)
+
+def rebuild_analysis_stats(session: Session, analysis_id: int) -> int:
+    """
+    Recompute every aggregate of an analysis, e.g. for images completed before the table existed
+
+    Args:
+        session: Database session
+        analysis_id: Analysis ID
+
+    Returns:
+        Number of stats rows written
+    """
+    session.query(AnalysisStats).filter_by(analysis_id=analysis_id).delete()
+    dates = session.query(AnalysisImage.image_date).filter(
+        AnalysisImage.analysis_id == analysis_id,
+        AnalysisImage.status == "completed",
+        AnalysisImage.image_date.isnot(None)
+    ).all()
+
+    buckets = {(period, period_bounds(moment.date(), period)[0]) for (moment,) in dates for period in PERIODS}
+    for period, start in buckets:
+        refresh_bucket(session, analysis_id, period, start)
+    return len(buckets)
+
+def unaggregated_analyses(session: Session, analysis_ids: Sequence[int]) -> List[int]:
+    """
+    Analyses that have completed images but no aggregates at all
+
+    These completed images before the aggregates existed. An analysis with
+    any stats row is left out, whatever the period or dates a caller reads.
+
+    Args:
+        session: Database session
+        analysis_ids: Analysis IDs to check
+
+    Returns:
+        IDs that need rebuild_analysis_stats, in input order
+    """
+    aggregated = {
+        key for (key,) in session.query(AnalysisStats.analysis_id).filter(
+            AnalysisStats.analysis_id.in_(list(analysis_ids))
+        ).distinct()
+    }
+    candidates = [key for key in analysis_ids if key not in aggregated]
+    if not candidates:
+        return []
+    completed = {
+        key for (key,) in session.query(AnalysisImage.analysis_id).filter(
+            AnalysisImage.analysis_id.in_(candidates),
+            AnalysisImage.status == "completed",
+            AnalysisImage.image_date.isnot(None)
+        ).distinct()
+    }
+    return [key for key in candidates if key in completed]
+
+def get_timeseries(
+    session: Session,
+    analysis_ids: Sequence[int],
+    period: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None
+) -> Dict[int, List[Dict]]:
+    """
+    Read the time series of several analyses in one query
+
+    Args:
+        session: Database session
+        analysis_ids: Analysis IDs
+        period: "day", "week" or "month"
+        start: First day included
+        end: Last day included
+
+    Returns:
+        Dictionary mapping each analysis ID to its points, oldest first
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+
+    query = session.query(AnalysisStats).filter(
+        AnalysisStats.analysis_id.in_(list(analysis_ids)),
+        AnalysisStats.period == period
+    )
+    if start is not None:
+        query = query.filter(AnalysisStats.period_start >= period_bounds(start, period)[0])
+    if end is not None:
+        query = query.filter(AnalysisStats.period_start <= end)
+
+    series: Dict[int, List[Dict]] = {analysis_id: [] for analysis_id in analysis_ids}
+    for stats in query.order_by(AnalysisStats.analysis_id, AnalysisStats.period_start):
+        series[stats.analysis_id].append(stats.to_dict())
+    return series
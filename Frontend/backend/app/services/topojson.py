@@ -0,0 +1,95 @@
+"""
+TopoJSON encoding of GeoJSON features
+Quantizes coordinates onto an integer grid, delta-encodes them and stores every distinct arc once
+"""
+import os
+import logging
+from typing import Dict, List, Any, Iterable
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Grid cells per axis of the quantized topology
+TOPOJSON_QUANTIZATION = int(os.getenv('TOPOJSON_QUANTIZATION', 100000))
+
+# Name of the geometry collection holding the features
+TOPOJSON_OBJECT = "detections"
+
+def encode_topology(
+    features: Iterable[Dict[str, Any]],
+    quantization: int = TOPOJSON_QUANTIZATION
+) -> Dict[str, Any]:
+    """
+    Convert GeoJSON features to a quantized TopoJSON topology
+
+    Lines and rings become arcs on a quantization x quantization grid over the
+    features' bounding box. Arcs are delta-encoded, and an arc that repeats an
+    earlier one, in either direction, refers to it instead of being stored
+    again.
+
+    Args:
+        features: GeoJSON Point, LineString and Polygon features
+        quantization: Grid cells per axis, at least 2
+
+    Returns:
+        TopoJSON Topology dictionary
+    """
+    features = list(features)
+    coordinates = [
+        np.asarray(feature["geometry"]["coordinates"], dtype=np.float64).reshape(-1, 2)
+        for feature in features
+    ]
+    if coordinates:
+        stacked = np.concatenate(coordinates) if any(len(c) for c in coordinates) else np.zeros((1, 2))
+        low, high = stacked.min(axis=0), stacked.max(axis=0)
+    else:
+        low, high = np.zeros(2), np.zeros(2)
+    scale = np.where(high > low, (high - low) / (quantization - 1), 1.0)
+
+    arcs: List[List[List[int]]] = []
+    arc_index: Dict[bytes, int] = {}
+
+    def add_arc(points: np.ndarray) -> int:
+        grid = np.round((points - low) / scale).astype(np.int64)
+        # Consecutive points that fall into the same cell carry no information
+        if len(grid) > 1:
+            moved = np.any(grid[1:] != grid[:-1], axis=1)
+            grid = grid[np.concatenate(([True], moved))]
+        key = grid.tobytes()
+        if key in arc_index:
+            return arc_index[key]
+        reverse_key = grid[::-1].tobytes()
+        if reverse_key in arc_index:
+            return ~arc_index[reverse_key]
+        arc_index[key] = len(arcs)
+        arcs.append(np.diff(grid, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).tolist())
+        return arc_index[key]
+
+    geometries = []
+    for feature, points in zip(features, coordinates):
+        geometry = feature["geometry"]
+        encoded = {"type": geometry["type"], "properties": feature.get("properties", {})}
+        if geometry["type"] == "Point":
+            encoded["coordinates"] = np.round((points[0] - low) / scale).astype(np.int64).tolist()
+        elif geometry["type"] == "LineString":
+            encoded["arcs"] = [add_arc(points)]
+        elif geometry["type"] == "Polygon":
+            encoded["arcs"] = [
+                [add_arc(np.asarray(ring, dtype=np.float64).reshape(-1, 2))]
+                for ring in geometry["coordinates"]
+            ]
+        else:
+            logger.warning(f"Skipping unsupported geometry type {geometry['type']}")
+            continue
+        geometries.append(encoded)
+
+    return {
+        "type": "Topology",
+        "bbox": [*low.tolist(), *high.tolist()],
+        "transform": {"scale": scale.tolist(), "translate": low.tolist()},
+        "objects": {
+            TOPOJSON_OBJECT: {"type": "GeometryCollection", "geometries": geometries}
+        },
+        "arcs": arcs
+    }
@@ -0,0 +1,391 @@
+"""
+Mapbox Vector Tile encoding of detected features
+Clips, simplifies, quantizes and encodes one image's detections per XYZ Web Mercator tile, with a disk cache
+"""
+import os
+import math
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional
+import numpy as np
+
+from app.services.disk_cache import DiskCache
+from app.services.detections import Detections, FEATURE_TYPES
+from app.services.georeference import GeoReference
+from app.services.object_detection import iter_geojson_features
+from app.services.simplification import zoom_tolerance
+from app.services.spatial_index import PackedRTree, select_detections
+from app.utils.protobuf import varint_field, bytes_field, double_field, packed_varints
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Tile cache settings
+TILE_CACHE_DIR = Path(os.getenv('TILE_CACHE_DIR', './cache/tiles'))
+TILE_CACHE_MAX_BYTES = int(os.getenv('TILE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Tile grid: coordinates per tile edge, and the margin kept around the tile
+# so that clipped edges do not show at tile seams
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_TILE_ZOOM = 22
+
+# MVT geometry types and commands
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+# Cache shared by the tile endpoint
+tile_cache = DiskCache(TILE_CACHE_DIR, TILE_CACHE_MAX_BYTES, ".mvt")
+
+def tile_bounds(z: int, x: int, y: int) -> List[float]:
+    """
+    Longitude/latitude box of an XYZ tile
+
+    Args:
+        z: Zoom level
+        x: Tile column
+        y: Tile row, counted from the north
+
+    Returns:
+        [min_lon, min_lat, max_lon, max_lat]
+    """
+    n = 2 ** z
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return [x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y)]
+
+def lonlat_to_tile(points: np.ndarray, z: int, x: int, y: int, extent: int = TILE_EXTENT) -> np.ndarray:
+    """
+    Project longitude/latitude to the coordinates of one tile
+
+    Args:
+        points: Array of shape (N, 2) with (longitude, latitude) rows
+        z: Zoom level
+        x: Tile column
+        y: Tile row
+
+    Returns:
+        Array of shape (N, 2); the tile covers [0, extent) on both axes, y down
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = 2 ** z
+    lat = np.radians(np.clip(points[:, 1], -85.0511, 85.0511))
+    columns = (points[:, 0] + 180.0) / 360.0 * n
+    rows = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n
+    return np.column_stack(((columns - x) * extent, (rows - y) * extent))
+
+def clip_polygon(ring: np.ndarray, low: float, high: float) -> np.ndarray:
+    """
+    Clip a ring to the square [low, high]² (Sutherland-Hodgman)
+
+    Each of the four edges is applied to all vertices at once.
+
+    Args:
+        ring: Array of shape (N, 2), not repeating the first point
+        low: Lower bound on both axes
+        high: Upper bound on both axes
+
+    Returns:
+        Clipped ring, possibly empty
+    """
+    for axis, bound, keep_below in ((0, low, False), (0, high, True), (1, low, False), (1, high, True)):
+        if not len(ring):
+            break
+        following = np.roll(ring, -1, axis=0)
+        inside = ring[:, axis] <= bound if keep_below else ring[:, axis] >= bound
+        inside_next = np.roll(inside, -1)
+        crossing = inside != inside_next
+        # Only edges that cross the boundary use their intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (bound - ring[:, axis]) / (following[:, axis] - ring[:, axis])
+            intersections = ring + t[:, None] * (following - ring)
+
+        # Every vertex contributes itself if inside, then the edge crossing if any
+        output = np.empty((2 * len(ring), 2))
+        output[0::2] = ring
+        output[1::2] = intersections
+        mask = np.empty(2 * len(ring), dtype=bool)
+        mask[0::2] = inside
+        mask[1::2] = crossing
+        ring = output[mask]
+    return ring
+
+def clip_polyline(line: np.ndarray, low: float, high: float) -> List[np.ndarray]:
+    """
+    Clip a polyline to the square [low, high]² (Liang-Barsky per segment)
+
+    Args:
+        line: Array of shape (N, 2)
+        low: Lower bound on both axes
+        high: Upper bound on both axes
+
+    Returns:
+        Parts of the line inside the square
+    """
+    if len(line) < 2:
+        return []
+    start, delta = line[:-1], np.diff(line, axis=0)
+    t0 = np.zeros(len(delta))
+    t1 = np.ones(len(delta))
+    for axis in (0, 1):
+        for p, q in ((-delta[:, axis], start[:, axis] - low), (delta[:, axis], high - start[:, axis])):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r = q / p
+            parallel = p == 0
+            t0 = np.where(~parallel & (p < 0), np.maximum(t0, r), t0)
+            t1 = np.where(~parallel & (p > 0), np.minimum(t1, r), t1)
+            # Segments parallel to and outside a boundary are rejected
+            t1 = np.where(parallel & (q < 0), -1.0, t1)
+
+    kept = t0 <= t1
+    entries = start + t0[:, None] * delta
+    exits = start + t1[:, None] * delta
+
+    # A part continues while consecutive kept segments meet inside the square
+    continues = np.zeros(len(delta), dtype=bool)
+    continues[1:] = kept[:-1] & kept[1:] & (t1[:-1] == 1) & (t0[1:] == 0)
+    parts = []
+    for first in np.flatnonzero(kept & ~continues):
+        last = first
+        while last + 1 < len(delta) and continues[last + 1]:
+            last += 1
+        parts.append(np.vstack((entries[first:first + 1], exits[first:last + 1])))
+    return parts
+
+def quantize(points: np.ndarray) -> np.ndarray:
+    """Round to integer tile coordinates and drop repeated consecutive points"""
+    points = np.round(points).astype(np.int64)
+    if len(points) < 2:
+        return points
+    moved = np.any(points[1:] != points[:-1], axis=1)
+    return points[np.concatenate(([True], moved))]
+
+def zigzag64(values: np.ndarray) -> np.ndarray:
+    """sint32/sint64 encoding of an integer array"""
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+def path_commands(cursor: np.ndarray, points: np.ndarray, close: bool) -> List[int]:
+    """
+    Command integers of one MoveTo/LineTo path
+
+    Args:
+        cursor: Pen position left by the previous path of the feature
+        points: Integer tile coordinates of the path
+        close: Whether to finish with ClosePath
+
+    Returns:
+        Geometry integers, with zigzag-encoded parameters
+    """
+    deltas = zigzag64(np.diff(points, axis=0, prepend=cursor[None])).tolist()
+    commands = [CMD_MOVE_TO | (1 << 3), *deltas[0]]
+    if len(deltas) > 1:
+        commands.append(CMD_LINE_TO | ((len(deltas) - 1) << 3))
+        for delta in deltas[1:]:
+            commands.extend(delta)
+    if close:
+        commands.append(CMD_CLOSE_PATH | (1 << 3))
+    return commands
+
+def encode_geometry(geometry: Dict[str, Any], z: int, x: int, y: int) -> Optional[tuple]:
+    """
+    Project, clip and encode a GeoJSON geometry for one tile
+
+    Args:
+        geometry: Point, LineString or Polygon in longitude/latitude
+        z: Zoom level
+        x: Tile column
+        y: Tile row
+
+    Returns:
+        (MVT geometry type, geometry integers), or None if nothing is left
+    """
+    low, high = -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER
+    origin = np.zeros(2, dtype=np.int64)
+
+    if geometry["type"] == "Point":
+        point = quantize(lonlat_to_tile(geometry["coordinates"], z, x, y))
+        if not np.all((point >= low) & (point <= high)):
+            return None
+        return GEOM_POINT, path_commands(origin, point, close=False)
+
+    if geometry["type"] == "LineString":
+        commands = []
+        cursor = origin
+        for part in clip_polyline(lonlat_to_tile(geometry["coordinates"], z, x, y), low, high):
+            part = quantize(part)
+            if len(part) < 2:
+                continue
+            commands.extend(path_commands(cursor, part, close=False))
+            cursor = part[-1]
+        return (GEOM_LINESTRING, commands) if commands else None
+
+    # Polygon exterior ring; GeoJSON rings repeat their first point, MVT rings do not
+    ring = lonlat_to_tile(geometry["coordinates"][0], z, x, y)
+    if len(ring) > 1 and np.all(ring[0] == ring[-1]):
+        ring = ring[:-1]
+    ring = quantize(clip_polygon(ring, low, high))
+    if len(ring) > 1 and np.all(ring[0] == ring[-1]):
+        ring = ring[:-1]
+    if len(ring) < 3:
+        return None
+    # Exterior rings wind clockwise on screen, i.e. positive shoelace area with y down
+    area = np.sum(ring[:, 0] * np.roll(ring[:, 1], -1) - np.roll(ring[:, 0], -1) * ring[:, 1])
+    if area == 0:
+        return None
+    if area < 0:
+        ring = ring[::-1]
+    return GEOM_POLYGON, path_commands(origin, ring, close=True)
+
+def encode_value(value: Any) -> bytes:
+    """Encode a property value as an MVT Value message"""
+    if isinstance(value, bool):
+        return varint_field(7, value)
+    if isinstance(value, int):
+        return varint_field(6, int(zigzag64(value)))
+    if isinstance(value, float):
+        return double_field(3, value)
+    return bytes_field(1, str(value))
+
+def encode_layer(name: str, features: Iterable[tuple], extent: int = TILE_EXTENT) -> bytes:
+    """
+    Encode one MVT layer
+
+    Args:
+        name: Layer name
+        features: (id, properties, geometry type, geometry integers) tuples
+        extent: Tile extent the geometry is expressed in
+
+    Returns:
+        Layer message bytes
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[tuple, int] = {}
+    encoded_features = []
+    for feature_id, properties, geom_type, geometry in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            # Values are deduplicated by type as well, so 1 and 1.0 stay distinct
+            value_key = (type(value).__name__, value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value_key, len(values)))
+        encoded_features.append(bytes_field(2, b"".join((
+            varint_field(1, feature_id),
+            packed_varints(2, tags),
+            varint_field(3, geom_type),
+            packed_varints(4, geometry)
+        ))))
+
+    return b"".join((
+        varint_field(15, 2),
+        bytes_field(1, name),
+        *encoded_features,
+        *(bytes_field(3, key) for key in keys),
+        *(bytes_field(4, encode_value(value)) for _, value in values),
+        varint_field(5, extent)
+    ))
+
+def encode_tile(
+    details: Detections,
+    index: PackedRTree,
+    georef: GeoReference,
+    z: int,
+    x: int,
+    y: int
+) -> bytes:
+    """
+    Encode the detections of one image that fall into a tile
+
+    Only detections found through the spatial index are projected, with
+    outlines simplified for the zoom level; each object class becomes a
+    layer named after its feature type.
+
+    Args:
+        details: Detections in pixel coordinates
+        index: Spatial index over details
+        georef: Georeferencing of the image
+        z: Zoom level
+        x: Tile column
+        y: Tile row
+
+    Returns:
+        Tile bytes; empty if no detection reaches the tile
+    """
+    # Query the buffered tile so features crossing the seam are found on both sides
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    margin_lon = (max_lon - min_lon) * TILE_BUFFER / TILE_EXTENT
+    margin_lat = (max_lat - min_lat) * TILE_BUFFER / TILE_EXTENT
+    bbox = georef.pixel_bbox([min_lon - margin_lon, min_lat - margin_lat, max_lon + margin_lon, max_lat + margin_lat])
+    subset = select_detections(details, index, bbox=bbox)
+    tolerance = zoom_tolerance(z, (min_lat + max_lat) / 2, georef.pixel_size_m)
+
+    layers: Dict[str, List[tuple]] = {name: [] for name in FEATURE_TYPES.values()}
+    for feature in iter_geojson_features(subset, georef, tolerance=tolerance):
+        encoded = encode_geometry(feature["geometry"], z, x, y)
+        if encoded is None:
+            continue
+        properties = feature["properties"]
+        layers[properties["type"]].append((properties["id"], properties, *encoded))
+
+    return b"".join(
+        bytes_field(3, encode_layer(name, features))
+        for name, features in layers.items() if features
+    )
+
+def make_tile_key(details_path: str, z: int, x: int, y: int) -> str:
+    """
+    Build the cache key of one tile
+
+    The sidecar's modification time is part of the key, so re-processing
+    an image, which rewrites its sidecar, invalidates all of its tiles.
+
+    Args:
+        details_path: Detections sidecar of the image
+        z: Zoom level
+        x: Tile column
+        y: Tile row
+
+    Returns:
+        Hex digest identifying the tile
+    """
+    stat = os.stat(details_path)
+    payload = f"{os.path.abspath(details_path)}:{stat.st_size}:{stat.st_mtime_ns}:{z}/{x}/{y}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_tile(
+    details_path: str,
+    details: Detections,
+    index: PackedRTree,
+    georef: GeoReference,
+    z: int,
+    x: int,
+    y: int
+) -> bytes:
+    """
+    Get a tile, encoding it on the first request
+
+    Args:
+        details_path: Detections sidecar the details were read from
+        details: Detections in pixel coordinates
+        index: Spatial index over details
+        georef: Georeferencing of the image
+        z: Zoom level
+        x: Tile column
+        y: Tile row
+
+    Returns:
+        Tile bytes
+    """
+    key = make_tile_key(details_path, z, x, y)
+    data = tile_cache.read(key)
+    if data is None:
+        data = encode_tile(details, index, georef, z, x, y)
+        tile_cache.write(key, data)
+    return data
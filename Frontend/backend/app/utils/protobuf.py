@@ -0,0 +1,74 @@
+"""
+Minimal Protocol Buffers wire-format writer
+Used to produce small binary formats (ONNX models, vector tiles) without extra dependencies
+"""
+import struct
+
+# Wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+def encode_varint(value):
+    """
+    Encode an unsigned integer as a base-128 varint
+
+    Negative values are encoded as 64-bit two's complement, as protobuf does for int64.
+
+    Args:
+        value (int): Integer to encode
+
+    Returns:
+        bytes: Encoded varint
+    """
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def zigzag(value):
+    """
+    Map a signed 32-bit integer onto an unsigned one (sint32 encoding)
+
+    Args:
+        value (int): Signed integer
+
+    Returns:
+        int: Zigzag-encoded integer
+    """
+    return (value << 1) ^ (value >> 31)
+
+def field_key(field_number, wire_type):
+    """Encode the key that precedes every field"""
+    return encode_varint((field_number << 3) | wire_type)
+
+def varint_field(field_number, value):
+    """Encode an integer, enum or bool field"""
+    return field_key(field_number, VARINT) + encode_varint(int(value))
+
+def bytes_field(field_number, value):
+    """Encode a bytes, string or embedded message field"""
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return field_key(field_number, LENGTH_DELIMITED) + encode_varint(len(value)) + value
+
+def float_field(field_number, value):
+    """Encode a 32-bit float field"""
+    return field_key(field_number, FIXED32) + struct.pack('<f', value)
+
+def double_field(field_number, value):
+    """Encode a 64-bit double field"""
+    return field_key(field_number, FIXED64) + struct.pack('<d', value)
+
+def packed_varints(field_number, values):
+    """Encode a packed repeated integer field"""
+    payload = b''.join(encode_varint(int(v)) for v in values)
+    return bytes_field(field_number, payload)
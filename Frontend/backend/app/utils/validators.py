@@ -68,6 +68,42 @@ def validate_password_strength(password):
     
     return True
 
+def parse_bool(value, default=False):
+    """
+    Parse a boolean query string value
+    
+    Args:
+        value (str): Raw value, e.g. "1", "true", "no"; None when absent
+        default (bool): Value returned when the parameter is absent
+        
+    Returns:
+        bool: Parsed value
+    """
+    if value is None:
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', 'off', '')
+
+def parse_bbox(value):
+    """
+    Parse a bbox query string value
+    
+    Args:
+        value (str): "min_x,min_y,max_x,max_y" in the coordinates of the
+            GeoJSON output; None when absent
+        
+    Returns:
+        list: Four floats, or None when the parameter is absent
+        
+    Raises:
+        ValueError: If the value is not a valid bounding box
+    """
+    if value is None:
+        return None
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError('bbox must be min_x,min_y,max_x,max_y')
+    return parts
+
 def require_json(f):
     """
     Decorator to require JSON content type in request
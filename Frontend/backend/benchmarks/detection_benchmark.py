@@ -0,0 +1,233 @@
+"""
+Benchmark for the object detection pipeline
+
+Writes a seeded synthetic GeoTIFF scene and runs detect_objects over it in
+separate processes, reporting wall-clock time and peak resident memory for each
+mode, and the accuracy of the detections against the scene's ground truth.
+
+Usage:
+    python -m benchmarks.detection_benchmark --size 8192 --tile-size 2048
+    python -m benchmarks.detection_benchmark --size 20000 --seed 3
+    python -m benchmarks.detection_benchmark --modes full --parallelism 1
+    python -m benchmarks.detection_benchmark --size 1024 --batch-images 64 --batch-workers 1,2,4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Any
+
+import numpy as np
+
+# Allow running as a plain script from the backend directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.change_detection import match_points, detection_centers
+from app.services.detections import Detections
+from app.services.synthetic_scene import generate_scene
+
+# Classes scored against the ground truth of synthetic scenes
+SCORED_CLASSES = ("runways", "aircraft", "houses")
+
+def write_scene(path: str, size: int, seed: int = 0, block: int = 1024) -> Detections:
+    """
+    Write a synthetic RGB GeoTIFF block by block so the scene never sits in memory
+
+    The ground truth is saved next to the scene, as <path>.truth.npz.
+
+    Args:
+        path: Output file path
+        size: Edge length of the square scene in pixels
+        seed: Seed of the scene, so runs can be repeated on the same corpus
+        block: Edge length of the blocks written at a time
+
+    Returns:
+        Ground-truth labels of the scene
+    """
+    scene = generate_scene(size, size, seed=seed, runways=max(1, size // 4096))
+    scene.save(path, block)
+    scene.labels.save(truth_path(path), meta={"seed": seed})
+    return scene.labels
+
+def truth_path(image_path: str) -> str:
+    """Path of the ground truth saved with a synthetic scene"""
+    return f"{image_path}.truth.npz"
+
+def score_detections(truth: Detections, found: Detections) -> Dict[str, Dict[str, float]]:
+    """
+    Precision and recall of detections against ground truth
+
+    Detections are paired with labels by their box centers, within half the
+    median diagonal of the class's labelled boxes.
+
+    Args:
+        truth: Ground-truth labels
+        found: Detections to score
+
+    Returns:
+        Dictionary mapping each boxed class to its precision and recall
+    """
+    scores = {}
+    for key in SCORED_CLASSES:
+        expected, detected = truth[key], found[key]
+        boxes = expected.bboxes()
+        radius = max(4.0, float(np.median(np.hypot(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]))) / 2) if len(boxes) else 4.0
+        matched, _ = match_points(detection_centers(expected), detection_centers(detected), radius)
+        scores[key] = {
+            "labels": len(expected),
+            "detections": len(detected),
+            "precision": len(matched) / len(detected) if len(detected) else float("nan"),
+            "recall": len(matched) / len(expected) if len(expected) else float("nan"),
+        }
+    return scores
+
+def _run_mode(image_path: str, mode: str, tile_size: int, parallelism, queue) -> None:
+    """Run a single detection mode and report timings through the queue"""
+    from app.services import object_detection
+
+    if mode == "tiled":
+        object_detection.TILE_SIZE = tile_size
+        tiled = True
+    else:
+        tiled = False
+
+    # Array buffers allocated through NumPy (including OpenCV outputs) are traced
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = asyncio.run(object_detection.detect_objects(image_path, tiled=tiled, parallelism=parallelism))
+    truth = Detections.load(truth_path(image_path))
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    queue.put({
+        "mode": mode,
+        "seconds": elapsed,
+        "peak_rss_mb": peak_mb,
+        "peak_traced_mb": traced_peak / (1024.0 * 1024.0),
+        "ok": results is not None,
+        "accuracy": score_detections(truth, results["details"]) if truth is not None and results is not None else None,
+    })
+
+def run_benchmark(image_path: str, modes, tile_size: int, parallelism=None) -> Dict[str, Any]:
+    """
+    Run each mode in a fresh process so peak memory figures do not overlap
+
+    Args:
+        image_path: Scene to process
+        modes: Iterable of mode names ("full", "tiled")
+        tile_size: Tile edge length for the tiled mode
+        parallelism: Detectors run at once (None uses DETECTOR_WORKERS)
+
+    Returns:
+        Dictionary of measurements keyed by mode
+    """
+    context = multiprocessing.get_context("spawn")
+    measurements = {}
+    for mode in modes:
+        queue = context.Queue()
+        process = context.Process(target=_run_mode, args=(image_path, mode, tile_size, parallelism, queue))
+        process.start()
+        process.join()
+        measurements[mode] = queue.get() if process.exitcode == 0 else {
+            "mode": mode, "seconds": float("nan"), "peak_rss_mb": float("nan"),
+            "peak_traced_mb": float("nan"), "ok": False, "accuracy": None
+        }
+    return measurements
+
+def run_batch_benchmark(image_path: str, count: int, worker_counts) -> Dict[int, float]:
+    """
+    Measure detect_objects_batch throughput for several process pool sizes
+
+    Args:
+        image_path: Scene processed count times per run
+        count: Number of images in each batch
+        worker_counts: Pool sizes to try
+
+    Returns:
+        Images per second keyed by pool size
+    """
+    from app.services import detector_engine
+    from app.services.object_detection import detect_objects_batch
+
+    async def consume():
+        failures = 0
+        async for item in detect_objects_batch([image_path] * count):
+            failures += item["error"] is not None
+        return failures
+
+    throughput = {}
+    for workers in worker_counts:
+        detector_engine.shutdown_process_pool()
+        detector_engine.BATCH_WORKERS = workers
+        # Warm the pool up so process start-up is not part of the measurement
+        asyncio.run(consume_one(image_path))
+        start = time.perf_counter()
+        failures = asyncio.run(consume())
+        elapsed = time.perf_counter() - start
+        throughput[workers] = count / elapsed
+        print(f"{workers:>3} workers: {throughput[workers]:8.2f} images/s ({failures} failed)")
+    detector_engine.shutdown_process_pool()
+    return throughput
+
+async def consume_one(image_path: str) -> None:
+    """Push a single image through the batch pool to start its workers"""
+    from app.services import detector_engine
+    from app.services.object_detection import detect_objects_batch
+
+    async for _ in detect_objects_batch([image_path] * detector_engine.BATCH_WORKERS):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the object detection pipeline")
+    parser.add_argument("--size", type=int, default=8192, help="Scene edge length in pixels")
+    parser.add_argument("--tile-size", type=int, default=2048, help="Tile edge length in pixels")
+    parser.add_argument("--modes", default="full,tiled", help="Comma separated modes to run")
+    parser.add_argument("--parallelism", type=int, help="Detectors run at once (1 is sequential)")
+    parser.add_argument("--batch-images", type=int, help="Benchmark batch throughput over this many images")
+    parser.add_argument("--batch-workers", default="1,2,4", help="Comma separated process pool sizes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic scene")
+    parser.add_argument("--image", help="Existing scene to use instead of a synthetic one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = args.image
+        if not image_path:
+            image_path = os.path.join(tmp_dir, f"scene_{args.size}.tif")
+            print(f"Writing synthetic {args.size}x{args.size} scene to {image_path}")
+            write_scene(image_path, args.size, seed=args.seed)
+
+        if args.batch_images:
+            worker_counts = [int(w) for w in args.batch_workers.split(",")]
+            run_batch_benchmark(image_path, args.batch_images, worker_counts)
+            return
+
+        measurements = run_benchmark(image_path, args.modes.split(","), args.tile_size, args.parallelism)
+
+    print(f"{'mode':<10}{'seconds':>10}{'peak RSS (MB)':>16}{'peak alloc (MB)':>18}{'ok':>6}")
+    for row in measurements.values():
+        print(
+            f"{row['mode']:<10}{row['seconds']:>10.2f}{row['peak_rss_mb']:>16.1f}"
+            f"{row['peak_traced_mb']:>18.1f}{str(row['ok']):>6}"
+        )
+
+    for row in measurements.values():
+        if not row["accuracy"]:
+            continue
+        print(f"\n{row['mode']} accuracy against ground truth")
+        print(f"{'class':<10}{'labels':>8}{'found':>8}{'precision':>11}{'recall':>8}")
+        for key, score in row["accuracy"].items():
+            print(
+                f"{key:<10}{score['labels']:>8}{score['detections']:>8}"
+                f"{score['precision']:>11.2f}{score['recall']:>8.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
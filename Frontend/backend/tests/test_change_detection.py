@@ -0,0 +1,104 @@
+"""
+Tests for co-registration and change detection between two dates
+"""
+import numpy as np
+import pytest
+import cv2
+
+from app.services import registration as registration_module
+from app.services.change_detection import compare_images, match_points
+from app.services.detections import Detections, DetectionSet
+from app.services.disk_cache import DiskCache
+from app.services.image_context import ImageContext
+from app.services.registration import estimate_registration, get_registration, get_aligned_image
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(registration_module, "registration_cache", DiskCache(tmp_path / "registrations", 10_000_000, ".json"))
+    monkeypatch.setattr(registration_module, "aligned_cache", DiskCache(tmp_path / "aligned", 10_000_000, ".jpg"))
+
+@pytest.fixture
+def scene():
+    # Smooth texture, so the phase correlation peak is well defined
+    rng = np.random.default_rng(3)
+    noise = rng.integers(0, 255, size=(300, 300), dtype=np.uint8)
+    texture = cv2.GaussianBlur(noise, (0, 0), 3)
+    return cv2.normalize(texture, None, 0, 255, cv2.NORM_MINMAX)
+
+def aircraft(centers):
+    centers = np.asarray(centers, dtype=np.float32)
+    bbox = np.hstack((centers - 5, centers + 5))
+    return DetectionSet.from_columns("aircraft", bbox=bbox, center=centers, confidence=np.full(len(centers), 0.9))
+
+def test_registration_recovers_the_shift(scene):
+    before = scene[20:276, 20:276]
+    after = scene[27:283, 15:271]  # content moved 5 px right and 7 px up
+
+    registration = estimate_registration(
+        ImageContext(bgr=cv2.cvtColor(before, cv2.COLOR_GRAY2BGR)),
+        ImageContext(bgr=cv2.cvtColor(after, cv2.COLOR_GRAY2BGR))
+    )
+
+    # Maps after-image pixels back onto the before image
+    np.testing.assert_allclose(registration.apply([[100, 100]])[0], [95, 107], atol=0.5)
+
+def test_match_points_pairs_mutual_nearest_within_radius():
+    before = np.array([[0, 0], [10, 0], [50, 50]], dtype=float)
+    after = np.array([[1, 0], [10.5, 0.5], [9, 0], [80, 80]], dtype=float)
+
+    matched_before, matched_after = match_points(before, after, radius=3)
+
+    assert sorted(zip(matched_before.tolist(), matched_after.tolist())) == [(0, 0), (1, 1)]
+
+def test_compare_images_reports_new_structures_and_aircraft(scene, tmp_path):
+    before, after = scene[:256, :256].copy(), scene[:256, :256].copy()
+    cv2.rectangle(after, (150, 40), (200, 90), 255, -1)
+    before_path, after_path = str(tmp_path / "before.png"), str(tmp_path / "after.png")
+    cv2.imwrite(before_path, before)
+    cv2.imwrite(after_path, after)
+
+    before_details = Detections.from_details({})
+    before_details["aircraft"] = aircraft([[30, 30], [100, 200]])
+    after_details = Detections.from_details({})
+    after_details["aircraft"] = aircraft([[31, 30], [220, 220]])
+
+    result = compare_images(before_path, after_path, before_details, after_details)
+
+    assert result["deltas"]["aircraft"] == {
+        "before": 2, "after": 2, "persisted": 1, "appeared": 1, "disappeared": 1
+    }
+    regions = [f for f in result["geojson"]["features"] if f["properties"]["type"] == "change"]
+    assert len(regions) == 1
+    xs, ys = np.array(regions[0]["geometry"]["coordinates"][0]).T
+    assert 140 <= xs.min() and xs.max() <= 210 and 30 <= ys.min() and ys.max() <= 100
+    changes = sorted(f["properties"]["change"] for f in result["geojson"]["features"] if "change" in f["properties"])
+    assert changes == ["appeared", "disappeared"]
+
+    # Repeated comparisons reuse the cached registration
+    assert get_registration(before_path, after_path) is get_registration(before_path, after_path)
+
+def test_registration_persists_across_processes(scene, tmp_path, monkeypatch):
+    before_path, after_path = str(tmp_path / "before.png"), str(tmp_path / "after.png")
+    cv2.imwrite(before_path, scene[20:276, 20:276])
+    cv2.imwrite(after_path, scene[27:283, 15:271])
+
+    first = get_registration(before_path, after_path, pair=(1, 2))
+    # A fresh in-memory cache, as in another worker, reads it back from disk
+    monkeypatch.setattr(registration_module, "_registrations", registration_module._LRU(4))
+    monkeypatch.setattr(registration_module, "estimate_registration", None)
+    second = get_registration(before_path, after_path, pair=(1, 2))
+
+    np.testing.assert_allclose(second.matrix, first.matrix, atol=1e-6)
+    assert list(registration_module.registration_cache.directory.glob("1_2_*.json"))
+
+def test_aligned_pair_has_the_same_size_and_content(scene, tmp_path):
+    before_path, after_path = str(tmp_path / "before.png"), str(tmp_path / "after.png")
+    cv2.imwrite(before_path, scene[20:276, 20:276])
+    cv2.imwrite(after_path, scene[27:283, 15:271])
+
+    before = cv2.imdecode(np.frombuffer(get_aligned_image(before_path, after_path, "before", 128), np.uint8), cv2.IMREAD_GRAYSCALE)
+    after = cv2.imdecode(np.frombuffer(get_aligned_image(before_path, after_path, "after", 128), np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    assert before.shape == after.shape == (128, 128)
+    inner = (slice(10, -10), slice(10, -10))
+    assert np.abs(before[inner].astype(int) - after[inner].astype(int)).mean() < 8
@@ -0,0 +1,37 @@
+"""
+Tests for bringing existing tables up to date with the models
+"""
+from sqlalchemy import create_engine, inspect, text
+
+from app.database import db, add_missing_columns
+from app.models.user import User
+from app.models.analysis import AnalysisImage
+
+def test_columns_added_to_models_are_added_to_existing_tables():
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    with engine.begin() as connection:
+        # Tables as created before geo_cell, details_path and detector_versions existed
+        connection.execute(text(
+            "CREATE TABLE analysis (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, name VARCHAR(100) NOT NULL,"
+            " latitude NUMERIC(10, 8) NOT NULL, longitude NUMERIC(11, 8) NOT NULL,"
+            " created_at DATETIME, updated_at DATETIME)"
+        ))
+        connection.execute(text("INSERT INTO analysis (user_id, name, latitude, longitude) VALUES (1, 'site', 4.6, -74.1)"))
+        columns = ", ".join(
+            f"{column.name} {column.type.compile(dialect=engine.dialect)}"
+            for column in AnalysisImage.__table__.columns
+            if column.name not in ("details_path", "detector_versions")
+        )
+        connection.execute(text(f"CREATE TABLE analysis_images ({columns})"))
+
+    added = add_missing_columns(engine, db.metadata)
+
+    assert sorted(added) == ["analysis.geo_cell", "analysis_images.details_path", "analysis_images.detector_versions"]
+    inspector = inspect(engine)
+    assert "ix_analysis_geo_cell" in {index["name"] for index in inspector.get_indexes("analysis")}
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT name, geo_cell FROM analysis")).all() == [("site", None)]
+    # Running again changes nothing, and missing tables are left to create_all
+    assert add_missing_columns(engine, db.metadata) == []
+    assert not inspect(engine).has_table("analysis_stats")
@@ -0,0 +1,61 @@
+"""
+Tests for the content-addressed detection result cache
+"""
+import os
+import time
+import numpy as np
+
+from app.services.detection_cache import DetectionCache, make_cache_key
+from app.services.detections import Detections, DetectionSet, pack_results
+
+FLAGS = {"runways": True, "aircraft": True, "houses": False, "roads": True, "water_bodies": True}
+VERSIONS = {"runways": "1", "aircraft": "1", "roads": "1", "water_bodies": "1"}
+
+def make_results(house_count=1):
+    houses = DetectionSet.from_columns(
+        "houses",
+        confidence=np.full(house_count, 0.7),
+        bbox=np.tile([10, 10, 20, 20], (house_count, 1))
+    )
+    return {"house_count": house_count, "details": Detections({**Detections.empty(), "houses": houses})}
+
+def test_cache_key_depends_on_content_flags_and_versions():
+    key = make_cache_key("abc", FLAGS, VERSIONS, tiled=False)
+
+    assert key == make_cache_key("abc", dict(reversed(list(FLAGS.items()))), VERSIONS, tiled=False)
+    assert key != make_cache_key("abd", FLAGS, VERSIONS, tiled=False)
+    assert key != make_cache_key("abc", {**FLAGS, "houses": True}, VERSIONS, tiled=False)
+    assert key != make_cache_key("abc", FLAGS, {**VERSIONS, "roads": "2"}, tiled=False)
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    results = make_results(3)
+    DetectionCache(tmp_path / "cache", 10_000, 4).put("key", results)
+
+    # A fresh instance has an empty memory tier, as another worker would
+    cache = DetectionCache(tmp_path / "cache", 10_000, 4)
+    assert cache.get("key") == results
+    assert cache.get("other") is None
+
+def test_hits_return_independent_copies(tmp_path):
+    cache = DetectionCache(tmp_path, 10_000, 4)
+    cache.put("key", make_results())
+
+    cache.get("key")["details"]["houses"].records["confidence"] = 0.0
+
+    assert cache.get("key") == make_results()
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    payload = make_results()
+    size = len(pack_results(payload))
+    cache = DetectionCache(tmp_path, max_bytes=size * 5 // 2, memory_entries=1)
+
+    cache.put("old", payload)
+    cache.put("recent", payload)
+    # Make "old" the least recently used entry regardless of timestamp resolution
+    past = time.time() - 60
+    os.utime(tmp_path / "old.npz", (past, past))
+    cache.put("new", payload)
+
+    assert not (tmp_path / "old.npz").exists()
+    assert cache.get("recent") == payload
+    assert cache.get("new") == payload
@@ -0,0 +1,59 @@
+"""
+Tests for the columnar detection containers
+"""
+import numpy as np
+
+from app.services.detections import Detections, DetectionSet
+
+def make_roads():
+    return DetectionSet.from_dicts("roads", [
+        {"id": 1, "confidence": 0.9, "width": 8, "polyline": [[0, 0], [10, 0], [10, 10]]},
+        {"id": 2, "confidence": 0.6, "width": 5, "polyline": [[20, 20], [30, 25]]},
+        {"id": 3, "confidence": 0.7, "width": 6, "polyline": [[5, 5], [6, 6], [7, 7], [8, 8]]}
+    ])
+
+def test_take_and_concatenate_keep_paths_aligned():
+    roads = make_roads()
+
+    picked = roads.take(np.array([2, 0]))
+    assert picked.records["id"].tolist() == [3, 1]
+    assert [len(path) for path in picked.paths()] == [4, 3]
+    assert picked.paths()[1].tolist() == [[0, 0], [10, 0], [10, 10]]
+
+    joined = DetectionSet.concatenate("roads", [picked, roads.translate(100, 0)])
+    assert len(joined) == 5
+    assert joined.paths()[2].tolist() == [[100, 0], [110, 0], [110, 10]]
+    assert joined.bboxes()[3].tolist() == [120, 20, 130, 25]
+
+def test_sidecar_round_trip(tmp_path):
+    details = Detections.from_details({
+        "roads": make_roads(),
+        "houses": [{"id": 1, "confidence": 0.8, "bbox": [1, 2, 3, 4], "center": [2, 3], "area": 4}]
+    })
+    path = tmp_path / "scene.png.detections.npz"
+
+    details.save(str(path), {"house_count": 1})
+    loaded = Detections.load(str(path))
+
+    assert loaded == details
+    assert loaded.digest() == details.digest()
+    assert len(loaded["aircraft"]) == 0
+    # Fields the detector did not report stay out of the API dictionaries
+    assert loaded.to_details()["houses"] == [
+        {"id": 1, "confidence": 0.8, "bbox": [1, 2, 3, 4], "center": [2, 3], "area": 4}
+    ]
+    assert Detections.load(str(tmp_path / "missing.npz")) is None
+
+def test_concurrent_saves_do_not_share_a_temporary_file(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    details = Detections.from_details({"roads": make_roads()})
+    path = tmp_path / "scene.png.detections.npz"
+    # A fixed {path}.tmp would collide with this
+    (tmp_path / "scene.png.detections.npz.tmp").mkdir()
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: details.save(str(path)), range(16)))
+
+    assert Detections.load(str(path)) == details
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["scene.png.detections.npz", "scene.png.detections.npz.tmp"]
@@ -0,0 +1,83 @@
+"""
+Tests for geo-referencing detection results
+"""
+import json
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from app.services.georeference import GeoReference, resolve_georeference
+from app.services.object_detection import (
+    generate_geojson,
+    build_results,
+    iter_geojson_features,
+    stream_geojson,
+    stream_ndjson,
+    DETAIL_KEYS
+)
+
+def make_results(**details):
+    return build_results({key: details.get(key, []) for key in DETAIL_KEYS})
+
+def test_fetched_imagery_is_centered_on_the_analysis_location():
+    georef = GeoReference.from_center(48.0, 11.0, width=1000, height=800, resolution_m=2.0)
+
+    corners = georef.to_lonlat(np.array([[500, 400], [0, 0], [1000, 800]]))
+
+    assert corners[0] == pytest.approx([11.0, 48.0])
+    # 1000 px at 2 m span about 2 km east-west, north is up
+    assert (corners[2, 0] - corners[1, 0]) * 111320 * np.cos(np.radians(48.0)) == pytest.approx(2000)
+    assert corners[1, 1] > corners[2, 1]
+
+def test_geotiff_transform_and_crs_are_used(tmp_path):
+    path = tmp_path / "utm.tif"
+    # UTM zone 32N, 0.5 m pixels, upper left corner near Munich
+    transform = from_origin(690000, 5336000, 0.5, 0.5)
+    with rasterio.open(
+        path, "w", driver="GTiff", width=64, height=64, count=1, dtype="uint8",
+        crs="EPSG:32632", transform=transform
+    ) as dataset:
+        dataset.write(np.zeros((1, 64, 64), dtype=np.uint8))
+
+    georef = resolve_georeference(str(path), latitude=0.0, longitude=0.0)
+    results = make_results(
+        houses=[{"id": 1, "confidence": 0.9, "center": [0, 0], "bbox": [0, 0, 1, 1], "area": 1}],
+        roads=[{"id": 1, "confidence": 0.9, "width": 3, "polyline": [[0, 0], [64, 0], [64, 64]]}]
+    )
+    features = generate_geojson(results, georef)["features"]
+
+    assert georef.pixel_size_m == pytest.approx(0.5)
+    lon, lat = features[0]["geometry"]["coordinates"]
+    assert lon == pytest.approx(11.5, abs=0.1) and lat == pytest.approx(48.1, abs=0.1)
+    assert len(features[1]["geometry"]["coordinates"]) == 3
+    assert features[1]["geometry"]["coordinates"][0] == [lon, lat]
+
+def test_without_georeference_pixel_coordinates_are_kept():
+    results = make_results(
+        water_bodies=[{"id": 1, "confidence": 0.8, "area": 4, "polygon": [[0, 0], [2, 0], [2, 2], [0, 0]]}]
+    )
+
+    geometry = generate_geojson(results)["features"][0]["geometry"]
+
+    assert geometry["coordinates"] == [[[0, 0], [2, 0], [2, 2], [0, 0]]]
+
+def test_streamed_geojson_matches_the_document():
+    georef = GeoReference.from_center(48.0, 11.0, width=1000, height=1000)
+    houses = [
+        {"id": i + 1, "confidence": 0.7, "center": [i, i], "bbox": [i, i, i + 1, i + 1], "area": 1}
+        for i in range(25)
+    ]
+    results = make_results(
+        houses=houses,
+        roads=[{"id": 1, "confidence": 0.9, "width": 3, "polyline": [[0, 0], [10, 10]]}]
+    )
+    expected = generate_geojson(results, georef)
+
+    chunks = list(stream_geojson(iter_geojson_features(results["details"], georef, chunk_size=4), batch_size=4))
+    lines = "".join(stream_ndjson(iter_geojson_features(results["details"], georef))).splitlines()
+
+    assert len(chunks) > 3
+    assert json.loads("".join(chunks)) == expected
+    assert [json.loads(line) for line in lines] == expected["features"]
+    assert json.loads("".join(stream_geojson([]))) == {"type": "FeatureCollection", "features": []}
@@ -0,0 +1,122 @@
+"""
+Tests for satellite imagery fetching through the imagery cache
+"""
+import os
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+from app.services import geospatial, imagery_cache as imagery_cache_module
+from app.services.imagery_cache import ImageryCache, make_imagery_key
+from app.services.single_flight import SingleFlight
+
+class ImageryHandler(BaseHTTPRequestHandler):
+    """Stand-in provider serving one image per path, with an ETag"""
+    requests = []
+    body = b"\x89PNG fake image"
+    etag = '"v1"'
+    delay = 0.0
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("If-None-Match")))
+        time.sleep(type(self).delay)
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    ImageryHandler.requests = []
+    ImageryHandler.delay = 0.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageryHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    monkeypatch.setattr(geospatial, "IMAGES_DIR", images_dir)
+    monkeypatch.setattr(geospatial, "imagery_cache", ImageryCache(tmp_path / "imagery", 10_000_000, ".img"))
+    monkeypatch.setattr(geospatial, "imagery_flights", SingleFlight(tmp_path / "locks"))
+    monkeypatch.setattr(geospatial, "IMAGERY_URL", f"http://127.0.0.1:{server.server_address[1]}/{{z}}/{{x}}/{{y}}.png")
+    yield ImageryHandler
+    server.shutdown()
+
+def fetch(latitude, longitude, analysis_id):
+    return asyncio.run(geospatial.fetch_satellite_image(latitude, longitude, analysis_id))
+
+def test_nearby_locations_share_one_download(provider):
+    first = fetch(12.34560, 56.78900, 1)
+    second = fetch(12.34561, 56.78901, 2)
+
+    assert len(provider.requests) == 1
+    assert first.endswith(".png") and first != second
+    # Both analyses link the same cached file
+    assert os.path.samefile(first, second)
+    with open(first, "rb") as f:
+        assert f.read() == provider.body
+
+def test_concurrent_fetches_of_a_tile_share_one_download(provider):
+    provider.delay = 0.2
+
+    async def fetch_many():
+        return await asyncio.gather(*(
+            geospatial.fetch_satellite_image(12.3456, 56.789, analysis_id) for analysis_id in range(8)
+        ))
+
+    # Callers on other threads run their own event loops
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch(12.3456, 56.789, 100))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    paths = asyncio.run(fetch_many())
+    for thread in threads:
+        thread.join()
+
+    assert len(provider.requests) == 1
+    assert all(os.path.samefile(path, paths[0]) for path in paths + results)
+
+def test_stale_entries_are_revalidated(provider, monkeypatch):
+    first = fetch(12.3456, 56.789, 1)
+    monkeypatch.setattr(imagery_cache_module, "IMAGERY_MAX_AGE", 0)
+    second = fetch(12.3456, 56.789, 1)
+
+    assert [etag for _, etag in provider.requests] == [None, '"v1"']
+    assert first != second and os.path.samefile(first, second)
+    with open(second, "rb") as f:
+        assert f.read() == provider.body
+
+def test_new_imagery_leaves_earlier_runs_unchanged(provider, monkeypatch):
+    monkeypatch.setattr(provider, "body", b"\x89PNG old image")
+    first = fetch(12.3456, 56.789, 1)
+    monkeypatch.setattr(imagery_cache_module, "IMAGERY_MAX_AGE", 0)
+    monkeypatch.setattr(provider, "body", b"\x89PNG new image")
+    monkeypatch.setattr(provider, "etag", '"v2"')
+    second = fetch(12.3456, 56.789, 1)
+
+    with open(first, "rb") as f:
+        assert f.read() == b"\x89PNG old image"
+    with open(second, "rb") as f:
+        assert f.read() == b"\x89PNG new image"
+
+def test_eviction_drops_metadata(tmp_path):
+    cache = ImageryCache(tmp_path, 25, ".img")
+    first = make_imagery_key(1.0, 1.0, 18, None, "test")
+    second = make_imagery_key(2.0, 2.0, 18, None, "test")
+    cache.store(first, b"x" * 20, {"etag": '"a"'})
+    os.utime(cache.path(first), (0, 0))
+    cache.store(second, b"y" * 20, {"etag": '"b"'})
+
+    assert cache.read_meta(first) is None and not cache.meta_path(first).exists()
+    assert cache.read_meta(second) == {"etag": '"b"'}
@@ -0,0 +1,90 @@
+"""
+Tests for the shared imagery HTTP client
+"""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+from app.services import http_client
+from app.services.http_client import ImageryClient, CircuitBreaker, CircuitOpenError
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 to the first `failures` requests, then 200"""
+    protocol_version = "HTTP/1.1"
+    failures = 0
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        status = 503 if type(self).requests <= type(self).failures else 200
+        body = b"image"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(http_client, "RETRY_BASE_DELAY", 0.001)
+    FlakyHandler.requests, FlakyHandler.failures = 0, 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/tile.png"
+    server.shutdown()
+
+def test_transient_errors_are_retried_on_one_pooled_client(server):
+    FlakyHandler.failures = 2
+    client = ImageryClient(attempts=3)
+
+    async def fetch_twice():
+        first = await client.get(server, "test")
+        pooled = client.client()
+        second = await client.get(server, "test")
+        assert client.client() is pooled
+        await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(fetch_twice())
+
+    assert first.status_code == second.status_code == 200
+    metrics = client.metrics()
+    assert metrics["requests"] == 4 and metrics["retries"] == 2 and metrics["failures"] == 0
+    assert metrics["circuits"] == {"test": "closed"}
+
+def test_failing_provider_opens_the_circuit(server):
+    FlakyHandler.failures = 100
+    client = ImageryClient(attempts=2)
+    client._breakers["test"] = CircuitBreaker(threshold=2, cooldown=60)
+
+    async def fetch(times):
+        responses = [await client.get(server, "test") for _ in range(times)]
+        await client.aclose()
+        return responses
+
+    assert [response.status_code for response in asyncio.run(fetch(2))] == [503, 503]
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(fetch(1))
+    assert FlakyHandler.requests == 4
+    assert client.metrics()["rejected"] == 1
+
+def test_half_open_circuit_lets_one_trial_through(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(threshold=1, cooldown=10)
+
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock[0] = 11
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_backoff_is_jittered_below_the_cap():
+    delays = [ImageryClient.backoff(3) for _ in range(200)]
+    assert all(0 <= delay <= http_client.RETRY_BASE_DELAY * 8 for delay in delays)
+    assert len(set(delays)) > 100
+    assert ImageryClient.backoff(0, retry_after=2.0) >= 2.0
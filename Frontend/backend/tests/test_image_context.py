@@ -0,0 +1,35 @@
+"""
+Tests for the shared per-job image context
+"""
+import numpy as np
+import pytest
+import cv2
+
+from app.services.image_context import ImageContext
+
+@pytest.fixture
+def bgr_image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, size=(64, 96, 3), dtype=np.uint8)
+
+def test_derived_planes_are_cached_and_read_only(bgr_image):
+    context = ImageContext(bgr=bgr_image)
+
+    assert context.gray is context.gray
+    assert context.binary(100) is context.binary(100)
+    assert not context.rgb.flags.writeable
+    with pytest.raises(ValueError):
+        context.gray[0, 0] = 0
+
+def test_gray_matches_regardless_of_decoded_order(bgr_image):
+    from_bgr = ImageContext(bgr=bgr_image)
+    from_rgb = ImageContext(rgb=cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB))
+
+    np.testing.assert_array_equal(from_bgr.gray, from_rgb.gray)
+
+def test_pyramid_levels_halve_dimensions(bgr_image):
+    context = ImageContext(bgr=bgr_image)
+
+    assert context.level(0) is context
+    assert context.level(2).shape[:2] == (16, 24)
+    assert context.level(2) is context.level(2)
@@ -0,0 +1,93 @@
+"""
+Tests for storing the results of image processing
+"""
+import asyncio
+import os
+import cv2
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.models.analysis import Analysis, AnalysisImage, AnalysisStats
+from app.models.analysis_settings import AnalysisSettings
+from app.services import image_processing, object_detection
+from app.services.detection_cache import DetectionCache
+from app.services.single_flight import SingleFlight
+from app.services.spatial_index import index_path
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    for model in (User, AnalysisSettings, Analysis, AnalysisImage, AnalysisStats):
+        model.__table__.create(engine)
+    with Session(engine) as session:
+        session.add(User(username="a", email="a@example.com", password="pw"))
+        session.flush()
+        yield session
+
+def test_first_processing_stores_sidecar_index_and_stats(session, tmp_path, monkeypatch):
+    image_path = tmp_path / "scene.png"
+    scene = np.zeros((400, 400, 3), dtype=np.uint8)
+    scene[190:205, 20:380] = 220
+    cv2.imwrite(str(image_path), scene)
+
+    async def fetch(latitude, longitude, analysis_id):
+        return str(image_path)
+    monkeypatch.setattr(image_processing, "fetch_satellite_image", fetch)
+    monkeypatch.setattr(object_detection, "detection_cache", DetectionCache(tmp_path / "cache", 1 << 20, 4))
+
+    analysis = Analysis(1, "site", 4.6, -74.1)
+    session.add(analysis)
+    session.commit()
+
+    asyncio.run(image_processing.process_image(analysis.id, session))
+
+    image = session.query(AnalysisImage).one()
+    assert image.status == "completed"
+    assert os.path.exists(image.details_path) and os.path.exists(index_path(image.image_path))
+    details = image_processing.load_image_details(image)
+    assert len(details["runways"]) == image.runway_detected == 1
+    assert session.query(AnalysisStats).filter_by(analysis_id=analysis.id).count() == 3
+
+def test_each_processing_run_keeps_its_own_image_and_sidecars(session, tmp_path, monkeypatch):
+    from app.services import geospatial
+
+    cached = tmp_path / "tile.img"
+    cached.write_bytes(cv2.imencode(".png", np.zeros((300, 300, 3), dtype=np.uint8))[1].tobytes())
+
+    async def fetch_cached(*args, **kwargs):
+        return cached
+    monkeypatch.setattr(geospatial, "fetch_cached_imagery", fetch_cached)
+    monkeypatch.setattr(geospatial, "imagery_flights", SingleFlight())
+    monkeypatch.setattr(geospatial, "IMAGES_DIR", tmp_path / "images")
+    (tmp_path / "images").mkdir()
+    monkeypatch.setattr(object_detection, "detection_cache", DetectionCache(tmp_path / "cache", 1 << 20, 4))
+
+    analysis = Analysis(1, "site", 4.6, -74.1)
+    session.add(analysis)
+    session.commit()
+
+    asyncio.run(image_processing.process_image(analysis.id, session))
+    asyncio.run(image_processing.process_image(analysis.id, session))
+
+    first, second = session.query(AnalysisImage).order_by(AnalysisImage.id).all()
+    assert first.status == second.status == "completed"
+    assert first.image_path != second.image_path and os.path.samefile(first.image_path, second.image_path)
+    assert first.details_path != second.details_path
+    assert os.path.exists(first.details_path) and os.path.exists(second.details_path)
+    assert index_path(first.image_path) != index_path(second.image_path)
+
+def test_processing_jobs_share_one_pooled_client():
+    async def pooled_client():
+        return image_processing.imagery_client.client()
+
+    loop = image_processing.get_processing_loop()
+    try:
+        first = asyncio.run_coroutine_threadsafe(pooled_client(), loop).result()
+        second = asyncio.run_coroutine_threadsafe(pooled_client(), image_processing.get_processing_loop()).result()
+        assert second is first and not first.is_closed
+    finally:
+        image_processing.shutdown_processing_loop()
+    assert first.is_closed
@@ -0,0 +1,203 @@
+"""
+Tests for the object detection pipeline
+"""
+import asyncio
+import numpy as np
+import pytest
+
+from app.services.detector_registry import HeuristicDetector, get_detector, available_detectors, validate_backends
+from app.services.image_context import ImageContext
+from app.services.object_detection import run_detectors, DETAIL_KEYS
+
+@pytest.fixture
+def context():
+    rng = np.random.default_rng(7)
+    image = rng.integers(0, 90, size=(600, 800, 3), dtype=np.uint8)
+    image[280:300, 50:750] = 220  # A bright strip the runway detector picks up
+    return ImageContext(bgr=image)
+
+def test_parallel_detectors_match_sequential(context):
+    flags = {key: True for key in DETAIL_KEYS}
+
+    sequential = asyncio.run(run_detectors(context, flags, parallelism=1))
+    parallel = asyncio.run(run_detectors(context, flags, parallelism=5))
+
+    assert parallel == sequential
+    assert len(sequential["runways"]) == 1
+
+def test_disabled_detectors_return_no_locations(context):
+    flags = {key: key == "roads" for key in DETAIL_KEYS}
+
+    details = asyncio.run(run_detectors(context, flags))
+
+    assert len(details["roads"]) > 0
+    assert all(len(details[key]) == 0 for key in DETAIL_KEYS if key != "roads")
+
+def test_detector_pool_restarts_after_shutdown(context):
+    from app.services.detector_engine import get_executor, shutdown_executor
+
+    executor = get_executor()
+    shutdown_executor()
+
+    assert executor._shutdown
+    assert get_executor() is not executor
+    details = asyncio.run(run_detectors(context, {key: key == "runways" for key in DETAIL_KEYS}, parallelism=2))
+    assert len(details["runways"]) == 1
+
+def test_batch_detection_isolates_failures(tmp_path, monkeypatch):
+    import cv2
+    from app.services.detector_engine import shutdown_process_pool
+    from app.services.object_detection import detect_objects_batch
+
+    # Workers are spawned fresh and read their cache directory from the environment
+    monkeypatch.setenv("DETECTION_CACHE_DIR", str(tmp_path / "cache"))
+    shutdown_process_pool()
+    good = tmp_path / "good.png"
+    cv2.imwrite(str(good), np.zeros((200, 200, 3), dtype=np.uint8))
+    paths = [str(good), str(tmp_path / "missing.png"), str(good)]
+
+    async def collect():
+        return [item async for item in detect_objects_batch(paths, {"detect_houses": False}, max_in_flight=2)]
+
+    try:
+        items = asyncio.run(collect())
+    finally:
+        shutdown_process_pool()
+
+    assert sorted(item["image_path"] for item in items) == sorted(paths)
+    failed = [item for item in items if item["error"]]
+    assert [item["image_path"] for item in failed] == [str(tmp_path / "missing.png")]
+    assert all(item["results"]["house_count"] == 0 for item in items if not item["error"])
+
+def test_redetection_only_runs_new_or_outdated_detectors(tmp_path, monkeypatch):
+    import cv2
+    from app.services import object_detection
+
+    image_path = tmp_path / "scene.png"
+    cv2.imwrite(str(image_path), np.zeros((300, 300, 3), dtype=np.uint8))
+
+    calls = []
+    original_detect = HeuristicDetector.detect
+    def counting_detect(self, context):
+        calls.append(self.detail_key)
+        return original_detect(self, context)
+    monkeypatch.setattr(HeuristicDetector, "detect", counting_detect)
+
+    flags = {"detect_roads": False}
+    first = asyncio.run(object_detection.detect_objects(str(image_path), use_cache=False, **flags))
+    assert sorted(calls) == ["aircraft", "houses", "runways", "water_bodies"]
+
+    calls.clear()
+    monkeypatch.setattr(get_detector("houses"), "version", "3")
+    second = asyncio.run(object_detection.detect_objects(
+        str(image_path),
+        use_cache=False,
+        previous_details=first["details"],
+        previous_versions=first["detector_versions"]
+    ))
+
+    assert sorted(calls) == ["houses", "roads"]
+    assert second["details"]["aircraft"] == first["details"]["aircraft"]
+    assert second["detector_versions"]["houses"] == "heuristic:3"
+    assert second["road_count"] == len(second["details"]["roads"]) > 0
+
+def test_standin_model_detects_bright_spots_in_one_batched_call(monkeypatch):
+    import cv2
+    from app.services.object_detection import run_detectors_batch
+
+    tiles = []
+    for offset in (40, 120):
+        image = np.zeros((256, 256, 3), dtype=np.uint8)
+        image[offset:offset + 24, offset:offset + 24] = 255
+        tiles.append(ImageContext(bgr=image))
+
+    forward_calls = []
+    original_forward = cv2.dnn.Net.forward
+    monkeypatch.setattr(cv2.dnn.Net, "forward", lambda net, *a: forward_calls.append(1) or original_forward(net, *a))
+
+    flags = {key: key == "aircraft" for key in DETAIL_KEYS}
+    details = asyncio.run(run_detectors_batch(tiles, flags, backends={"aircraft": "standin-onnx"}))
+
+    assert len(forward_calls) == 1
+    for offset, tile_details in zip((40, 120), details):
+        (aircraft,) = tile_details["aircraft"].records
+        x1, y1, x2, y2 = aircraft["bbox"]
+        assert x1 <= offset + 12 <= x2 and y1 <= offset + 12 <= y2
+        assert aircraft["confidence"] > 0.5
+
+def test_backends_are_checked_against_the_registry():
+    available = available_detectors()
+
+    assert set(available) == set(DETAIL_KEYS)
+    assert available["aircraft"] == ["heuristic", "standin-onnx"]
+    assert validate_backends({"aircraft": "standin-onnx"}) is None
+    assert validate_backends({"aircraft": "yolo"}) == "Unknown detector 'yolo' for aircraft; available: heuristic, standin-onnx"
+    assert validate_backends({"boats": "heuristic"}) == "Unknown object class: boats"
+
+def test_runway_detector_reports_rotated_geometry():
+    import cv2
+    from app.services.object_detection import detect_runways_mock
+
+    rng = np.random.default_rng(3)
+    image = rng.integers(0, 90, size=(800, 800, 3), dtype=np.uint8)
+    # Bright speckle the vectorized filter has to discard
+    image[rng.integers(0, 800, 2000), rng.integers(0, 800, 2000)] = 255
+    corners = cv2.boxPoints(((400, 400), (500, 40), 30)).astype(np.int32)
+    cv2.fillPoly(image, [corners], (220, 220, 220))
+
+    runways = detect_runways_mock(ImageContext(bgr=image))
+
+    assert len(runways) == 1
+    runway = runways.records[0]
+    assert len(runways.paths()[0]) == 4
+    assert abs(runway["length"] - 500) < 5
+    assert abs(runway["runway_width"] - 40) < 5
+    assert abs(runway["heading"] - 120) < 1
+
+def test_runways_run_on_a_coarse_level_in_full_resolution_coordinates(monkeypatch):
+    import cv2
+
+    image = np.zeros((1024, 1024, 3), dtype=np.uint8)
+    cv2.rectangle(image, (100, 500), (899, 539), (220, 220, 220), -1)
+    seen = []
+    detector = get_detector("runways")
+    original = detector.function
+    monkeypatch.setattr(detector, "function", lambda context: seen.append(context.shape) or original(context))
+
+    flags = {key: key == "runways" for key in DETAIL_KEYS}
+    runways = asyncio.run(run_detectors(ImageContext(bgr=image), flags))["runways"]
+
+    assert seen == [(256, 256, 3)]
+    assert len(runways) == 1
+    x1, y1, x2, y2 = runways.records[0]["bbox"]
+    assert abs(x1 - 100) <= 4 and abs(x2 - 900) <= 4
+    assert abs(y1 - 500) <= 4 and abs(y2 - 540) <= 4
+    assert abs(runways.records[0]["length"] - 800) <= 8
+
+def test_visualization_blends_fills_once_and_downscales():
+    from app.services.object_detection import generate_visualization
+
+    image = np.full((400, 400, 3), 100, dtype=np.uint8)
+    square = [[50, 50], [150, 50], [150, 150], [50, 150], [50, 50]]
+    results = {
+        "runway_detected": False, "aircraft_count": 0, "house_count": 0,
+        "road_count": 0, "water_body_count": 2,
+        "details": {
+            "runways": [], "aircraft": [], "houses": [], "roads": [],
+            "water_bodies": [
+                {"id": 1, "polygon": square, "confidence": 0.8},
+                {"id": 2, "polygon": square, "confidence": 0.8}
+            ]
+        }
+    }
+
+    full = asyncio.run(generate_visualization("", results, context=ImageContext(bgr=image)))
+    small = asyncio.run(generate_visualization(
+        "", results, context=ImageContext(bgr=image), max_dimension=200
+    ))
+
+    # Overlapping fills are blended once: 0.6 * 100 + 0.4 * (255, 255, 0)
+    assert full[100, 100].tolist() == [162, 162, 60]
+    assert full[300, 300].tolist() == [100, 100, 100]
+    assert small.shape == (200, 200, 3)
+    assert small[50, 50].tolist() == [162, 162, 60]
@@ -0,0 +1,98 @@
+"""
+Tests for distance kernels and the proximity grid index
+"""
+import math
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.models.analysis import Analysis
+from app.services import proximity
+from app.services.proximity import haversine_km, haversine_matrix, cell_ranges, grid_cell, find_nearby, index_analyses
+
+def reference_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def test_kernels_match_the_scalar_formula():
+    rng = np.random.default_rng(1)
+    lats, lons = rng.uniform(-90, 90, 40), rng.uniform(-180, 180, 40)
+
+    matrix = haversine_matrix(lats[:10], lons[:10], lats, lons)
+    expected = [[reference_distance(a, b, c, d) for c, d in zip(lats, lons)] for a, b in zip(lats[:10], lons[:10])]
+    assert matrix.shape == (10, 40)
+    assert np.allclose(matrix, expected)
+    assert np.allclose(haversine_km(lats[3], lons[3], lats, lons), matrix[3])
+    # London to Paris
+    assert haversine_km(51.5074, -0.1278, [48.8566], [2.3522])[0] == pytest.approx(343.5, abs=0.5)
+
+@pytest.mark.parametrize("latitude, longitude, radius_km", [
+    (48.85, 2.35, 25.0),
+    (-33.9, 179.97, 40.0),  # across the antimeridian
+    (89.5, 10.0, 120.0),  # over the pole
+])
+def test_cell_ranges_cover_the_circle(latitude, longitude, radius_km):
+    rng = np.random.default_rng(2)
+    degrees = radius_km / proximity.KM_PER_DEGREE
+    lats = np.clip(latitude + rng.uniform(-degrees, degrees, 5000), -90, 90)
+    lons = (longitude + rng.uniform(-180, 180, 5000) + 180) % 360 - 180
+    inside = haversine_km(latitude, longitude, lats, lons) <= radius_km
+    assert inside.any()
+
+    ranges = cell_ranges(latitude, longitude, radius_km)
+    for lat, lon in zip(lats[inside], lons[inside]):
+        cell = grid_cell(lat, lon)
+        assert any(first <= cell <= last for first, last in ranges)
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    User.__table__.create(engine)
+    Analysis.__table__.create(engine)
+    with Session(engine) as session:
+        session.add(User(username="a", email="a@example.com", password="pw"))
+        session.add(User(username="b", email="b@example.com", password="pw"))
+        session.flush()
+        yield session
+
+def add_analysis(session, user_id, latitude, longitude, indexed=True):
+    analysis = Analysis(user_id, f"site {latitude} {longitude}", latitude, longitude)
+    if indexed:
+        analysis.geo_cell = grid_cell(latitude, longitude)
+    session.add(analysis)
+    session.flush()
+    return analysis
+
+def test_find_nearby_orders_and_filters(session):
+    near = add_analysis(session, 1, 51.500, -0.120)
+    nearer = add_analysis(session, 1, 51.507, -0.128)
+    add_analysis(session, 1, 48.857, 2.352)
+    other_user = add_analysis(session, 2, 51.508, -0.127)
+
+    found = find_nearby(session, 51.5074, -0.1278, 5.0)
+    assert [analysis.id for analysis, _ in found] == [nearer.id, other_user.id, near.id]
+    assert found[0][1] == pytest.approx(0.0466, abs=0.001)
+
+    own = find_nearby(session, 51.5074, -0.1278, 5.0, user_id=1, exclude_id=nearer.id, limit=5)
+    assert [analysis.id for analysis, _ in own] == [near.id]
+    assert len(find_nearby(session, 51.5074, -0.1278, 5.0, limit=1)) == 1
+
+def test_unindexed_analyses_are_indexed(session):
+    legacy = add_analysis(session, 1, 35.68, 139.69, indexed=False)
+    assert find_nearby(session, 35.68, 139.69, 1.0) == []
+
+    assert index_analyses(session) == 1
+    assert legacy.geo_cell == grid_cell(35.68, 139.69)
+    assert [analysis.id for analysis, _ in find_nearby(session, 35.68, 139.69, 1.0)] == [legacy.id]
+    assert index_analyses(session) == 0
+
+def test_candidates_are_read_through_the_index(session):
+    add_analysis(session, 1, 10.0, 10.0)
+    compiled = session.query(Analysis.id).filter(
+        Analysis.geo_cell.between(*cell_ranges(10.0, 10.0, 5.0)[0])
+    ).statement.compile(compile_kwargs={"literal_binds": True})
+    plan = " ".join(str(row[-1]) for row in session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert "ix_analysis_geo_cell" in plan
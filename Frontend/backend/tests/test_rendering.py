@@ -0,0 +1,36 @@
+"""
+Tests for on-demand rendering of detection results
+"""
+import asyncio
+import cv2
+import numpy as np
+
+from app.services import rendering
+from app.services.disk_cache import DiskCache
+
+DETAILS = {
+    "runways": [], "aircraft": [], "roads": [], "water_bodies": [],
+    "houses": [{"id": 1, "confidence": 0.9, "bbox": [10, 10, 30, 30], "center": [20, 20], "area": 400}]
+}
+
+def test_renders_once_per_size_and_layers(tmp_path, monkeypatch):
+    image_path = str(tmp_path / "scene.png")
+    cv2.imwrite(image_path, np.full((300, 400, 3), 80, dtype=np.uint8))
+    monkeypatch.setattr(rendering, "render_cache", DiskCache(tmp_path / "renders", 10_000_000, ".jpg"))
+    calls = []
+    render = rendering.render_detection_image
+    monkeypatch.setattr(
+        rendering, "render_detection_image",
+        lambda *args: calls.append(args) or render(*args)
+    )
+
+    small = asyncio.run(rendering.get_rendered_image(image_path, DETAILS, size=200))
+    again = asyncio.run(rendering.get_rendered_image(image_path, DETAILS, size=200))
+    no_houses = asyncio.run(rendering.get_rendered_image(
+        image_path, DETAILS, size=200, layers={"show_houses": False}
+    ))
+
+    assert small == again
+    assert len(calls) == 2
+    assert cv2.imdecode(np.frombuffer(small, np.uint8), cv2.IMREAD_COLOR).shape == (150, 200, 3)
+    assert no_houses != small
@@ -0,0 +1,89 @@
+"""
+Tests for level-of-detail simplification and TopoJSON encoding
+"""
+import numpy as np
+import pytest
+
+from app.services.detections import Detections, DetectionSet
+from app.services.object_detection import iter_geojson_features
+from app.services.simplification import douglas_peucker_weights, zoom_tolerance
+from app.services.topojson import encode_topology
+
+def douglas_peucker(points, tolerance):
+    """Recursive reference implementation with distances to the segment, returning kept indices"""
+    if len(points) < 3:
+        return list(range(len(points)))
+    start, end = points[0], points[-1]
+    t = np.clip((points[1:-1] - start) @ (end - start) / np.dot(end - start, end - start), 0, 1)
+    distances = np.linalg.norm(points[1:-1] - (start + t[:, None] * (end - start)), axis=1)
+    split = int(np.argmax(distances)) + 1
+    if distances[split - 1] <= tolerance:
+        return [0, len(points) - 1]
+    left = douglas_peucker(points[:split + 1], tolerance)
+    right = douglas_peucker(points[split:], tolerance)
+    return left + [index + split for index in right[1:]]
+
+def test_weights_reproduce_douglas_peucker_at_every_tolerance():
+    rng = np.random.default_rng(5)
+    lines = [np.cumsum(rng.normal(size=(count, 2)), axis=0) for count in (2, 3, 40, 150)]
+    offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines])))
+
+    weights = douglas_peucker_weights(np.concatenate(lines), offsets)
+
+    for tolerance in (0.3, 1.0, 4.0):
+        for line, start in zip(lines, offsets):
+            kept = np.flatnonzero(weights[start:start + len(line)] > tolerance).tolist()
+            assert kept == douglas_peucker(line, tolerance)
+
+def test_simplified_rings_stay_polygons():
+    circle = np.column_stack((np.cos(np.linspace(0, 2 * np.pi, 200, endpoint=False)),
+                              np.sin(np.linspace(0, 2 * np.pi, 200, endpoint=False)))) * 100
+    water = DetectionSet.from_columns("water_bodies", paths=[circle, circle[:3] + 500], confidence=[0.9, 0.9])
+
+    coarse = water.simplify(1000.0)
+    fine = water.simplify(0.5)
+
+    assert [len(path) for path in coarse.paths()] == [3, 3]
+    assert 3 < len(fine.paths()[0]) < 200
+    # Weights survive the sidecar, so serving never recomputes them
+    loaded, _ = Detections.from_bytes(Detections({"water_bodies": water.with_weights()}).to_bytes())
+    assert loaded["water_bodies"].simplify(0.5) == fine
+
+def test_closed_rings_stay_closed_when_simplified():
+    ring = [[0, 0], [50, 1], [100, 0], [100, 100], [0, 100], [0, 0]]
+    water = DetectionSet.from_columns("water_bodies", paths=[ring], confidence=[0.9])
+
+    simplified = water.simplify(1.0)
+
+    path = simplified.paths()[0]
+    assert len(path) == 5
+    assert np.array_equal(path[0], path[-1])
+    polygon = next(iter_geojson_features({"water_bodies": water}, tolerance=1.0))["geometry"]["coordinates"][0]
+    assert polygon == [[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]]
+    # Rings stored without the duplicate are closed on output
+    open_ring = DetectionSet.from_columns("water_bodies", paths=[ring[:-1]], confidence=[0.9])
+    unclosed = next(iter_geojson_features({"water_bodies": open_ring.simplify(1000.0)}))["geometry"]["coordinates"][0]
+    assert len(unclosed) == 4 and unclosed[0] == unclosed[-1]
+
+def test_zoom_tolerance_halves_per_level():
+    assert zoom_tolerance(15, 0.0, 1.0) == pytest.approx(2 * zoom_tolerance(16, 0.0, 1.0))
+    assert zoom_tolerance(16, 0.0, 1.0, screen_pixels=1.0) == pytest.approx(2.389, abs=1e-3)
+
+def test_topology_stores_repeated_arcs_once():
+    line = [[11.0, 48.0], [11.001, 48.0005], [11.002, 48.0]]
+    features = [
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": line}, "properties": {"id": 1}},
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": line[::-1]}, "properties": {"id": 2}},
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [11.001, 48.0]}, "properties": {"id": 3}}
+    ]
+
+    topology = encode_topology(features, quantization=1001)
+
+    geometries = topology["objects"]["detections"]["geometries"]
+    assert len(topology["arcs"]) == 1
+    assert [g.get("arcs") for g in geometries] == [[0], [~0], None]
+    # Decoding the delta-encoded arc restores the coordinates to the grid resolution
+    scale, translate = np.array(topology["transform"]["scale"]), np.array(topology["transform"]["translate"])
+    decoded = np.cumsum(topology["arcs"][0], axis=0) * scale + translate
+    assert np.allclose(decoded, line, atol=scale.max())
+    assert geometries[2]["coordinates"] == [500, 0]
@@ -0,0 +1,85 @@
+"""
+Tests for single-flight deduplication
+"""
+import asyncio
+import threading
+
+from app.services.single_flight import SingleFlight
+
+def test_concurrent_calls_share_the_leader_result():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return object()
+
+    async def run():
+        return await asyncio.gather(*(flights.do("tile", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.metrics() == {"leaders": 1, "followers": 4, "in_flight": 0, "cross_process": False}
+
+def test_followers_see_the_leader_error_and_later_calls_retry():
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise ValueError("provider down")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("tile", failing) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
+
+    async def succeeding():
+        return "ok"
+
+    assert asyncio.run(flights.do("tile", succeeding)) == "ok"
+
+def test_cancelled_follower_leaves_the_call_to_the_others():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "image"
+
+    async def run():
+        calls = [asyncio.create_task(flights.do("tile", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        calls[1].cancel()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    leader, cancelled, follower = asyncio.run(run())
+
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert leader == follower == "image"
+
+def test_file_lock_serializes_separate_instances(tmp_path):
+    # Two instances with one lock directory stand in for two worker processes
+    cache = {}
+    downloads = []
+
+    async def work():
+        if "tile" not in cache:
+            downloads.append(1)
+            await asyncio.sleep(0.1)
+            cache["tile"] = "image"
+        return cache["tile"]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(asyncio.run(SingleFlight(tmp_path).do("tile", work))))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["image", "image"]
+    assert len(downloads) == 1
@@ -0,0 +1,74 @@
+"""
+Tests for the packed R-tree over detections
+"""
+import numpy as np
+
+from app.services.detections import Detections, DetectionSet
+from app.services.georeference import GeoReference
+from app.services.spatial_index import PackedRTree, select_detections, filter_features
+
+def make_details(count=5000):
+    rng = np.random.default_rng(11)
+    corners = rng.uniform(0, 10000, size=(count, 2))
+    sizes = rng.uniform(2, 40, size=(count, 2))
+    houses = DetectionSet.from_columns(
+        "houses",
+        confidence=rng.uniform(0.5, 1.0, count),
+        bbox=np.hstack((corners, corners + sizes)),
+        center=corners + sizes / 2
+    )
+    roads = DetectionSet.from_columns(
+        "roads",
+        paths=[[[100, 100], [9000, 200]], [[5000, 5000], [5100, 5100]]],
+        confidence=[0.9, 0.6]
+    )
+    return Detections({**Detections.empty(), "houses": houses, "roads": roads})
+
+def test_query_matches_brute_force():
+    details = make_details()
+    index = PackedRTree.from_bytes(PackedRTree.build(details).to_bytes())
+    boxes = np.vstack((details["houses"].bboxes(), details["roads"].bboxes()))
+
+    for query in ([1000, 1000, 1500, 1800], [0, 150, 10000, 160], [-50, -50, -10, -10]):
+        x1, y1, x2, y2 = query
+        expected = np.flatnonzero(
+            (boxes[:, 0] <= x2) & (boxes[:, 2] >= x1) & (boxes[:, 1] <= y2) & (boxes[:, 3] >= y1)
+        )
+        assert index.query(query).tolist() == expected.tolist()
+
+def test_select_detections_applies_all_filters():
+    details = make_details()
+    index = PackedRTree.build(details)
+
+    subset = select_detections(details, index, bbox=[0, 0, 10000, 300], keys=["roads"], min_confidence=0.8)
+
+    assert len(subset["houses"]) == 0
+    assert subset["roads"].records["confidence"].tolist() == [np.float32(0.9)]
+    assert subset["roads"].paths()[0].tolist() == [[100, 100], [9000, 200]]
+
+def test_stored_geojson_gets_the_same_filters():
+    features = [
+        {"type": "Feature", "properties": {"type": "road", "id": 1, "confidence": 0.9},
+         "geometry": {"type": "LineString", "coordinates": [[11.0, 48.0], [11.2, 48.1]]}},
+        {"type": "Feature", "properties": {"type": "road", "id": 2},
+         "geometry": {"type": "LineString", "coordinates": [[11.0, 48.0], [11.2, 48.1]]}},
+        {"type": "Feature", "properties": {"type": "house", "id": 1, "confidence": 0.9},
+         "geometry": {"type": "Point", "coordinates": [11.1, 48.05]}},
+        {"type": "Feature", "properties": {"type": "water_body", "id": 1, "confidence": 0.9},
+         "geometry": {"type": "Polygon", "coordinates": [[[12, 49], [12.1, 49], [12.1, 49.1], [12, 49]]]}}
+    ]
+
+    def ids(selected):
+        return [(feature["properties"]["type"], feature["properties"]["id"]) for feature in selected]
+
+    assert ids(filter_features(features, bbox=[11.15, 48.08, 12.05, 49.05])) == [("road", 1), ("road", 2), ("water_body", 1)]
+    assert ids(filter_features(features, keys=["houses", "water_bodies"])) == [("house", 1), ("water_body", 1)]
+    assert ids(filter_features(features, keys=["roads"], min_confidence=0.5)) == [("road", 1)]
+
+def test_viewport_in_degrees_maps_to_pixels():
+    georef = GeoReference.from_center(48.0, 11.0, width=1000, height=800)
+
+    lon1, lat1 = georef.to_lonlat(np.array([[100, 700]]))[0]
+    lon2, lat2 = georef.to_lonlat(np.array([[300, 500]]))[0]
+
+    assert np.allclose(georef.pixel_bbox([lon1, lat1, lon2, lat2]), [100, 500, 300, 700])
@@ -0,0 +1,61 @@
+"""
+Tests for synthetic scenes and their ground truth
+"""
+import numpy as np
+import pytest
+import rasterio
+
+from app.services.image_context import ImageContext
+from app.services.object_detection import detect_runways_mock
+from app.services.synthetic_scene import generate_scene, SYNTHETIC_MAX_DIMENSION, RUNWAY_COLOR
+
+def test_same_seed_gives_same_scene():
+    first = generate_scene(512, 384, seed=11)
+    second = generate_scene(512, 384, seed=11)
+    other = generate_scene(512, 384, seed=12)
+
+    assert np.array_equal(first.render(), second.render())
+    assert np.array_equal(first.labels["houses"].bboxes(), second.labels["houses"].bboxes())
+    assert not np.array_equal(first.render(), other.render())
+
+def test_windows_tile_the_scene_without_seams():
+    scene = generate_scene(700, 500, seed=4, densities={"water_bodies": 20.0})
+    image = scene.render()
+
+    blocks = [
+        np.hstack([scene.render(x, y, min(256, 700 - x), min(256, 500 - y)) for x in range(0, 700, 256)])
+        for y in range(0, 500, 256)
+    ]
+    assert image.shape == (500, 700, 3)
+    assert np.array_equal(np.vstack(blocks), image)
+
+def test_labels_match_the_pixels():
+    scene = generate_scene(1024, 1024, seed=5, densities={"houses": 300.0})
+    image = scene.render()
+    labels = scene.labels
+
+    assert len(labels["runways"]) == 1 and len(labels["aircraft"]) == 4
+    for key in ("runways", "aircraft", "houses"):
+        boxes = labels[key].bboxes()
+        assert (boxes[:, :2] >= -1).all() and (boxes[:, 2:] <= 1025).all()
+
+    # The runway's center is painted, and the runway detector finds it there
+    runway = labels["runways"].records[0]
+    cx, cy = np.round(runway["center"]).astype(int)
+    assert tuple(image[cy, cx]) == RUNWAY_COLOR
+    found = detect_runways_mock(ImageContext(bgr=image))
+    assert len(found) == 1
+    assert np.hypot(*(found.records[0]["center"] - runway["center"])) < 5
+    assert abs(found.records[0]["length"] - runway["length"]) / runway["length"] < 0.05
+
+def test_geotiff_is_written_block_by_block(tmp_path):
+    scene = generate_scene(600, 400, seed=9, runways=0)
+    path = scene.save(str(tmp_path / "scene.tif"), block_size=256)
+
+    with rasterio.open(path) as dataset:
+        rgb = dataset.read().transpose(1, 2, 0)
+    assert np.array_equal(rgb[..., ::-1], scene.render())
+
+def test_rejects_oversized_scenes():
+    with pytest.raises(ValueError):
+        generate_scene(SYNTHETIC_MAX_DIMENSION + 1, 10)
@@ -0,0 +1,66 @@
+"""
+Tests for the tiled detection helpers
+"""
+import cv2
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from app.services.detections import DetectionSet
+from app.services.tiling import iter_windows, non_max_suppression, merge_tile_detections, read_window, scene_gain
+
+def test_windows_cover_scene_with_overlap():
+    """Every pixel is covered and neighbouring tiles share the overlap"""
+    width, height = 5000, 3000
+    coverage = np.zeros((height, width), dtype=np.uint8)
+
+    windows = list(iter_windows(width, height, tile_size=2048, overlap=256))
+    for window in windows:
+        row, col = int(window.row_off), int(window.col_off)
+        coverage[row:row + int(window.height), col:col + int(window.width)] += 1
+
+    assert coverage.min() >= 1
+    assert all(w.width <= 2048 and w.height <= 2048 for w in windows)
+    assert int(windows[1].col_off) == 2048 - 256
+
+def test_small_scene_is_a_single_tile():
+    windows = list(iter_windows(300, 200, tile_size=2048, overlap=256))
+    assert len(windows) == 1
+    assert (windows[0].width, windows[0].height) == (300, 200)
+
+def test_non_max_suppression_keeps_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]])
+    scores = np.array([0.6, 0.9, 0.7])
+    keep = non_max_suppression(boxes, scores, iou_threshold=0.5)
+    assert list(keep) == [1, 2]
+
+def test_merge_tile_detections_deduplicates_seam_objects():
+    left = DetectionSet.from_dicts("aircraft", [
+        {"id": 1, "confidence": 0.8, "bbox": [90, 10, 110, 30], "center": [100, 20]}
+    ])
+    # The same object reported by the neighbouring tile, in that tile's coordinates
+    right = DetectionSet.from_dicts("aircraft", [
+        {"id": 1, "confidence": 0.7, "bbox": [10, 10, 30, 30], "center": [20, 20]}
+    ]).translate(80, 0)
+
+    merged = merge_tile_detections(DetectionSet.concatenate("aircraft", [left, right]), iou_threshold=0.5)
+
+    assert len(merged) == 1
+    assert merged.to_dicts()[0]["confidence"] == 0.8
+    assert merged.to_dicts()[0]["id"] == 1
+
+def test_tiles_of_a_16_bit_scene_share_one_gain(tmp_path):
+    """A dim and a bright tile are scaled like the whole image, not by their own maxima"""
+    path = str(tmp_path / "scene.tif")
+    data = np.full((3, 64, 128), 1000, dtype=np.uint16)
+    data[:, :, 64:] = 40000
+    with rasterio.open(path, "w", driver="GTiff", width=128, height=64, count=3, dtype="uint16") as dataset:
+        dataset.write(data)
+
+    with rasterio.open(path) as dataset:
+        gain = scene_gain(dataset)
+        tiles = [read_window(dataset, Window(col, 0, 64, 64), gain) for col in (0, 64)]
+
+    whole = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+    for tile, col in zip(tiles, (0, 64)):
+        assert np.abs(tile.astype(int) - whole[:, col:col + 64]).max() <= 1
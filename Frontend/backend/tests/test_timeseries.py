@@ -0,0 +1,95 @@
+"""
+Tests for time series resampling periods and per-period aggregates
+"""
+from datetime import date, datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.models.analysis import Analysis, AnalysisImage, AnalysisStats
+from app.services.timeseries import (
+    period_bounds,
+    refresh_bucket,
+    update_image_stats,
+    rebuild_analysis_stats,
+    unaggregated_analyses,
+    get_timeseries
+)
+
+def test_period_bounds():
+    assert period_bounds(date(2024, 2, 29), "day") == (date(2024, 2, 29), date(2024, 3, 1))
+    # Weeks start on Monday
+    assert period_bounds(date(2024, 1, 7), "week") == (date(2024, 1, 1), date(2024, 1, 8))
+    assert period_bounds(date(2024, 12, 31), "month") == (date(2024, 12, 1), date(2025, 1, 1))
+    with pytest.raises(ValueError):
+        period_bounds(date(2024, 1, 1), "year")
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    for model in (User, Analysis, AnalysisImage, AnalysisStats):
+        model.__table__.create(engine)
+    with Session(engine) as session:
+        session.add(User(username="a", email="a@example.com", password="pw"))
+        session.flush()
+        session.add_all([Analysis(1, "first", 4.6, -74.1), Analysis(1, "second", 6.2, -75.6)])
+        session.flush()
+        yield session
+
+def add_image(session, analysis_id, day, aircraft, status="completed", runway_length=None):
+    image = AnalysisImage(analysis_id, image_date=datetime.combine(day, datetime.min.time()))
+    image.status = status
+    image.aircraft_count = aircraft
+    image.runway_detected = runway_length is not None
+    image.runway_length = runway_length
+    session.add(image)
+    session.flush()
+    return image
+
+def test_refresh_bucket_aggregates_completed_images_of_the_period(session):
+    add_image(session, 1, date(2024, 3, 4), 2, runway_length=1200.0)
+    add_image(session, 1, date(2024, 3, 6), 6)
+    add_image(session, 1, date(2024, 3, 6), 50, status="failed")
+    add_image(session, 1, date(2024, 3, 11), 1)
+
+    stats = refresh_bucket(session, 1, "week", date(2024, 3, 6))
+
+    assert stats.period_start == date(2024, 3, 4)
+    assert (stats.image_count, stats.aircraft_sum, stats.aircraft_max) == (2, 8, 6)
+    assert (stats.runway_images, stats.runway_length_max) == (1, 1200.0)
+    assert refresh_bucket(session, 1, "week", date(2024, 2, 1)) is None
+
+def test_update_image_stats_follows_an_image_to_its_new_date(session):
+    image = add_image(session, 1, date(2024, 3, 4), 3)
+    update_image_stats(session, image)
+    assert [point["period_start"] for point in get_timeseries(session, [1])[1]] == ["2024-03-04"]
+
+    previous_date = image.image_date
+    image.image_date = datetime(2024, 4, 2)
+    update_image_stats(session, image, previous_date)
+
+    assert [point["period_start"] for point in get_timeseries(session, [1])[1]] == ["2024-04-02"]
+    assert [point["period_start"] for point in get_timeseries(session, [1], "month")[1]] == ["2024-04-01"]
+    assert session.query(AnalysisStats).count() == 3
+
+def test_get_timeseries_reads_several_analyses_within_dates(session):
+    for analysis_id, day, aircraft in ((1, date(2024, 1, 5), 2), (1, date(2024, 2, 5), 4), (2, date(2024, 2, 9), 7)):
+        update_image_stats(session, add_image(session, analysis_id, day, aircraft))
+
+    series = get_timeseries(session, [2, 1], "month", start=date(2024, 2, 10))
+
+    assert list(series) == [2, 1]
+    assert [(point["period_start"], point["aircraft_mean"]) for point in series[1]] == [("2024-02-01", 4.0)]
+    assert [point["aircraft_max"] for point in series[2]] == [7]
+    assert get_timeseries(session, [1], "day", start=date(2025, 1, 1)) == {1: []}
+
+def test_only_never_aggregated_analyses_are_rebuilt(session):
+    add_image(session, 1, date(2024, 1, 5), 2)
+    add_image(session, 2, date(2024, 1, 5), 2, status="failed")
+    assert unaggregated_analyses(session, [1, 2]) == [1]
+
+    assert rebuild_analysis_stats(session, 1) == 3
+    # An empty date window of an aggregated analysis does not count as missing
+    assert get_timeseries(session, [1], start=date(2025, 1, 1)) == {1: []}
+    assert unaggregated_analyses(session, [1, 2]) == []
@@ -0,0 +1,55 @@
+"""
+Tests for the vector tile encoder
+"""
+import os
+import numpy as np
+
+from app.services.detections import Detections
+from app.services.georeference import GeoReference
+from app.services.spatial_index import PackedRTree
+from app.services.vector_tiles import (
+    clip_polygon,
+    clip_polyline,
+    path_commands,
+    encode_tile,
+    make_tile_key,
+    lonlat_to_tile
+)
+
+def test_geometry_commands_match_the_specification_examples():
+    origin = np.zeros(2, dtype=np.int64)
+
+    assert path_commands(origin, np.array([[25, 17]]), close=False) == [9, 50, 34]
+    assert path_commands(origin, np.array([[2, 2], [2, 10], [10, 10]]), close=False) == [9, 4, 4, 18, 0, 16, 16, 0]
+    assert path_commands(origin, np.array([[3, 6], [8, 12], [20, 34]]), close=True) == [9, 6, 12, 18, 10, 12, 24, 44, 15]
+
+def test_clipping_keeps_the_parts_inside():
+    ring = clip_polygon(np.array([[-50.0, -50.0], [50.0, -50.0], [50.0, 50.0], [-50.0, 50.0]]), 0, 100)
+    assert sorted(map(tuple, ring.tolist())) == [(0, 0), (0, 50), (50, 0), (50, 50)]
+
+    # A line leaving and re-entering the square is split in two
+    parts = clip_polyline(np.array([[10.0, 10.0], [200.0, 10.0], [200.0, 90.0], [10.0, 90.0]]), 0, 100)
+    assert [part.tolist() for part in parts] == [[[10, 10], [100, 10]], [[100, 90], [10, 90]]]
+
+def test_tile_contains_the_features_under_it(tmp_path):
+    georef = GeoReference.from_center(48.0, 11.0, width=2000, height=2000)
+    details = Detections.from_details({
+        "houses": [{"id": 1, "confidence": 0.9, "center": [1000, 1000], "bbox": [990, 990, 1010, 1010], "area": 400}],
+        "roads": [{"id": 1, "confidence": 0.8, "width": 5, "polyline": [[0, 1000], [2000, 1000]]}]
+    })
+    index = PackedRTree.build(details)
+
+    # The z17 tile under the house, and one far away
+    z = 17
+    column, row = (lonlat_to_tile(georef.to_lonlat(np.array([[1000, 1000]])), z, 0, 0) // 4096)[0].astype(int)
+    tile = encode_tile(details, index, georef, z, column, row)
+
+    assert b"house" in tile and b"road" in tile
+    assert encode_tile(details, index, georef, z, column + 50, row) == b""
+
+    # Re-processing rewrites the sidecar, which changes every tile key
+    path = tmp_path / "scene.png.detections.npz"
+    details.save(str(path))
+    key = make_tile_key(str(path), z, column, row)
+    os.utime(path, ns=(0, 0))
+    assert make_tile_key(str(path), z, column, row) != key